@@ -5,80 +5,163 @@ from django.core.files.storage import FileSystemStorage
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.core import serializers
-from django.db.models import Q
+from django.db.models import Count, Q, Sum
 import json
 from datetime import datetime, timedelta
 
-from student_management_app.models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, Attendance, AttendanceReport
+from student_management_app.models import CustomUser, Staffs, Courses, Subjects, Students, SessionYearModel, Attendance, AttendanceReport, AttendanceSummary, DailyAttendanceRollup
+from . import attendance_export, attendance_summary, dashboard_cache, export_formats, export_jobs
 from .forms import AddStudentForm, EditStudentForm
 
 
 def admin_home(request):
-    all_student_count = Students.objects.all().count()
-    subject_count = Subjects.objects.all().count()
-    course_count = Courses.objects.all().count()
-    staff_count = Staffs.objects.all().count()
-
-    course_all = Courses.objects.all()
-    course_name_list = []
-    subject_count_list = []
-    student_count_list_in_course = []
-
-    for course in course_all:
-        subjects = Subjects.objects.filter(course_id=course.id).count()
-        students = Students.objects.filter(course_id=course.id).count()
-        course_name_list.append(course.course_name)
-        subject_count_list.append(subjects)
-        student_count_list_in_course.append(students)
-
-    subject_all = Subjects.objects.all()
-    subject_list = []
-    student_count_list_in_subject = []
-    for subject in subject_all:
-        course = Courses.objects.get(id=subject.course_id.id)
-        student_count = Students.objects.filter(course_id=course.id).count()
-        subject_list.append(subject.subject_name)
-        student_count_list_in_subject.append(student_count)
-
-
-    staff_attendance_present_list=[]
-    staff_name_list=[]
-
-    staffs = Staffs.objects.all()
-    for staff in staffs:
-        subject_ids = Subjects.objects.filter(staff_id=staff.admin.id)
-        attendance = Attendance.objects.filter(subject_id__in=subject_ids).count()
-        staff_attendance_present_list.append(attendance)
-        staff_name_list.append(staff.admin.first_name)
-
-    student_attendance_present_list=[]
-    student_name_list=[]
-
-    students = Students.objects.all()
-    for student in students:
-        attendance = AttendanceReport.objects.filter(student_id=student.id, status=True).count()
-        absent = AttendanceReport.objects.filter(student_id=student.id, status=False).count()
-        student_attendance_present_list.append(attendance)
-
-        student_name_list.append(student.admin.first_name)
+    """
+    HOD dashboard shell: the headline counts only. Each chart panel loads
+    its data from admin_home_chart once the page is up. Both are served
+    from snapshots that are rebuilt when attendance or enrolment changes
+    (see dashboard_cache).
+    """
+    context = dashboard_cache.snapshot('admin', 'all', admin_home_context)
+    return render(request, "hod_template/home_content.html", context)
 
 
-    context={
-        "all_student_count": all_student_count,
-        "subject_count": subject_count,
-        "course_count": course_count,
-        "staff_count": staff_count,
-        "course_name_list": course_name_list,
-        "subject_count_list": subject_count_list,
-        "student_count_list_in_course": student_count_list_in_course,
-        "subject_list": subject_list,
-        "student_count_list_in_subject": student_count_list_in_subject,
-        "staff_attendance_present_list": staff_attendance_present_list,
-        "staff_name_list": staff_name_list,
-        "student_attendance_present_list": student_attendance_present_list,
-        "student_name_list": student_name_list,
+def admin_home_context():
+    """
+    Returns:
+    - (context, dashboard_cache dependencies)
+    """
+    context = {
+        "all_student_count": Students.objects.count(),
+        "subject_count": Subjects.objects.count(),
+        "course_count": Courses.objects.count(),
+        "staff_count": Staffs.objects.count(),
     }
-    return render(request, "hod_template/home_content.html", context)
+    return context, [('enrolment',)]
+
+
+# The chart builders below use grouped aggregates, so each costs the same
+# couple of queries however many courses, staff and students there are.
+# order_by() drops the models' default ordering from the GROUP BY.
+
+def _students_per_course():
+    return dict(Students.objects.order_by().values_list('course_id').annotate(total=Count('id')))
+
+
+def course_chart():
+    """Subjects and students per course"""
+    subjects_per_course = dict(
+        Subjects.objects.order_by().values_list('course_id').annotate(total=Count('id'))
+    )
+    students_per_course = _students_per_course()
+    courses = list(Courses.objects.values_list('id', 'course_name'))
+    data = dashboard_cache.chart_data(
+        [course_name for _, course_name in courses],
+        [
+            ("Subjects", [subjects_per_course.get(course_id, 0) for course_id, _ in courses]),
+            ("Students", [students_per_course.get(course_id, 0) for course_id, _ in courses]),
+        ]
+    )
+    return data, [('enrolment',)]
+
+
+def subject_chart():
+    """Students enrolled in each subject's course"""
+    students_per_course = _students_per_course()
+    subjects = list(Subjects.objects.values_list('subject_name', 'course_id'))
+    data = dashboard_cache.chart_data(
+        [subject_name for subject_name, _ in subjects],
+        [("Students", [students_per_course.get(course_id, 0) for _, course_id in subjects])]
+    )
+    return data, [('enrolment',)]
+
+
+def staff_chart():
+    """Attendance sessions taken in each staff member's subjects"""
+    attendance_per_staff = dict(
+        Attendance.objects.order_by().values_list('subject_id__staff_id').annotate(total=Count('id'))
+    )
+    staff = list(Staffs.objects.values_list('id', 'admin__first_name'))
+    data = dashboard_cache.chart_data(
+        [first_name for _, first_name in staff],
+        [("Attendance sessions", [attendance_per_staff.get(staff_id, 0) for staff_id, _ in staff])]
+    )
+    return data, [('attendance',), ('enrolment',)]
+
+
+def student_chart():
+    """Present count per student, from the materialized summary rather than the reports"""
+    present_per_student = dict(
+        AttendanceSummary.objects.order_by().values_list('student_id').annotate(total=Sum('present'))
+    )
+    students = list(Students.objects.values_list('id', 'admin__first_name'))
+    data = dashboard_cache.chart_data(
+        [first_name for _, first_name in students],
+        [("Present", [present_per_student.get(student_id, 0) for student_id, _ in students])]
+    )
+    return data, [('attendance',), ('enrolment',)]
+
+
+ADMIN_HOME_CHARTS = {
+    'courses': course_chart,
+    'subjects': subject_chart,
+    'staff': staff_chart,
+    'students': student_chart,
+}
+
+
+def admin_home_chart(request, chart):
+    """Data for one HOD dashboard chart panel"""
+    builder = ADMIN_HOME_CHARTS.get(chart)
+    if builder is None:
+        return JsonResponse({"status": "error", "message": f"Unknown chart: {chart}"}, status=404)
+    data = dashboard_cache.snapshot(f'admin_chart_{chart}', 'all', builder)
+    return dashboard_cache.chart_response(request, data)
+
+
+def admin_attendance_trend(request):
+    """Weekly or monthly attendance series across all subjects, from the daily rollup"""
+    try:
+        data = attendance_summary.trend(DailyAttendanceRollup.objects.all(), request.GET)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    return JsonResponse({"status": "success", **data})
+
+
+def admin_export_attendance_data(request):
+    """
+    Every attendance report, one flat row each, for analytics tools.
+
+    Query parameters: format (csv, jsonl, parquet or xlsx; default csv), and
+    optionally start_date, end_date ("YYYY-MM-DD"), course, subject and session_year.
+    """
+    fmt = request.GET.get('format') or 'csv'
+    try:
+        export_formats.check_format(fmt)
+        export = export_jobs.resolve('admin', export_jobs.params_for('admin', request.GET, request.user))
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+    return export_formats.response(
+        fmt, list(export.columns), export.rows(export.reports), export.filename, attendance_export.COLUMN_TYPES
+    )
+
+
+def admin_export_job(request):
+    """
+    Queue admin_export_attendance_data as a background job (see export_jobs);
+    same parameters, as POST data. Poll the returned job's status.
+    """
+    if request.method != 'POST':
+        return HttpResponse("Method Not Allowed", status=405)
+    fmt = request.POST.get('format') or 'csv'
+    try:
+        export_formats.check_format(fmt)
+        job = export_jobs.enqueue(
+            request.user, 'admin', fmt, export_jobs.params_for('admin', request.POST, request.user)
+        )
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    return JsonResponse({"status": "success", "job": export_jobs.describe(job)})
 
 
 def add_staff(request):
@@ -1,22 +1,23 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.core.files.storage import FileSystemStorage
 from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.core import serializers
-from django.utils.timezone import now
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+from django.utils.timezone import is_naive, localtime, make_aware, now
+import asyncio
 import json
 import random
 import string
 import datetime
 import uuid
-import qrcode
 import os
 import tempfile
-from io import BytesIO
-from django.core.files.base import ContentFile
 from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
 import openpyxl
 import openpyxl.styles
 
@@ -29,10 +30,20 @@ except (ImportError, AttributeError):
 
 from student_management_app.models import (
     CustomUser, Staffs, Courses, Subjects, Students,
-    SessionYearModel, Attendance, AttendanceReport, StudentResult, AttendanceQRCode
+    SessionYearModel, Attendance, AttendanceReport, StudentResult, AttendanceQRCode, AttendanceSummary,
+    DailyAttendanceRollup
 )
 from .utils import get_client_ip, verify_network_connectivity
-from .utils import export_attendance_to_excel
+from .utils import export_attendance_matrix, export_attendance_to_excel
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from . import (
+    attendance_export, attendance_summary, dashboard_cache, enrolment, export_formats, export_jobs, idempotency,
+    qr_decode, qr_registry, qr_render, qr_sheet, signed_tokens, xlsx_stream
+)
+from .checkin import aresolve_qr_code, resolve_qr_code
+from .checkin_events import get_bus
 
 def staff_generate_qr(request):
     print(f"QR Generation request: {request.method}")  # Debug
@@ -44,6 +55,7 @@ def staff_generate_qr(request):
         teacher_latitude = request.POST.get('latitude')
         teacher_longitude = request.POST.get('longitude')
         allowed_radius = request.POST.get('radius', 100)
+        rotating = request.POST.get('rotating') == 'on'
 
         # Validate and sanitize radius value
         try:
@@ -86,15 +98,9 @@ def staff_generate_qr(request):
 
             # Create a URL that includes the token for direct scanning
             # This URL will redirect to the login page if user is not logged in
-            qr_data = f"{request.build_absolute_uri('/scan-attendance/')}?token={unique_token}"
+            qr_data = qr_render.scan_url(request, unique_token)
             print(f"QR data URL: {qr_data}")  # Debug
 
-            print("Creating QR code...")  # Debug
-            qr = qrcode.make(qr_data)
-            qr_io = BytesIO()
-            qr.save(qr_io, format="PNG")
-            print("QR code created successfully")  # Debug
-
             # Create QR code instance with basic fields first
             print("Creating QR code instance...")  # Debug
             qr_code_instance = AttendanceQRCode(
@@ -105,7 +111,8 @@ def staff_generate_qr(request):
                 token=unique_token,
                 teacher_latitude=float(teacher_latitude) if teacher_latitude else None,
                 teacher_longitude=float(teacher_longitude) if teacher_longitude else None,
-                allowed_radius=float(allowed_radius)
+                allowed_radius=float(allowed_radius),
+                rotating=rotating
             )
 
             # Store network information in cache using the token as key
@@ -121,26 +128,20 @@ def staff_generate_qr(request):
                 print(f"Stored network info in cache: {network_info}")  # Debug
             print("QR code instance created")  # Debug
 
-            # Network verification removed
-            print("Saving QR code image...")  # Debug
-            qr_code_instance.qr_code_image.save(f"qr_{subject.id}_{session_year.id}.png", ContentFile(qr_io.getvalue()), save=True)
-            print("QR code image saved successfully")  # Debug
-
-            # Get the full URL to the QR code image
-            qr_code_url = qr_code_instance.qr_code_image.url
-            print(f"QR code URL: {qr_code_url}")  # Debug
+            # The image is drawn on request by qr_image, so nothing is written to disk
+            qr_code_instance.save()
 
-            # Also include the base64 encoded image data for direct sharing
-            import base64
-            qr_io.seek(0)  # Reset the pointer to the beginning of the BytesIO object
-            qr_base64 = base64.b64encode(qr_io.getvalue()).decode('utf-8')
-            qr_data_url = f"data:image/png;base64,{qr_base64}"
-            print("Base64 encoding completed")  # Debug
+            # Register the live token so scans can skip the database lookup
+            qr_registry.register(qr_code_instance)
+            # The eligible students are fixed for the code's lifetime
+            expected_students = len(enrolment.snapshot(qr_code_instance))
 
+            # A rotating code is projected as its current signed token
+            projected_token = signed_tokens.sign(qr_code_instance) if rotating else unique_token
             response_data = {
                 "status": "success",
-                "qr_code_url": qr_code_instance.qr_code_image.url,
-                "qr_data_url": qr_data_url,  # Include the base64 data URL
+                "qr_code_url": reverse("qr_image", args=[projected_token, "png"]),
+                "qr_svg_url": reverse("qr_image", args=[projected_token, "svg"]),
                 "expiry_time": qr_code_instance.expiry_time.strftime("%Y-%m-%d %H:%M:%S"),
                 "token": unique_token,  # Include token for sharing
                 "qr_data": qr_data,  # Include QR data URL for direct access
@@ -149,7 +150,11 @@ def staff_generate_qr(request):
                 "expiry_minutes": int(expiry_minutes),  # Include expiry in minutes
                 "location_enabled": bool(teacher_latitude and teacher_longitude),  # Include location status
                 "allowed_radius": float(allowed_radius),  # Include allowed radius
+                "expected_students": expected_students,  # Students enrolled when the code was generated
             }
+            if rotating:
+                response_data["rotate_seconds"] = settings.QR_ROTATION_SECONDS
+                response_data["rotating_token_url"] = f"{reverse('staff_rotating_token')}?token={unique_token}"
             print(f"Returning success response: {response_data}")  # Debug
             return JsonResponse(response_data)
 
@@ -168,67 +173,335 @@ def staff_generate_qr(request):
     return JsonResponse({"status": "error", "message": "Invalid request method."}, status=400)
 
 
+def staff_rotating_token(request):
+    """Return the current signed token and image URLs for one of this staff member's rotating QR codes"""
+    qr_code = resolve_qr_code(request.GET.get('token'))
+    if not qr_code or not qr_code.rotating or qr_code.subject.staff_id_id != request.user.staffs.id:
+        return JsonResponse({"status": "error", "message": "QR code has expired or is invalid"}, status=404)
+
+    token = signed_tokens.sign(qr_code)
+    return JsonResponse({
+        "status": "success",
+        "token": token,
+        "qr_code_url": reverse("qr_image", args=[token, "png"]),
+        "qr_svg_url": reverse("qr_image", args=[token, "svg"]),
+        "refresh_in": round(signed_tokens.seconds_until_rotation(), 3),
+    })
+
+
+def parse_schedule_time(value, day):
+    """
+    Parse a timetable time: either a full ISO datetime or a bare "HH:MM" on the given day.
+
+    Returns:
+    - Aware datetime, or None if the value cannot be parsed
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            clock = parse_time(value)
+            if clock is None:
+                return None
+            moment = datetime.datetime.combine(day, clock)
+    except ValueError:
+        return None
+    return make_aware(moment) if is_naive(moment) else moment
+
+
+def staff_generate_qr_batch(request):
+    """
+    Create scheduled QR codes for a whole timetable in one request.
+
+    Expects a JSON body:
+    - entries: List of {"subject", "session_year", "start_time", "expiry_time"};
+      times are ISO datetimes or "HH:MM" on the given date
+    - date: Optional "YYYY-MM-DD" for bare times (default today)
+    - latitude, longitude, radius: Optional classroom location shared by every code
+    - format: "pdf" (default) for a printable sheet, one code per page, or "json"
+
+    Each code only scans between its start_time and expiry_time.
+    """
+    if request.method != "POST":
+        return JsonResponse({"status": "error", "message": "Invalid request method."}, status=400)
+    try:
+        payload = json.loads(request.body)
+        entries = payload['entries']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"status": "error", "message": "Expected a JSON body with an entries list."}, status=400)
+    if not isinstance(entries, list) or not entries:
+        return JsonResponse({"status": "error", "message": "Expected a JSON body with an entries list."}, status=400)
+    for number, entry in enumerate(entries, start=1):
+        if not isinstance(entry, dict):
+            return JsonResponse({"status": "error", "message": f"Entry {number} is not an object."}, status=400)
+        # IDs may arrive as numbers or strings, e.g. straight from form values
+        for field in ('subject', 'session_year'):
+            try:
+                entry[field] = int(entry.get(field))
+            except (ValueError, TypeError):
+                entry[field] = None
+
+    day = parse_date(payload.get('date') or '') or datetime.date.today()
+    try:
+        latitude = float(payload['latitude']) if payload.get('latitude') is not None else None
+        longitude = float(payload['longitude']) if payload.get('longitude') is not None else None
+        allowed_radius = min(max(float(payload.get('radius', 100)), 10), 50000)
+    except (ValueError, TypeError):
+        return JsonResponse({"status": "error", "message": "Invalid location or radius."}, status=400)
+
+    # One query each for the subjects and sessions, however long the timetable
+    subjects = Subjects.objects.filter(staff_id=request.user.staffs).in_bulk({entry['subject'] for entry in entries})
+    session_years = SessionYearModel.objects.in_bulk({entry['session_year'] for entry in entries})
+
+    current = now()
+    qr_codes = []
+    for number, entry in enumerate(entries, start=1):
+        subject = subjects.get(entry['subject'])
+        session_year = session_years.get(entry['session_year'])
+        start_time = parse_schedule_time(entry.get('start_time'), day)
+        expiry_time = parse_schedule_time(entry.get('expiry_time'), day)
+        if subject is None:
+            message = f"Entry {number}: invalid subject ID."
+        elif session_year is None:
+            message = f"Entry {number}: invalid session year ID."
+        elif start_time is None or expiry_time is None:
+            message = f"Entry {number}: start_time and expiry_time must be HH:MM or ISO datetimes."
+        elif not start_time < expiry_time or expiry_time <= current:
+            message = f"Entry {number}: the window must end after it starts and in the future."
+        else:
+            message = None
+        if message:
+            return JsonResponse({"status": "error", "message": message}, status=400)
+
+        qr_codes.append(AttendanceQRCode(
+            subject=subject,
+            session_year=session_year,
+            start_time=start_time,
+            expiry_time=expiry_time,
+            is_active=True,
+            token=str(uuid.uuid4()),
+            teacher_latitude=latitude,
+            teacher_longitude=longitude,
+            allowed_radius=allowed_radius
+        ))
+
+    # Registry entries and enrolment snapshots are filled on the first scan,
+    # so the roster is the one in force when the class starts
+    AttendanceQRCode.objects.bulk_create(qr_codes)
+    print(f"Created {len(qr_codes)} scheduled QR codes for staff {request.user.staffs.id}")  # Debug
+
+    if payload.get('format') == 'json':
+        return JsonResponse({
+            "status": "success",
+            "codes": [{
+                "token": qr_code.token,
+                "subject_name": qr_code.subject.subject_name,
+                "start_time": localtime(qr_code.start_time).strftime("%Y-%m-%d %H:%M:%S"),
+                "expiry_time": localtime(qr_code.expiry_time).strftime("%Y-%m-%d %H:%M:%S"),
+                "qr_code_url": reverse("qr_image", args=[qr_code.token, "png"]),
+                "qr_svg_url": reverse("qr_image", args=[qr_code.token, "svg"]),
+            } for qr_code in qr_codes],
+        })
+
+    pages = []
+    for qr_code in qr_codes:
+        start, end = localtime(qr_code.start_time), localtime(qr_code.expiry_time)
+        pages.append((
+            qr_render.scan_url(request, qr_code.token),
+            qr_code.subject.subject_name,
+            (
+                f"{start:%a %d %b %Y}, {start:%H:%M} - {end:%H:%M}",
+                f"Session {qr_code.session_year.session_start_year} - {qr_code.session_year.session_end_year}",
+                f"Code: {qr_code.token}",
+            ),
+        ))
+    pdf = qr_sheet.build_pdf(pages, workers=settings.QR_SHEET_WORKERS)
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response['Content-Disposition'] = f'attachment; filename="qr_timetable_{day.isoformat()}.pdf"'
+    return response
+
+
+def staff_qr_progress(request):
+    """Return expected vs. checked-in students for one of this staff member's live QR codes"""
+    qr_code = resolve_qr_code(request.GET.get('token'))
+    if not qr_code or qr_code.subject.staff_id_id != request.user.staffs.id:
+        return JsonResponse({"status": "error", "message": "QR code has expired or is invalid"}, status=404)
+
+    checked_in = AttendanceReport.objects.filter(
+        attendance_id__subject_id_id=qr_code.subject_id,
+        attendance_id__session_year_id_id=qr_code.session_year_id,
+        attendance_id__attendance_date=datetime.date.today()
+    ).count()
+    return JsonResponse({
+        "status": "success",
+        "expected": len(enrolment.get_snapshot(qr_code)),
+        "checked_in": checked_in,
+    })
+
+
+def sse_message(data, event_id=None, event=None):
+    """Format one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def staff_checkin_feed(request):
+    """
+    Server-sent events of accepted check-ins for one of this staff member's live QR codes.
+
+    GET parameters:
+    - token: The live QR token
+    - after: Last event id already seen (the Last-Event-ID header takes precedence)
+
+    Events come from the check-in bus, shared between server processes
+    through the cache, so each connection costs a fixed handful of queries
+    however many students check in or how many screens are watching.
+    """
+    qr_code = await aresolve_qr_code(request.GET.get('token'))
+    staff_id = await Staffs.objects.filter(admin_id=request.user.id).values_list('id', flat=True).afirst()
+    if not qr_code or qr_code.subject.staff_id_id != staff_id:
+        return JsonResponse({"status": "error", "message": "QR code has expired or is invalid"}, status=404)
+
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.GET.get('after') or 0)
+    except ValueError:
+        after = 0
+
+    bus = get_bus()
+    await sync_to_async(bus.seed)(qr_code)
+    expected = len(await sync_to_async(enrolment.get_snapshot)(qr_code))
+    head = f"retry: {settings.CHECKIN_FEED_RETRY_MS}\n\n" + sse_message(
+        {"expected": expected, "checked_in": await sync_to_async(bus.count)(qr_code.token)}, event="summary"
+    )
+
+    if isinstance(request, ASGIRequest):
+        async def stream():
+            yield head
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + settings.CHECKIN_FEED_STREAM_SECONDS
+            last = after
+            while loop.time() < deadline:
+                events = await bus.wait(qr_code, last, timeout=min(15.0, deadline - loop.time()))
+                for event in events:
+                    yield sse_message(event, event_id=event["id"])
+                    last = event["id"]
+                if not events:
+                    yield ": keepalive\n\n"
+        body = stream()
+    else:
+        # A sync worker must not be held open, so return what is pending now
+        events = await sync_to_async(bus.events_after)(qr_code.token, after)
+        body = [head] + [sse_message(event, event_id=event["id"]) for event in events]
+
+    response = StreamingHttpResponse(body, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def staff_qr_registry_stats(request):
+    """Return the QR token registry, upload decode, replay, render, dashboard and export job counters for this worker"""
+    stats = qr_registry.stats()
+    stats['upload_decode'] = qr_decode.stats()
+    stats['idempotency'] = idempotency.stats()
+    stats['qr_render'] = qr_render.stats()
+    stats['dashboard'] = dashboard_cache.stats()
+    stats['export_jobs'] = export_jobs.stats()
+    return JsonResponse(stats)
+
 
 def staff_home(request):
-    # Get the Staff instance linked to the logged-in user
-    staff_instance = Staffs.objects.get(admin=request.user)
+    """
+    Staff dashboard shell; the chart panels load their data from
+    staff_home_chart. Both are served from snapshots (see dashboard_cache).
+    """
+    context = dashboard_cache.snapshot('staff', request.user.id, lambda: staff_home_context(request.user))
+    return render(request, "staff_template/staff_home_template.html", context)
 
-    # Fetch only subjects assigned to this staff
-    subjects = Subjects.objects.filter(staff_id=staff_instance)
-    course_id_list = []
-    for subject in subjects:
-        course = Courses.objects.get(id=subject.course_id.id)
-        course_id_list.append(course.id)
-
-    final_course = []
-    for course_id in course_id_list:
-        if course_id not in final_course:
-            final_course.append(course_id)
-
-    students_count = Students.objects.filter(course_id__in=final_course).count()
-    subject_count = subjects.count()
-
-    attendance_count = Attendance.objects.filter(subject_id__in=subjects).count()
-
-    subject_list = []
-    attendance_list = []
-    for subject in subjects:
-        attendance_count1 = Attendance.objects.filter(subject_id=subject.id).count()
-        subject_list.append(subject.subject_name)
-        attendance_list.append(attendance_count1)
-
-    # Get students and their attendance data
-    students_attendance = Students.objects.filter(course_id__in=final_course)
-    student_list = []
-    student_list_attendance_present = []
-    student_list_attendance_absent = []
-
-    # Enhance students_attendance with attendance data
-    for student in students_attendance:
-        attendance_present_count = AttendanceReport.objects.filter(status=True, student_id=student.id).count()
-        attendance_absent_count = AttendanceReport.objects.filter(status=False, student_id=student.id).count()
-        # Add attendance data as attributes to student objects
-        student.attendance_present = attendance_present_count
-        student.attendance_absent = attendance_absent_count
-
-        # Still maintain the lists for charts or other uses
-        student_list.append(student.admin.first_name+" "+ student.admin.last_name)
-        student_list_attendance_present.append(attendance_present_count)
-        student_list_attendance_absent.append(attendance_absent_count)
+
+def _staff_dependencies(course_ids):
+    # Any check-in or new session in one of these courses changes the figures
+    return [('enrolment',), *(('course', course_id) for course_id in course_ids)]
+
+
+def staff_home_context(user):
+    """
+    Build the staff dashboard shell for user.
+
+    Returns:
+    - (context, dashboard_cache dependencies)
+    """
+    # Only subjects assigned to this staff, as plain rows the snapshot can hold
+    subjects = list(
+        Subjects.objects.filter(staff_id__admin=user)
+        .values('id', 'subject_name', 'course_id', course_name=F('course_id__course_name'))
+    )
+    course_ids = list(dict.fromkeys(subject['course_id'] for subject in subjects))
 
     context={
-        "students_count": students_count,
-        "attendance_count": attendance_count,
-        "subject_count": subject_count,
-        "subject_list": subject_list,
-        "attendance_list": attendance_list,
-        "student_list": student_list,
-        "attendance_present_list": student_list_attendance_present,
-        "attendance_absent_list": student_list_attendance_absent,
-        "students_attendance": students_attendance,
+        "students_count": Students.objects.filter(course_id__in=course_ids).count(),
+        "attendance_count": Attendance.objects.filter(subject_id__in=[subject['id'] for subject in subjects]).count(),
+        "subject_count": len(subjects),
         "subjects": subjects
     }
-    return render(request, "staff_template/staff_home_template.html", context)
+    return context, _staff_dependencies(course_ids)
+
+
+def staff_subject_chart(user):
+    """Attendance sessions taken in each of the staff member's subjects"""
+    subjects = list(Subjects.objects.filter(staff_id__admin=user).values_list('id', 'subject_name', 'course_id'))
+    sessions = dict(
+        Attendance.objects.filter(subject_id__in=[subject_id for subject_id, _, _ in subjects]).order_by()
+        .values_list('subject_id').annotate(total=Count('id'))
+    )
+    data = dashboard_cache.chart_data(
+        [subject_name for _, subject_name, _ in subjects],
+        [("Attendance sessions", [sessions.get(subject_id, 0) for subject_id, _, _ in subjects])]
+    )
+    return data, _staff_dependencies(dict.fromkeys(course_id for _, _, course_id in subjects))
+
+
+def staff_student_chart(user):
+    """Present and absent totals per student in the staff member's courses"""
+    course_ids = list(dict.fromkeys(Subjects.objects.filter(staff_id__admin=user).values_list('course_id', flat=True)))
+    students = list(
+        Students.objects.filter(course_id__in=course_ids).values_list('id', 'admin__first_name', 'admin__last_name')
+    )
+    # Present/absent totals per student from the materialized summary, in one query
+    summary_counts = {
+        row['student_id']: row
+        for row in AttendanceSummary.objects.filter(student__course_id__in=course_ids).order_by()
+        .values('student_id').annotate(present=Sum('present'), absent=Sum('absent'))
+    }
+    data = dashboard_cache.chart_data(
+        [f"{first_name} {last_name}" for _, first_name, last_name in students],
+        [
+            ("Present", [summary_counts.get(student_id, {}).get('present', 0) for student_id, _, _ in students]),
+            ("Absent", [summary_counts.get(student_id, {}).get('absent', 0) for student_id, _, _ in students]),
+        ]
+    )
+    return data, _staff_dependencies(course_ids)
+
+
+STAFF_HOME_CHARTS = {
+    'subjects': staff_subject_chart,
+    'students': staff_student_chart,
+}
+
+
+def staff_home_chart(request, chart):
+    """Data for one staff dashboard chart panel"""
+    builder = STAFF_HOME_CHARTS.get(chart)
+    if builder is None:
+        return JsonResponse({"status": "error", "message": f"Unknown chart: {chart}"}, status=404)
+    data = dashboard_cache.snapshot(f'staff_chart_{chart}', request.user.id, lambda: builder(request.user))
+    return dashboard_cache.chart_response(request, data)
 
 
 
@@ -316,6 +589,41 @@ def get_students(request):
     return JsonResponse(list_data, safe=False)
 
 
+async def get_students_async(request):
+    """Async get_students for the ASGI deployment, using the async ORM"""
+    subject_id = request.POST.get("subject")
+    session_year = request.POST.get("session_year")
+
+    if not subject_id or not session_year:
+        return JsonResponse({"error": "Subject ID and Session Year are required"}, status=400)
+
+    try:
+        staff_instance = await Staffs.objects.aget(admin=request.user)
+        subject_model = await Subjects.objects.aget(id=subject_id, staff_id=staff_instance)
+        session_model = await SessionYearModel.objects.aget(id=session_year)
+    except Staffs.DoesNotExist:
+        return JsonResponse({"error": "Staff not found"}, safe=False)
+    except Subjects.DoesNotExist:
+        return JsonResponse({"error": "Subject not found or not assigned to you"}, safe=False)
+    except SessionYearModel.DoesNotExist:
+        return JsonResponse({"error": "Session year not found"}, safe=False)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, safe=False)
+
+    # Names come from the joined user row, so the roster is one query
+    students = Students.objects.filter(
+        course_id_id=subject_model.course_id_id, session_year_id=session_model
+    ).values("admin_id", "admin__first_name", "admin__last_name")
+    list_data = [
+        {"id": student["admin_id"], "name": student["admin__first_name"] + " " + student["admin__last_name"]}
+        async for student in students
+    ]
+
+    if not list_data:
+        return JsonResponse({"message": "No students found for this course and session"}, safe=False)
+    return JsonResponse(list_data, safe=False)
+
+
 
 
 @csrf_exempt
@@ -355,33 +663,45 @@ def save_attendance_data(request):
         if existing_attendance:
             return HttpResponse("Error: Attendance already exists for this date and subject")
 
-        attendance = Attendance(subject_id=subject_model, attendance_date=attendance_date, session_year_id=session_year_model)
-        attendance.save()
+        # The session, its reports and their summary deltas commit together, so a
+        # student that fails to save leaves neither a half-taken register nor counts
+        # for reports that were rolled back
+        with transaction.atomic():
+            attendance = Attendance(subject_id=subject_model, attendance_date=attendance_date, session_year_id=session_year_model)
+            attendance.save()
 
-        for stud in json_student:
-            student = Students.objects.get(admin=stud['id'])
+            summary_changes = []
+            for stud in json_student:
+                student = Students.objects.get(admin=stud['id'])
 
-            # Check if attendance report already exists for this student and attendance
-            existing_report = AttendanceReport.objects.filter(
-                student_id=student,
-                attendance_id=attendance
-            ).first()
-
-            if existing_report:
-                # Update existing record instead of creating duplicate
-                existing_report.status = stud['status']
-                existing_report.location_verified = stud['status'] == 1
-                existing_report.save()
-            else:
-                # Create new record
-                location_verified = stud['status'] == 1  # True if present, False if absent
-                attendance_report = AttendanceReport(
+                # Check if attendance report already exists for this student and attendance
+                existing_report = AttendanceReport.objects.filter(
                     student_id=student,
-                    attendance_id=attendance,
-                    status=stud['status'],
-                    location_verified=location_verified
-                )
-                attendance_report.save()
+                    attendance_id=attendance
+                ).first()
+
+                if existing_report:
+                    # Update existing record instead of creating duplicate
+                    previous = (existing_report.status, existing_report.location_verified)
+                    existing_report.status = stud['status']
+                    existing_report.location_verified = stud['status'] == 1
+                    existing_report.save()
+                else:
+                    # Create new record
+                    previous = None
+                    location_verified = stud['status'] == 1  # True if present, False if absent
+                    attendance_report = AttendanceReport(
+                        student_id=student,
+                        attendance_id=attendance,
+                        status=stud['status'],
+                        location_verified=location_verified
+                    )
+                    attendance_report.save()
+                summary_changes.append(attendance_summary.change(
+                    student.id, subject_model.id, session_year_model.id, attendance_date,
+                    previous, (stud['status'], stud['status'] == 1)
+                ))
+            attendance_summary.apply(summary_changes)
         return HttpResponse("OK")
     except Exception as e:
         return HttpResponse(f"Error: {str(e)}")
@@ -389,6 +709,16 @@ def save_attendance_data(request):
 
 
 
+def staff_attendance_trend(request):
+    """Weekly or monthly attendance series for this staff member's subjects, from the daily rollup"""
+    rollups = DailyAttendanceRollup.objects.filter(subject__staff_id__admin_id=request.user.id)
+    try:
+        data = attendance_summary.trend(rollups, request.GET)
+    except ValueError as e:
+        return JsonResponse({"status": "error", "message": str(e)}, status=400)
+    return JsonResponse({"status": "success", **data})
+
+
 def staff_update_attendance(request):
     """Redirect to the combined manage attendance view"""
     from django.shortcuts import redirect
@@ -513,23 +843,32 @@ def update_attendance_data(request):
     json_student = json.loads(student_ids)
 
     try:
+        # Reports and summary deltas commit together: a failing student rolls
+        # back the whole update instead of leaving counts for unsaved reports
+        with transaction.atomic():
+            summary_changes = []
+            for stud in json_student:
+                student = Students.objects.get(admin=stud['id'])
+
+                attendance_report = AttendanceReport.objects.get(student_id=student, attendance_id=attendance)
+                previous = (attendance_report.status, attendance_report.location_verified)
+                attendance_report.status = stud['status']
+
+                # Update location_verified field based on status
+                # If status is changing to present, set location_verified to True for manual attendance
+                if stud['status'] == 1 and not attendance_report.status:
+                    attendance_report.location_verified = True
+                # If status is changing to absent, set location_verified to False
+                elif stud['status'] == 0:
+                    attendance_report.location_verified = False
+                # Otherwise, keep the existing location_verified value
 
-        for stud in json_student:
-            student = Students.objects.get(admin=stud['id'])
-
-            attendance_report = AttendanceReport.objects.get(student_id=student, attendance_id=attendance)
-            attendance_report.status = stud['status']
-
-            # Update location_verified field based on status
-            # If status is changing to present, set location_verified to True for manual attendance
-            if stud['status'] == 1 and not attendance_report.status:
-                attendance_report.location_verified = True
-            # If status is changing to absent, set location_verified to False
-            elif stud['status'] == 0:
-                attendance_report.location_verified = False
-            # Otherwise, keep the existing location_verified value
-
-            attendance_report.save()
+                attendance_report.save()
+                summary_changes.append(attendance_summary.change(
+                    student.id, attendance.subject_id_id, attendance.session_year_id_id, attendance.attendance_date,
+                    previous, (attendance_report.status, attendance_report.location_verified)
+                ))
+            attendance_summary.apply(summary_changes)
         return HttpResponse("OK")
     except:
         return HttpResponse("Error")
@@ -554,10 +893,13 @@ def delete_attendance(request):
             return JsonResponse({"status": "error", "message": "You don't have permission to delete this attendance record."}, status=403)
 
         # Delete all attendance reports associated with this attendance
-        AttendanceReport.objects.filter(attendance_id=attendance).delete()
+        with transaction.atomic():
+            reports = AttendanceReport.objects.filter(attendance_id=attendance)
+            attendance_summary.remove_reports(reports)
+            reports.delete()
 
-        # Delete the attendance record
-        attendance.delete()
+            # Delete the attendance record
+            attendance.delete()
 
         return JsonResponse({"status": "success", "message": "Attendance record deleted successfully."})
 
@@ -685,7 +1027,8 @@ def staff_export_attendance(request):
 
     context = {
         "subjects": subjects,
-        "session_years": session_years
+        "session_years": session_years,
+        "parquet_available": export_formats.PARQUET_AVAILABLE
     }
     return render(request, "staff_template/staff_export_attendance.html", context)
 
@@ -879,12 +1222,20 @@ def staff_import_attendance_data(request):
                 else:
                     print(f"Using existing attendance record for {subject.subject_name} on {current_date}")
 
-                # Create or update attendance report
-                attendance_report, created = AttendanceReport.objects.update_or_create(
-                    student_id=student,
-                    attendance_id=attendance,
-                    defaults={'status': status}
-                )
+                # Create or update attendance report, keeping the summary in step
+                with transaction.atomic():
+                    previous = AttendanceReport.objects.filter(
+                        student_id=student, attendance_id=attendance
+                    ).values_list('status', 'location_verified').first()
+                    attendance_report, created = AttendanceReport.objects.update_or_create(
+                        student_id=student,
+                        attendance_id=attendance,
+                        defaults={'status': status}
+                    )
+                    attendance_summary.record(
+                        student.id, subject.id, session_year.id, current_date,
+                        None if created else previous, (status, attendance_report.location_verified)
+                    )
 
                 # Log the operation for debugging
                 action = "Created" if created else "Updated"
@@ -1003,10 +1354,17 @@ def staff_export_attendance_data(request):
     session_year_id = request.POST.get('session_year')
     start_date = request.POST.get('start_date')
     end_date = request.POST.get('end_date')
+    fmt = request.POST.get('format') or 'xlsx'
+    layout = request.POST.get('layout') or 'rows'
 
     if not subject_id or not session_year_id or not start_date or not end_date:
         return JsonResponse({'status': 'error', 'message': 'Missing required fields'})
 
+    try:
+        export_formats.check_format(fmt, layout)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
     try:
         subject = Subjects.objects.get(id=subject_id)
         session_year = SessionYearModel.objects.get(id=session_year_id)
@@ -1022,7 +1380,7 @@ def staff_export_attendance_data(request):
             attendance_date__range=(start_date, end_date)
         )
 
-        if not attendances:
+        if not attendances.exists():
             # Check if there are any attendance records for this subject at all
             any_attendance = Attendance.objects.filter(subject_id=subject).exists()
 
@@ -1040,43 +1398,37 @@ def staff_export_attendance_data(request):
         # Get all attendance reports for these attendances
         attendance_reports = AttendanceReport.objects.filter(attendance_id__in=attendances)
 
-        if not attendance_reports:
+        if not attendance_reports.exists():
             return JsonResponse({'status': 'error', 'message': 'No attendance data found for the selected criteria'})
 
+        # Prepare filename
+        filename = f"attendance_{subject.subject_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+
+        if layout == 'matrix':
+            # One row per student, one column per date
+            content_type, extension = export_formats.FORMATS[fmt]
+            response = StreamingHttpResponse(export_attendance_matrix(attendance_reports, fmt), content_type=content_type)
+            response['Content-Disposition'] = f'attachment; filename="{filename}_grid.{extension}"'
+            return response
+
+        if fmt != 'xlsx':
+            # Flat rows, one per report, streamed as they are read
+            return export_formats.response(
+                fmt, list(attendance_export.STAFF_COLUMNS), attendance_export.staff_rows(attendance_reports),
+                filename, attendance_export.COLUMN_TYPES
+            )
+
         # Generate Excel file
         date_range = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
-        excel_file = export_attendance_to_excel(
+        chunks = export_attendance_to_excel(
             attendance_reports,
             subject_name=subject.subject_name,
             date_range=date_range
         )
 
-        # Prepare filename
-        filename = f"attendance_{subject.subject_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx"
-
-        # Read the file content instead of keeping it open
-        with open(excel_file, 'rb') as f:
-            file_content = f.read()
-
-        # Create the response with the content
-        response = HttpResponse(
-            file_content,
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-
-        # Set headers to force download
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response['Content-Length'] = len(file_content)
-
-        # Close and delete the file explicitly before returning the response
-        try:
-            os.unlink(excel_file)
-        except Exception as file_error:
-            # If we can't delete now, schedule it for later
-            import atexit
-            atexit.register(lambda file_path=excel_file: os.unlink(file_path) if os.path.exists(file_path) else None)
-            print(f"Warning: Could not delete temp file immediately: {str(file_error)}")
-
+        # The workbook is written into the response as it is built; no temporary file
+        response = StreamingHttpResponse(chunks, content_type=xlsx_stream.CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
         return response
 
     except Exception as e:
@@ -1085,4 +1437,21 @@ def staff_export_attendance_data(request):
         return JsonResponse({'status': 'error', 'message': str(e)})
 
 
+def staff_export_job(request):
+    """
+    Queue staff_export_attendance_data as a background job (see export_jobs),
+    for ranges too long to build within a request. Poll the returned job's status.
+    """
+    if request.method != 'POST':
+        return HttpResponse("Method Not Allowed", status=405)
+    fmt = request.POST.get('format') or 'xlsx'
+    try:
+        params = export_jobs.params_for('staff', request.POST, request.user)
+        export_formats.check_format(fmt, params['layout'])
+        job = export_jobs.enqueue(request.user, 'staff', fmt, params)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'job': export_jobs.describe(job)})
+
+
 # Network verification function removed
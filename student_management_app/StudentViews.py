@@ -1,80 +1,101 @@
 from django.shortcuts import render, redirect
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, FileResponse, StreamingHttpResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.files.storage import FileSystemStorage, default_storage
 from django.urls import reverse
 from django.utils.timezone import now
 from django.core.cache import cache
+from django.conf import settings
+from django.db.models import Sum
 import datetime
 import os
-# OpenCV is optional for deployment
-try:
-    import cv2
-    OPENCV_AVAILABLE = True
-except ImportError:
-    OPENCV_AVAILABLE = False
-    print("OpenCV not available - QR scanning will use alternative methods")
-
 import numpy as np
 import json
-import tempfile
-from PIL import Image
+from asgiref.sync import sync_to_async
 
 from django.views.decorators.csrf import csrf_exempt
 from student_management_app.models import (
     CustomUser, Staffs, Courses, Subjects, Students,
-    Attendance, AttendanceReport, StudentResult, SessionYearModel
+    Attendance, AttendanceReport, StudentResult, SessionYearModel, AttendanceSummary
 )
 from .utils import get_client_ip, verify_network_connectivity
 from .models import AttendanceQRCode
 from .utils import is_within_radius, export_attendance_to_excel
+from .checkin import CheckInError, acheck_in, ahas_checked_in, aresolve_scan, check_in, resolve_scan
+from .qr_decode import decode_upload
+from . import attendance_export, dashboard_cache, export_formats, export_jobs, idempotency, xlsx_stream
 
 def student_home(request):
-    student_obj = Students.objects.get(admin=request.user.id)
-    total_attendance = AttendanceReport.objects.filter(student_id=student_obj).count()
-    attendance_present = AttendanceReport.objects.filter(student_id=student_obj, status=True).count()
-    attendance_absent = AttendanceReport.objects.filter(student_id=student_obj, status=False).count()
-
-    course_obj = Courses.objects.get(id=student_obj.course_id.id)
-    total_subjects = Subjects.objects.filter(course_id=course_obj).count()
-
-    subject_name = []
-    data_present = []
-    data_absent = []
-    subject_data = Subjects.objects.filter(course_id=student_obj.course_id)
-    for subject in subject_data:
-        attendance = Attendance.objects.filter(subject_id=subject.id)
-        attendance_present_count = AttendanceReport.objects.filter(attendance_id__in=attendance, status=True, student_id=student_obj.id).count()
-        attendance_absent_count = AttendanceReport.objects.filter(attendance_id__in=attendance, status=False, student_id=student_obj.id).count()
-        subject_name.append(subject.subject_name)
-        data_present.append(attendance_present_count)
-        data_absent.append(attendance_absent_count)
+    """
+    Student dashboard shell; the subject chart loads its data from
+    student_home_chart. Both are served from snapshots (see dashboard_cache).
+    """
+    context = dashboard_cache.snapshot('student', request.user.id, lambda: student_home_context(request.user))
+    return render(request, "student_template/student_home_template.html", context)
+
+
+def _student_dependencies(student_obj):
+    # Not the course: classmates' check-ins bump it but do not change these figures
+    return [('student', student_obj.id), ('enrolment',)]
+
+
+def student_home_context(user):
+    """
+    Build the student dashboard shell for user.
+
+    Returns:
+    - (context, dashboard_cache dependencies)
+    """
+    student_obj = Students.objects.get(admin=user.id)
+
+    # Present/absent over all subjects and session years from the materialized summary
+    totals = AttendanceSummary.objects.filter(student=student_obj).aggregate(
+        present=Sum('present'), absent=Sum('absent')
+    )
+    attendance_present = totals['present'] or 0
+    attendance_absent = totals['absent'] or 0
 
     context={
-        "total_attendance": total_attendance,
+        "total_attendance": attendance_present + attendance_absent,
         "attendance_present": attendance_present,
         "attendance_absent": attendance_absent,
-        "total_subjects": total_subjects,
-        "subject_name": subject_name,
-        "data_present": data_present,
-        "data_absent": data_absent
+        "total_subjects": Subjects.objects.filter(course_id=student_obj.course_id_id).count(),
     }
-    return render(request, "student_template/student_home_template.html", context)
+    return context, _student_dependencies(student_obj)
 
-def decode_qr_code(image_path):
-    """ Decodes QR Code using OpenCV (if available) """
-    if not OPENCV_AVAILABLE:
-        return None
 
-    try:
-        img = cv2.imread(image_path)
-        detector = cv2.QRCodeDetector()
-        data, _, _ = detector.detectAndDecode(img)
-        return data if data else None
-    except Exception as e:
-        print(f"OpenCV QR decode error: {e}")
-        return None
+def student_subject_chart(user):
+    """Present and absent per subject of the student's course"""
+    student_obj = Students.objects.get(admin=user.id)
+    subject_counts = {
+        row['subject_id']: row
+        for row in AttendanceSummary.objects.filter(student=student_obj).order_by()
+        .values('subject_id').annotate(present=Sum('present'), absent=Sum('absent'))
+    }
+    subjects = list(Subjects.objects.filter(course_id=student_obj.course_id_id).values_list('id', 'subject_name'))
+    data = dashboard_cache.chart_data(
+        [subject_name for _, subject_name in subjects],
+        [
+            ("Present in Class", [subject_counts.get(subject_id, {}).get('present', 0) for subject_id, _ in subjects]),
+            ("Absent in Class", [subject_counts.get(subject_id, {}).get('absent', 0) for subject_id, _ in subjects]),
+        ]
+    )
+    return data, _student_dependencies(student_obj)
+
+
+STUDENT_HOME_CHARTS = {
+    'subjects': student_subject_chart,
+}
+
+
+def student_home_chart(request, chart):
+    """Data for one student dashboard chart panel"""
+    builder = STUDENT_HOME_CHARTS.get(chart)
+    if builder is None:
+        return JsonResponse({"status": "error", "message": f"Unknown chart: {chart}"}, status=404)
+    data = dashboard_cache.snapshot(f'student_chart_{chart}', request.user.id, lambda: builder(request.user))
+    return dashboard_cache.chart_response(request, data)
 
 @csrf_exempt
 def student_upload_qr(request):
@@ -87,6 +108,12 @@ def student_upload_qr(request):
             # Get the uploaded QR code image
             qr_image = request.FILES['qr_image']
 
+            # A retried upload with the same Idempotency-Key skips decoding entirely
+            header_key = idempotency.request_key(request)
+            replayed = idempotency.replay(request.user.id, header_key)
+            if replayed is not None:
+                return replayed_response(replayed)
+
             # SECURITY: Get and validate student's location data
             latitude = request.POST.get('latitude')
             longitude = request.POST.get('longitude')
@@ -122,90 +149,30 @@ def student_upload_qr(request):
 
             # Open and process the QR code image
             try:
-                import datetime
-                from django.utils.timezone import now
-                import tempfile
-                import os
-
-                token = None
-
-                # Try pyzbar first
-                try:
-                    from pyzbar.pyzbar import decode
-                    from PIL import Image
-
-                    # Open the image using PIL
-                    img = Image.open(qr_image)
-
-                    # Decode the QR code
-                    decoded_objects = decode(img)
-
-                    if decoded_objects:
-                        # Get the QR code data (token)
-                        token = decoded_objects[0].data.decode('utf-8')
-                except Exception as pyzbar_error:
-                    print(f"Pyzbar failed: {pyzbar_error}")
-
-                # If pyzbar failed, try OpenCV as fallback (if available)
-                if not token and OPENCV_AVAILABLE:
-                    try:
-                        # Save uploaded file temporarily
-                        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                            for chunk in qr_image.chunks():
-                                temp_file.write(chunk)
-                            temp_file_path = temp_file.name
+                # Decode from the in-memory upload in the bounded decode pool
+                decode_result = decode_upload(
+                    qr_image,
+                    workers=settings.QR_DECODE_WORKERS,
+                    timeout=settings.QR_DECODE_TIMEOUT
+                )
 
-                        # Use OpenCV to decode
-                        token = decode_qr_code(temp_file_path)
+                if not decode_result:
+                    return JsonResponse({'status': 'error', 'message': 'No QR code found in the image or unable to decode'})
 
-                        # Clean up temp file
-                        os.unlink(temp_file_path)
-                    except Exception as opencv_error:
-                        print(f"OpenCV failed: {opencv_error}")
+                token = decode_result.token
+                print(f"QR decoded by {decode_result.decoder} at stage {decode_result.stage}")
 
-                if not token:
-                    return JsonResponse({'status': 'error', 'message': 'No QR code found in the image or unable to decode'})
+                replayed = idempotency.replay(request.user.id, idempotency.token_key(token))
+                if replayed is not None:
+                    return replayed_response(replayed)
 
                 # Find the corresponding QR code record in the database
                 try:
-                    qr_code = AttendanceQRCode.objects.filter(
-                        token=token,
-                        is_active=True,
-                        expiry_time__gte=now()
-                    ).first()
+                    qr_code = resolve_scan(token)
 
                     if not qr_code:
                         return JsonResponse({'status': 'error', 'message': 'QR code has expired or is invalid'})
 
-                    # Get the student object
-                    student = Students.objects.get(admin=request.user.id)
-
-                    # Check if attendance already marked
-                    attendance_exists = Attendance.objects.filter(
-                        subject_id=qr_code.subject,
-                        session_year_id=qr_code.session_year,
-                        attendance_date=datetime.date.today()
-                    ).exists()
-
-                    if attendance_exists:
-                        attendance = Attendance.objects.get(
-                            subject_id=qr_code.subject,
-                            session_year_id=qr_code.session_year,
-                            attendance_date=datetime.date.today()
-                        )
-
-                        # Check if student already marked attendance
-                        if AttendanceReport.objects.filter(student_id=student, attendance_id=attendance).exists():
-                            return JsonResponse({'status': 'error', 'message': 'You have already marked attendance for this subject today'})
-                    else:
-                        # Create new attendance record
-                        attendance = Attendance(
-                            subject_id=qr_code.subject,
-                            attendance_date=datetime.date.today(),
-                            session_year_id=qr_code.session_year
-                        )
-                        attendance.save()
-
                     # SECURITY: Enhanced location verification with validation
                     location_verified = False
                     if qr_code.teacher_latitude and qr_code.teacher_longitude and latitude and longitude:
@@ -260,10 +227,10 @@ def student_upload_qr(request):
 
                         # SECURITY: Enhanced logging and validation
                         if not verification_result.get('is_reliable', True):
-                            print(f"SECURITY WARNING: Unreliable GPS data for student {student.admin.username}")
+                            print(f"SECURITY WARNING: Unreliable GPS data for student {request.user.username}")
 
                         # SECURITY: Log location verification attempt
-                        print(f"SECURITY LOG: Student {student.admin.username} location verification - Distance: {verification_result['distance']:.2f}m, Allowed: {verification_result.get('original_radius', allowed_radius)}m")
+                        print(f"SECURITY LOG: Student {request.user.username} location verification - Distance: {verification_result['distance']:.2f}m, Allowed: {verification_result.get('original_radius', allowed_radius)}m")
 
                         # Extract the boolean value for location verification
                         location_verified = bool(verification_result['is_within'])
@@ -296,23 +263,25 @@ def student_upload_qr(request):
                     # Network verification removed - no longer needed
 
                     # Create attendance report with basic fields
-                    attendance_report = AttendanceReport(
-                        student_id=student,
-                        attendance_id=attendance,
-                        status=True,
-                        student_latitude=float(latitude) if latitude else None,
-                        student_longitude=float(longitude) if longitude else None,
-                        location_verified=bool(location_verified),
-                        verification_details=verification_details
-                    )
-
-                    # Network verification removed - no longer needed
-                    attendance_report.save()
+                    try:
+                        check_in(
+                            qr_code, request.user.id,
+                            student_latitude=float(latitude) if latitude else None,
+                            student_longitude=float(longitude) if longitude else None,
+                            location_verified=bool(location_verified),
+                            verification_details=verification_details
+                        )
+                    except CheckInError as checkin_error:
+                        return JsonResponse({'status': 'error', 'message': checkin_error.message})
 
-                    return JsonResponse({
+                    payload = {
                         'status': 'success',
-                        'message': 'Attendance marked successfully'
-                    })
+                        'message': 'Attendance marked successfully',
+                        'decoder': decode_result.decoder,
+                        'decode_stage': decode_result.stage
+                    }
+                    idempotency.remember(request.user.id, qr_code, payload, header_key, idempotency.token_key(token))
+                    return JsonResponse(payload)
 
                 except Exception as qr_error:
                     return JsonResponse({'status': 'error', 'message': f'Error validating QR code: {str(qr_error)}'})
@@ -439,6 +408,203 @@ def student_scan_qr(request):
     return render(request, 'student_template/student_scan_qr.html', context)
 
 
+def verify_scan(request, qr_code, data):
+    """
+    Run the location and network checks for a scanned QR code.
+
+    Parameters:
+    - request: The student's request (used for the client IP)
+    - qr_code: Live AttendanceQRCode returned by resolve_scan
+    - data: Decoded scan payload (token, latitude, longitude, accuracy, network_ssid)
+
+    Returns:
+    - (error, verification): error is a JSON payload to send back when a check
+      fails, otherwise None and verification holds the check_in report fields
+      and the details for the success response
+    """
+    latitude = data.get('latitude')
+    longitude = data.get('longitude')
+    student_ssid = data.get('network_ssid')  # Network SSID from student
+
+    # Verify location if teacher's location is available
+    location_verified = False
+    location_details = {}
+
+    if qr_code.teacher_latitude and qr_code.teacher_longitude and latitude and longitude:
+        # Convert to float
+        student_lat = float(latitude)
+        student_lon = float(longitude)
+        teacher_lat = float(qr_code.teacher_latitude)
+        teacher_lon = float(qr_code.teacher_longitude)
+        allowed_radius = float(qr_code.allowed_radius)
+
+        # Debug logging
+        print(f"Location verification debug:")
+        print(f"Student location: {student_lat}, {student_lon}")
+        print(f"Teacher location: {teacher_lat}, {teacher_lon}")
+        print(f"Allowed radius: {allowed_radius}")
+
+        # Get student location accuracy if available
+        student_accuracy = data.get('accuracy', None)
+        print(f"Student accuracy: {student_accuracy}")
+
+        # Check if student is within allowed radius with enhanced verification
+        verification_result = is_within_radius(
+            student_lat, student_lon,
+            teacher_lat, teacher_lon,
+            allowed_radius,
+            student_accuracy
+        )
+
+        print(f"Verification result: {verification_result}")
+
+        # Store verification details for the response
+        location_details = {
+            'distance': round(verification_result['distance'], 2),
+            'allowed_radius': round(verification_result['original_radius'], 2),
+            'effective_radius': round(verification_result['effective_radius'], 2),
+            'error_margin': round(verification_result['error_margin'], 2),
+            'is_reliable': bool(verification_result['is_reliable'])  # Ensure it's a proper boolean
+        }
+
+        print(f"Location details: {location_details}")
+
+        # Check if coordinates are suspiciously identical
+        if student_lat == teacher_lat and student_lon == teacher_lon:
+            print("WARNING: Student and teacher coordinates are identical!")
+
+        # Check if student is within radius
+        location_verified = verification_result['is_within']
+        print(f"Location verified: {location_verified}")
+
+        if not location_verified:
+            # Provide more detailed error message with distance information
+            return {
+                'status': 'error',
+                'message': f'You are not within the allowed radius for attendance. You are {location_details["distance"]} meters away from the teacher, but the allowed radius is {location_details["allowed_radius"]} meters.',
+                'location_details': location_details,
+                'debug_info': {
+                    'student_location': f'{student_lat:.6f}, {student_lon:.6f}',
+                    'teacher_location': f'{teacher_lat:.6f}, {teacher_lon:.6f}',
+                    'distance_calculated': location_details["distance"]
+                }
+            }, None
+    else:
+        # If teacher's location is not set, location verification is not required
+        if qr_code.teacher_latitude and qr_code.teacher_longitude:
+            # Teacher has location but student doesn't - require location
+            return {
+                'status': 'error',
+                'message': 'Location data is required to mark attendance. Please enable location services and try again.'
+            }, None
+        else:
+            # No location verification required
+            location_verified = True  # Allow attendance without location verification
+
+    # Network verification using cached data
+    network_verified = False
+    network_verification_details = None
+    student_ip = get_client_ip(request)
+
+    # Get network information from cache
+    cache_key = f"qr_network_{qr_code.token}"
+    network_info = cache.get(cache_key)
+
+    print(f"Network verification debug:")
+    print(f"- Cache key: {cache_key}")
+    print(f"- Network info from cache: {network_info}")
+    print(f"- Student IP: {student_ip}")
+
+    if network_info and network_info.get('require_network_verification'):
+        teacher_ip = network_info.get('teacher_ip')
+        teacher_ssid = network_info.get('teacher_ssid')
+
+        # Perform network verification
+        network_verification_result = verify_network_connectivity(
+            student_ip=student_ip,
+            teacher_ip=teacher_ip,
+            student_ssid=student_ssid,
+            teacher_ssid=teacher_ssid
+        )
+
+        network_verified = network_verification_result['is_same_network']
+        network_verification_details = {
+            'student_ip': student_ip,
+            'teacher_ip': teacher_ip,
+            'student_ssid': student_ssid,
+            'teacher_ssid': teacher_ssid,
+            'ip_match': network_verification_result['ip_match'],
+            'ssid_match': network_verification_result['ssid_match'],
+            'verification_method': network_verification_result['verification_method']
+        }
+
+        if not network_verified:
+            return {
+                'status': 'error',
+                'message': 'Network verification failed. You must be connected to the same network as your teacher.',
+                'network_details': network_verification_details
+            }, None
+    else:
+        # Network verification not required or no network info available
+        print("Network verification skipped - not required or no network info available")
+        network_verified = True
+
+    # Create attendance report with enhanced location details
+    # Convert location_details to a proper JSON-serializable format
+    json_location_details = None
+    if location_details:
+        # Ensure all values are proper JSON types (bool, float, int, str, list, dict)
+        json_location_details = {
+            'distance': float(location_details['distance']),
+            'allowed_radius': float(location_details['allowed_radius']),
+            'effective_radius': float(location_details['effective_radius']),
+            'error_margin': float(location_details['error_margin']),
+            'is_reliable': bool(location_details['is_reliable'])
+        }
+
+    # Create attendance report with available fields
+    # Store network verification details in the existing verification_details field
+    combined_verification_details = json_location_details or {}
+    if network_verification_details:
+        combined_verification_details['network'] = network_verification_details
+        combined_verification_details['network_verified'] = network_verified
+
+    student_accuracy = data.get('accuracy', None)
+    return None, {
+        'report_fields': {
+            'student_latitude': float(latitude) if latitude else None,
+            'student_longitude': float(longitude) if longitude else None,
+            'student_accuracy': float(student_accuracy) if student_accuracy else None,
+            'location_verified': bool(location_verified),
+            'verification_details': combined_verification_details,
+        },
+        'location_verified': location_verified,
+        'location_details': location_details if location_details else None,
+        'network_verified': network_verified,
+        'network_details': network_verification_details if network_verification_details else None,
+    }
+
+
+def scan_success_response(qr_code, verification):
+    """JSON payload returned to the student after a successful check-in"""
+    return {
+        'status': 'success',
+        'message': 'Attendance marked successfully',
+        'subject': qr_code.subject.subject_name,
+        'location_verified': verification['location_verified'],
+        'location_details': verification['location_details'],
+        'network_verified': verification['network_verified'],
+        'network_details': verification['network_details']
+    }
+
+
+def replayed_response(payload):
+    """Return a stored check-in response, marked so clients can tell it was replayed"""
+    response = JsonResponse(payload)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
 @csrf_exempt
 @login_required
 def student_process_qr_scan(request):
@@ -452,226 +618,116 @@ def student_process_qr_scan(request):
             # Get the QR code data from the request
             data = json.loads(request.body)
             token = data.get('token')
-            latitude = data.get('latitude')
-            longitude = data.get('longitude')
-            student_ssid = data.get('network_ssid')  # Network SSID from student
 
             if not token:
                 return JsonResponse({'status': 'error', 'message': 'No QR code data provided'})
 
+            # Retries and double taps get the original response without touching the database
+            idempotency_keys = (idempotency.request_key(request), idempotency.token_key(token))
+            replayed = idempotency.replay(request.user.id, *idempotency_keys)
+            if replayed is not None:
+                return replayed_response(replayed)
+
             # Find the corresponding QR code record in the database
             try:
-                qr_code = AttendanceQRCode.objects.filter(
-                    token=token,
-                    is_active=True,
-                    expiry_time__gte=now()
-                ).first()
+                qr_code = resolve_scan(token)
 
                 if not qr_code:
                     return JsonResponse({'status': 'error', 'message': 'QR code has expired or is invalid'})
 
-                # Get the student object
-                student = Students.objects.get(admin=request.user.id)
-
-                # Check if attendance already marked
-                attendance_exists = Attendance.objects.filter(
-                    subject_id=qr_code.subject,
-                    session_year_id=qr_code.session_year,
-                    attendance_date=datetime.date.today()
-                ).exists()
-
-                if attendance_exists:
-                    attendance = Attendance.objects.get(
-                        subject_id=qr_code.subject,
-                        session_year_id=qr_code.session_year,
-                        attendance_date=datetime.date.today()
-                    )
-
-                    # Check if student already marked attendance
-                    if AttendanceReport.objects.filter(student_id=student, attendance_id=attendance).exists():
-                        return JsonResponse({'status': 'error', 'message': 'You have already marked attendance for this subject today'})
-                else:
-                    # Create new attendance record
-                    attendance = Attendance(
-                        subject_id=qr_code.subject,
-                        attendance_date=datetime.date.today(),
-                        session_year_id=qr_code.session_year
-                    )
-                    attendance.save()
-
-                # Verify location if teacher's location is available
-                location_verified = False
-                location_details = {}
-
-                if qr_code.teacher_latitude and qr_code.teacher_longitude and latitude and longitude:
-                    # Convert to float
-                    student_lat = float(latitude)
-                    student_lon = float(longitude)
-                    teacher_lat = float(qr_code.teacher_latitude)
-                    teacher_lon = float(qr_code.teacher_longitude)
-                    allowed_radius = float(qr_code.allowed_radius)
-
-                    # Debug logging
-                    print(f"Location verification debug:")
-                    print(f"Student location: {student_lat}, {student_lon}")
-                    print(f"Teacher location: {teacher_lat}, {teacher_lon}")
-                    print(f"Allowed radius: {allowed_radius}")
-
-                    # Get student location accuracy if available
-                    student_accuracy = data.get('accuracy', None)
-                    print(f"Student accuracy: {student_accuracy}")
-
-                    # Check if student is within allowed radius with enhanced verification
-                    verification_result = is_within_radius(
-                        student_lat, student_lon,
-                        teacher_lat, teacher_lon,
-                        allowed_radius,
-                        student_accuracy
-                    )
-
-                    print(f"Verification result: {verification_result}")
-
-                    # Store verification details for the response
-                    location_details = {
-                        'distance': round(verification_result['distance'], 2),
-                        'allowed_radius': round(verification_result['original_radius'], 2),
-                        'effective_radius': round(verification_result['effective_radius'], 2),
-                        'error_margin': round(verification_result['error_margin'], 2),
-                        'is_reliable': bool(verification_result['is_reliable'])  # Ensure it's a proper boolean
-                    }
+                error, verification = verify_scan(request, qr_code, data)
+                if error:
+                    return JsonResponse(error)
 
-                    print(f"Location details: {location_details}")
+                # Student lookup, session get-or-create and the insert happen in one
+                # transaction; a duplicate scan is rejected by the unique constraint
+                try:
+                    check_in(qr_code, request.user.id, **verification['report_fields'])
+                except CheckInError as checkin_error:
+                    return JsonResponse({'status': 'error', 'message': checkin_error.message})
 
-                    # Check if coordinates are suspiciously identical
-                    if student_lat == teacher_lat and student_lon == teacher_lon:
-                        print("WARNING: Student and teacher coordinates are identical!")
+                payload = scan_success_response(qr_code, verification)
+                idempotency.remember(request.user.id, qr_code, payload, *idempotency_keys)
+                return JsonResponse(payload)
 
-                    # Check if student is within radius
-                    location_verified = verification_result['is_within']
-                    print(f"Location verified: {location_verified}")
+            except AttendanceQRCode.DoesNotExist:
+                return JsonResponse({'status': 'error', 'message': 'Invalid QR code'})
 
-                    if not location_verified:
-                        # Provide more detailed error message with distance information
-                        return JsonResponse({
-                            'status': 'error',
-                            'message': f'You are not within the allowed radius for attendance. You are {location_details["distance"]} meters away from the teacher, but the allowed radius is {location_details["allowed_radius"]} meters.',
-                            'location_details': location_details,
-                            'debug_info': {
-                                'student_location': f'{student_lat:.6f}, {student_lon:.6f}',
-                                'teacher_location': f'{teacher_lat:.6f}, {teacher_lon:.6f}',
-                                'distance_calculated': location_details["distance"]
-                            }
-                        })
-                else:
-                    # If teacher's location is not set, location verification is not required
-                    if qr_code.teacher_latitude and qr_code.teacher_longitude:
-                        # Teacher has location but student doesn't - require location
-                        return JsonResponse({
-                            'status': 'error',
-                            'message': 'Location data is required to mark attendance. Please enable location services and try again.'
-                        })
-                    else:
-                        # No location verification required
-                        location_verified = True  # Allow attendance without location verification
-
-                # Network verification using cached data
-                network_verified = False
-                network_verification_details = None
-                student_ip = get_client_ip(request)
-
-                # Get network information from cache
-                cache_key = f"qr_network_{token}"
-                network_info = cache.get(cache_key)
-
-                print(f"Network verification debug:")
-                print(f"- Cache key: {cache_key}")
-                print(f"- Network info from cache: {network_info}")
-                print(f"- Student IP: {student_ip}")
-
-                if network_info and network_info.get('require_network_verification'):
-                    teacher_ip = network_info.get('teacher_ip')
-                    teacher_ssid = network_info.get('teacher_ssid')
-
-                    # Perform network verification
-                    network_verification_result = verify_network_connectivity(
-                        student_ip=student_ip,
-                        teacher_ip=teacher_ip,
-                        student_ssid=student_ssid,
-                        teacher_ssid=teacher_ssid
-                    )
-
-                    network_verified = network_verification_result['is_same_network']
-                    network_verification_details = {
-                        'student_ip': student_ip,
-                        'teacher_ip': teacher_ip,
-                        'student_ssid': student_ssid,
-                        'teacher_ssid': teacher_ssid,
-                        'ip_match': network_verification_result['ip_match'],
-                        'ssid_match': network_verification_result['ssid_match'],
-                        'verification_method': network_verification_result['verification_method']
-                    }
+        except Exception as e:
+            return JsonResponse({'status': 'error', 'message': f'Error: {str(e)}'})
 
-                    if not network_verified:
-                        return JsonResponse({
-                            'status': 'error',
-                            'message': 'Network verification failed. You must be connected to the same network as your teacher.',
-                            'network_details': network_verification_details
-                        })
-                else:
-                    # Network verification not required or no network info available
-                    print("Network verification skipped - not required or no network info available")
-                    network_verified = True
-
-                # Create attendance report with enhanced location details
-                # Convert location_details to a proper JSON-serializable format
-                json_location_details = None
-                if location_details:
-                    # Ensure all values are proper JSON types (bool, float, int, str, list, dict)
-                    json_location_details = {
-                        'distance': float(location_details['distance']),
-                        'allowed_radius': float(location_details['allowed_radius']),
-                        'effective_radius': float(location_details['effective_radius']),
-                        'error_margin': float(location_details['error_margin']),
-                        'is_reliable': bool(location_details['is_reliable'])
-                    }
+    return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
 
-                # Create attendance report with available fields
-                # Store network verification details in the existing verification_details field
-                combined_verification_details = json_location_details or {}
-                if network_verification_details:
-                    combined_verification_details['network'] = network_verification_details
-                    combined_verification_details['network_verified'] = network_verified
-
-                attendance_report = AttendanceReport(
-                    student_id=student,
-                    attendance_id=attendance,
-                    status=True,
-                    student_latitude=student_lat if latitude else None,
-                    student_longitude=student_lon if longitude else None,
-                    student_accuracy=float(student_accuracy) if student_accuracy else None,
-                    location_verified=bool(location_verified),
-                    verification_details=combined_verification_details
-                )
+async def student_process_qr_scan_async(request):
+    """
+    Async variant of student_process_qr_scan for the ASGI deployment.
 
-                attendance_report.save()
+    The token is resolved through the registry and the async ORM, and the
+    cache lookups, geofence checks and check-in transaction run in worker
+    threads, so a slow database or cache only parks this request instead of
+    a whole server worker.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
+    # login_required and csrf_exempt only wrap sync views in this Django version;
+    # LoginCheckMiddleWare has already loaded request.user at this point
+    if not request.user.is_authenticated or request.user.user_type != '3':
+        return JsonResponse({'status': 'error', 'message': 'Access denied. Students only.'})
 
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'Attendance marked successfully',
-                    'subject': qr_code.subject.subject_name,
-                    'location_verified': location_verified,
-                    'location_details': location_details if location_details else None,
-                    'network_verified': network_verified,
-                    'network_details': network_verification_details if network_verification_details else None
-                })
+    try:
+        data = json.loads(request.body)
+        token = data.get('token')
+        if not token:
+            return JsonResponse({'status': 'error', 'message': 'No QR code data provided'})
 
-            except AttendanceQRCode.DoesNotExist:
-                return JsonResponse({'status': 'error', 'message': 'Invalid QR code'})
+        idempotency_keys = (idempotency.request_key(request), idempotency.token_key(token))
+        replayed = await sync_to_async(idempotency.replay)(request.user.id, *idempotency_keys)
+        if replayed is not None:
+            return replayed_response(replayed)
 
-        except Exception as e:
-            return JsonResponse({'status': 'error', 'message': f'Error: {str(e)}'})
+        qr_code = await aresolve_scan(token)
+        if not qr_code:
+            return JsonResponse({'status': 'error', 'message': 'QR code has expired or is invalid'})
+
+        # verify_scan reads the cache and may probe the network, so keep it off the event loop
+        error, verification = await sync_to_async(verify_scan)(request, qr_code, data)
+        if error:
+            return JsonResponse(error)
+
+        try:
+            await acheck_in(qr_code, request.user.id, **verification['report_fields'])
+        except CheckInError as checkin_error:
+            return JsonResponse({'status': 'error', 'message': checkin_error.message})
+
+        payload = scan_success_response(qr_code, verification)
+        await sync_to_async(idempotency.remember)(request.user.id, qr_code, payload, *idempotency_keys)
+        return JsonResponse(payload)
+
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': f'Error: {str(e)}'})
+
+
+async def student_checkin_status(request):
+    """
+    Tell the student whether their scan of a QR code has been recorded.
+
+    GET parameters:
+    - token: The scanned QR token
+    """
+    if not request.user.is_authenticated or request.user.user_type != '3':
+        return JsonResponse({'status': 'error', 'message': 'Access denied. Students only.'})
+
+    qr_code = await aresolve_scan(request.GET.get('token'))
+    if not qr_code:
+        return JsonResponse({'status': 'error', 'message': 'QR code has expired or is invalid'})
+
+    return JsonResponse({
+        'status': 'success',
+        'checked_in': await ahas_checked_in(qr_code, request.user.id),
+        'subject': qr_code.subject.subject_name,
+        'expires_at': qr_code.expiry_time.isoformat()
+    })
 
-    return JsonResponse({'status': 'error', 'message': 'Invalid request method'})
 
 def student_export_attendance(request):
     """View for exporting student's attendance data"""
@@ -679,7 +735,8 @@ def student_export_attendance(request):
     course = student.course_id
     subjects = Subjects.objects.filter(course_id=course)
     context = {
-        "subjects": subjects
+        "subjects": subjects,
+        "parquet_available": export_formats.PARQUET_AVAILABLE
     }
     return render(request, "student_template/student_export_attendance.html", context)
 
@@ -693,10 +750,16 @@ def student_export_attendance_data(request):
     subject_id = request.POST.get('subject')
     start_date = request.POST.get('start_date')
     end_date = request.POST.get('end_date')
+    fmt = request.POST.get('format') or 'xlsx'
 
     if not start_date or not end_date:
         return JsonResponse({'status': 'error', 'message': 'Date range is required'})
 
+    try:
+        export_formats.check_format(fmt)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)})
+
     try:
         # Get the student object
         student = Students.objects.get(admin=request.user.id)
@@ -714,8 +777,7 @@ def student_export_attendance_data(request):
             )
             subject_name = subject.subject_name
         else:  # All subjects
-            course = student.course_id
-            subjects = Subjects.objects.filter(course_id=course)
+            subjects = Subjects.objects.filter(course_id=student.course_id_id)
             attendances = Attendance.objects.filter(
                 subject_id__in=subjects,
                 attendance_date__range=(start_date, end_date)
@@ -728,48 +790,53 @@ def student_export_attendance_data(request):
             student_id=student
         )
 
-        if not attendance_reports:
+        if not attendance_reports.exists():
             return JsonResponse({'status': 'error', 'message': 'No attendance records found for the selected criteria'})
 
+        # Prepare filename
+        student_name = f"{request.user.first_name}_{request.user.last_name}"
+        filename = f"attendance_{student_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+
+        if fmt != 'xlsx':
+            # Flat rows, one per report, streamed as they are read
+            return export_formats.response(
+                fmt, list(attendance_export.STUDENT_COLUMNS), attendance_export.student_rows(attendance_reports),
+                filename, attendance_export.COLUMN_TYPES
+            )
+
         # Generate Excel file
         date_range = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
-        excel_file = export_attendance_to_excel(
+        chunks = export_attendance_to_excel(
             attendance_reports,
             subject_name=subject_name,
             date_range=date_range,
             for_student=True
         )
 
-        # Prepare filename
-        student_name = f"{student.admin.first_name}_{student.admin.last_name}"
-        filename = f"attendance_{student_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx"
-
-        # Read the file content instead of keeping it open
-        with open(excel_file, 'rb') as f:
-            file_content = f.read()
-
-        # Create the response with the content
-        response = HttpResponse(
-            file_content,
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-
-        # Set the Content-Disposition header
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        response['Content-Length'] = len(file_content)
-
-        # Close and delete the file explicitly before returning the response
-        try:
-            os.unlink(excel_file)
-        except Exception as file_error:
-            # If we can't delete now, schedule it for later
-            import atexit
-            atexit.register(lambda file_path=excel_file: os.unlink(file_path) if os.path.exists(file_path) else None)
-            print(f"Warning: Could not delete temp file immediately: {str(file_error)}")
-
+        # The workbook is written into the response as it is built; no temporary file
+        response = StreamingHttpResponse(chunks, content_type=xlsx_stream.CONTENT_TYPE)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
         return response
 
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         return JsonResponse({'status': 'error', 'message': str(e)})
+
+
+def student_export_job(request):
+    """
+    Queue student_export_attendance_data as a background job (see export_jobs).
+    Poll the returned job's status.
+    """
+    if request.method != 'POST':
+        return HttpResponse("Method Not Allowed", status=405)
+    fmt = request.POST.get('format') or 'xlsx'
+    try:
+        export_formats.check_format(fmt)
+        job = export_jobs.enqueue(
+            request.user, 'student', fmt, export_jobs.params_for('student', request.POST, request.user)
+        )
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    return JsonResponse({'status': 'success', 'job': export_jobs.describe(job)})
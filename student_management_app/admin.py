@@ -5,7 +5,7 @@ from django.db import models
 from django.forms import ModelForm
 from .models import (
     CustomUser, AdminHOD, Staffs, Courses, Subjects, Students,
-    Attendance, AttendanceReport, SessionYearModel, AttendanceQRCode, StudentResult
+    Attendance, AttendanceReport, SessionYearModel, AttendanceQRCode, StudentResult, ClassSchedule
 )
 
 # Custom User Admin with better data integrity
@@ -159,6 +159,13 @@ class AttendanceReportAdmin(admin.ModelAdmin):
         return obj.attendance_id.attendance_date
     get_date.short_description = 'Date'
 
+# Class Schedule Admin
+class ClassScheduleAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'weekday', 'start_time', 'end_time', 'room', 'session_year')
+    list_filter = ('weekday', 'session_year', 'subject__staff_id')
+    search_fields = ('subject__subject_name', 'room')
+    ordering = ('weekday', 'start_time')
+
 # Register models with improved admin classes
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(SessionYearModel, SessionYearAdmin)
@@ -171,4 +178,5 @@ admin.site.register(Attendance, AttendanceAdmin)
 admin.site.register(AttendanceReport, AttendanceReportAdmin)
 admin.site.register(AttendanceQRCode)
 admin.site.register(StudentResult)
+admin.site.register(ClassSchedule, ClassScheduleAdmin)
 
@@ -0,0 +1,190 @@
+"""
+Data source for attendance exports.
+
+Each export reads exactly the columns it writes, with the student, subject
+and teacher joined in, from one ordered query fetched CHUNK_SIZE rows at a
+time (through a server-side cursor where the database supports one). The
+summary figures come from a single aggregate query rather than being
+counted while the rows are written. The grid layout (one row per student,
+one column per date) is pivoted in memory from a single query; see matrix().
+"""
+
+import datetime
+from collections import namedtuple
+
+import numpy as np
+from django.db.models import Count, Q
+
+from .models import Students
+
+# Rows fetched from the cursor at a time
+CHUNK_SIZE = 2000
+
+# Column name -> lookup from AttendanceReport, in output order
+STAFF_COLUMNS = {
+    'student_username': 'student_id__admin__username',
+    'student_first_name': 'student_id__admin__first_name',
+    'student_last_name': 'student_id__admin__last_name',
+    'attendance_date': 'attendance_id__attendance_date',
+    'subject_name': 'attendance_id__subject_id__subject_name',
+    'status': 'status',
+    'location_verified': 'location_verified',
+}
+STAFF_ORDERING = (
+    'attendance_id__attendance_date', 'student_id__admin__first_name', 'student_id__admin__last_name', 'id'
+)
+
+STUDENT_COLUMNS = {
+    'attendance_date': 'attendance_id__attendance_date',
+    'subject_name': 'attendance_id__subject_id__subject_name',
+    'status': 'status',
+    'location_verified': 'location_verified',
+    'teacher_first_name': 'attendance_id__subject_id__staff_id__admin__first_name',
+    'teacher_last_name': 'attendance_id__subject_id__staff_id__admin__last_name',
+}
+STUDENT_ORDERING = ('attendance_id__attendance_date', 'attendance_id__subject_id__subject_name', 'id')
+
+# Everything, for analytics exports across all courses
+HOD_COLUMNS = {
+    'attendance_date': 'attendance_id__attendance_date',
+    'session_year_id': 'attendance_id__session_year_id',
+    'course_name': 'attendance_id__subject_id__course_id__course_name',
+    'subject_name': 'attendance_id__subject_id__subject_name',
+    'teacher_username': 'attendance_id__subject_id__staff_id__admin__username',
+    'student_username': 'student_id__admin__username',
+    'student_first_name': 'student_id__admin__first_name',
+    'student_last_name': 'student_id__admin__last_name',
+    'status': 'status',
+    'location_verified': 'location_verified',
+}
+HOD_ORDERING = ('attendance_id__attendance_date', 'attendance_id__subject_id__subject_name', 'id')
+
+# Cells of the students x dates grid, by grid value (-1 no record, 0 absent, 1 present)
+MATRIX_CELLS = np.array(['', 'A', 'P'])
+
+# Students x dates, for the grid layout; see matrix()
+Matrix = namedtuple('Matrix', ['students', 'dates', 'grid'])
+
+# Columns that are not text, for typed formats such as Parquet
+COLUMN_TYPES = {
+    'attendance_date': 'date',
+    'session_year_id': 'int',
+    'status': 'bool',
+    'location_verified': 'bool',
+}
+
+
+def rows(reports, columns, ordering, progress=None):
+    """
+    Stream the given columns of a queryset of AttendanceReport rows.
+
+    Parameters:
+    - reports: AttendanceReport queryset, already filtered
+    - columns: Dict of column name -> lookup, e.g. STAFF_COLUMNS
+    - ordering: Lookups to order by
+    - progress: Optional callable, given the number of rows read so far
+      after every CHUNK_SIZE rows
+
+    Returns:
+    - Iterator of namedtuples with the columns' names as fields
+    """
+    Row = namedtuple('Row', columns)
+    values = reports.order_by(*ordering).values_list(*columns.values())
+    for count, row in enumerate(values.iterator(chunk_size=CHUNK_SIZE), 1):
+        yield Row._make(row)
+        if progress and count % CHUNK_SIZE == 0:
+            progress(count)
+
+
+def staff_rows(reports, progress=None):
+    """One row per report for a teacher's export, by date then student name."""
+    return rows(reports, STAFF_COLUMNS, STAFF_ORDERING, progress)
+
+
+def student_rows(reports, progress=None):
+    """One row per report for a student's own export, by date then subject."""
+    return rows(reports, STUDENT_COLUMNS, STUDENT_ORDERING, progress)
+
+
+def hod_rows(reports, progress=None):
+    """One row per report with every column, by date then subject."""
+    return rows(reports, HOD_COLUMNS, HOD_ORDERING, progress)
+
+
+def statistics(reports):
+    """
+    Summary figures for a queryset of AttendanceReport rows, in one query.
+
+    Returns:
+    - Dict with total, present, absent and location_verified counts
+    """
+    return reports.order_by().aggregate(
+        total=Count('id'),
+        present=Count('id', filter=Q(status=True)),
+        absent=Count('id', filter=Q(status=False)),
+        location_verified=Count('id', filter=Q(location_verified=True)),
+    )
+
+
+def matrix(reports):
+    """
+    Pivot a queryset of AttendanceReport rows into one row per student and
+    one column per date. The (student, date, status) triples come from one
+    query and are pivoted with NumPy; a second query reads the names.
+
+    A student with several reports on one date (the reports span more than
+    one subject's session that day) counts as present if they attended any
+    of those sessions.
+
+    Returns:
+    - Matrix: students as (username, full name) in name order, the sorted
+      dates, and an int8 array of shape (students, dates) holding 1 for
+      present, 0 for absent and -1 where there is no report
+    """
+    triples = reports.order_by().values_list('student_id', 'attendance_id__attendance_date', 'status')
+    data = np.fromiter(
+        ((student_id, date.toordinal(), status) for student_id, date, status in triples.iterator(chunk_size=CHUNK_SIZE)),
+        dtype=np.dtype((np.int64, 3))
+    ).reshape(-1, 3)
+    student_ids, student_index = np.unique(data[:, 0], return_inverse=True)
+    ordinals, date_index = np.unique(data[:, 1], return_inverse=True)
+    grid = np.full((len(student_ids), len(ordinals)), -1, dtype=np.int8)
+    # Unbuffered, so repeated (student, date) cells keep the highest status instead of the last one
+    np.maximum.at(grid, (student_index, date_index), data[:, 2].astype(np.int8))
+
+    names = Students.objects.filter(id__in=reports.values('student_id')).order_by(
+        'admin__first_name', 'admin__last_name', 'id'
+    ).values_list('id', 'admin__username', 'admin__first_name', 'admin__last_name')
+    names = list(names)
+    order = np.searchsorted(student_ids, [student_id for student_id, _, _, _ in names])
+    return Matrix(
+        [(username, f"{first_name} {last_name}") for _, username, first_name, last_name in names],
+        [datetime.date.fromordinal(int(ordinal)) for ordinal in ordinals],
+        grid[order]
+    )
+
+
+def matrix_rows(attendance):
+    """
+    The grid as plain rows: a header, one row per student with their totals,
+    then present and absent counts per date.
+
+    Parameters:
+    - attendance: Matrix from matrix()
+
+    Returns:
+    - Iterator of lists
+    """
+    grid = attendance.grid
+    present, absent = (grid == 1), (grid == 0)
+    yield ['Student ID', 'Student Name', *(date.strftime('%Y-%m-%d') for date in attendance.dates),
+           'Present', 'Absent', 'Attendance %']
+    cells = MATRIX_CELLS[grid + 1]
+    student_present, student_absent = present.sum(axis=1), absent.sum(axis=1)
+    for (username, name), row, row_present, row_absent in zip(
+        attendance.students, cells.tolist(), student_present.tolist(), student_absent.tolist()
+    ):
+        total = row_present + row_absent
+        yield [username, name, *row, row_present, row_absent, round(row_present / total * 100, 1) if total else 0.0]
+    yield ['Present', '', *present.sum(axis=0).tolist(), int(student_present.sum()), '', '']
+    yield ['Absent', '', *absent.sum(axis=0).tolist(), '', int(student_absent.sum()), '']
@@ -0,0 +1,250 @@
+"""
+Incremental maintenance of the materialized attendance tables.
+
+- AttendanceSummary: present/absent counts per (student, subject, session year)
+- DailyAttendanceRollup: present/absent/location-verified counts per
+  (subject, session year, date), for trend charts
+
+Every code path that writes AttendanceReport rows (scan, journal flush,
+manual save, update, import and delete) reports its change here, inside the
+same transaction as the write, so dashboards never recount reports; the
+dashboard snapshots that count it are invalidated once it commits.
+Anything that bypasses these paths (e.g. edits in the Django admin) is
+repaired by: python manage.py rebuild_attendance_summary
+"""
+
+import datetime
+from collections import defaultdict, namedtuple
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils.timezone import now
+
+from . import dashboard_cache
+from .models import AttendanceReport, AttendanceSummary, DailyAttendanceRollup
+
+Change = namedtuple('Change', [
+    'student_id', 'subject_id', 'session_year_id', 'date', 'present', 'absent', 'location_verified'
+])
+
+# Backends that share INSERT ... ON CONFLICT DO UPDATE syntax
+UPSERT_VENDORS = {'sqlite', 'postgresql'}
+
+TREND_PERIODS = {'week': TruncWeek, 'month': TruncMonth}
+# Default trend range; a year of daily rollups is a few hundred rows per subject
+TREND_DAYS = 365
+
+
+def _as_bool(value):
+    # Same coercion the model applies on save, so 1/0 and "1"/"0" count correctly
+    return bool(AttendanceReport._meta.get_field('status').to_python(value))
+
+
+def _counts(report):
+    if report is None:
+        return 0, 0, 0
+    status, location_verified = report
+    verified = int(_as_bool(location_verified))
+    return (1, 0, verified) if _as_bool(status) else (0, 1, verified)
+
+
+def change(student_id, subject_id, session_year_id, date, previous, current):
+    """
+    The count deltas for one report.
+
+    Parameters:
+    - date: The attendance date (date or "YYYY-MM-DD")
+    - previous, current: (status, location_verified) of the report before and
+      after the write; None for a new or a deleted report
+
+    Returns:
+    - Change
+    """
+    if isinstance(date, str):
+        date = datetime.date.fromisoformat(date)
+    (was_present, was_absent, was_verified), (present, absent, verified) = _counts(previous), _counts(current)
+    return Change(
+        student_id, subject_id, session_year_id, date,
+        present - was_present, absent - was_absent, verified - was_verified
+    )
+
+
+def record(student_id, subject_id, session_year_id, date, previous, current):
+    """Apply a single report's change (see change())."""
+    apply([change(student_id, subject_id, session_year_id, date, previous, current)])
+
+
+def apply(changes):
+    """Add a batch of Change deltas to the summary and the daily rollup."""
+    summary = defaultdict(lambda: [0, 0])
+    daily = defaultdict(lambda: [0, 0, 0])
+    for item in changes:
+        totals = summary[(item.student_id, item.subject_id, item.session_year_id)]
+        totals[0] += item.present
+        totals[1] += item.absent
+        totals = daily[(item.subject_id, item.session_year_id, item.date)]
+        totals[0] += item.present
+        totals[1] += item.absent
+        totals[2] += item.location_verified
+
+    _add(AttendanceSummary, ('student_id', 'subject_id', 'session_year_id'), ('present', 'absent'), summary)
+    _add(
+        DailyAttendanceRollup, ('subject_id', 'session_year_id', 'date'),
+        ('present', 'absent', 'location_verified'), daily
+    )
+
+    if summary:
+        student_ids = {student_id for student_id, _, _ in summary}
+        subject_ids = {subject_id for _, subject_id, _ in summary}
+        # After commit, so a dashboard rebuilt in between cannot miss the write
+        transaction.on_commit(lambda: dashboard_cache.bump_attendance(student_ids, subject_ids))
+
+
+def _add(model, key_fields, count_fields, totals):
+    rows = [(*key, *counts) for key, counts in totals.items() if any(counts)]
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor in UPSERT_VENDORS:
+        _upsert(connection, model, key_fields, count_fields, rows)
+        return
+    for row in rows:
+        key = dict(zip(key_fields, row))
+        counts = dict(zip(count_fields, row[len(key_fields):]))
+        if _increment(model, key, counts):
+            continue
+        try:
+            with transaction.atomic():
+                model.objects.create(**key, **counts)
+        except IntegrityError:
+            # Another writer created the row first
+            _increment(model, key, counts)
+
+
+def _upsert(connection, model, key_fields, count_fields, rows):
+    # One statement per table whether or not the rows exist yet
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(field) for field in (*key_fields, *count_fields, 'updated_at'))
+    placeholders = ', '.join(['%s'] * (len(key_fields) + len(count_fields) + 1))
+    increments = ', '.join(
+        f"{quote(field)} = {table}.{quote(field)} + excluded.{quote(field)}" for field in count_fields
+    )
+    sql = (
+        f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({', '.join(quote(field) for field in key_fields)}) DO UPDATE SET "
+        f"{increments}, updated_at = excluded.updated_at"
+    )
+    date_field = model._meta.get_field('updated_at')
+    updated_at = date_field.get_db_prep_value(now(), connection)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            tuple(connection.ops.adapt_datefield_value(value) if isinstance(value, datetime.date) else value
+                  for value in row) + (updated_at,)
+            for row in rows
+        ])
+
+
+def _increment(model, key, counts):
+    return model.objects.filter(**key).update(**{field: F(field) + delta for field, delta in counts.items()})
+
+
+def _grouped(reports, *extra):
+    return reports.order_by().values(
+        *extra, 'attendance_id__subject_id', 'attendance_id__session_year_id', 'attendance_id__attendance_date'
+    ).annotate(
+        present=Count('id', filter=Q(status=True)),
+        absent=Count('id', filter=Q(status=False)),
+        location_verified=Count('id', filter=Q(location_verified=True))
+    )
+
+
+def remove_reports(reports):
+    """
+    Subtract a queryset of AttendanceReport rows that is about to be deleted.
+    Counted with one grouped query, whatever the number of reports.
+    """
+    apply(
+        Change(
+            row['student_id'], row['attendance_id__subject_id'], row['attendance_id__session_year_id'],
+            row['attendance_id__attendance_date'], -row['present'], -row['absent'], -row['location_verified']
+        )
+        for row in _grouped(reports, 'student_id')
+    )
+
+
+def expected_rows():
+    """
+    Recount the summary from AttendanceReport.
+
+    Returns:
+    - Dict of (student_id, subject_id, session_year_id) -> (present, absent)
+    """
+    totals = defaultdict(lambda: (0, 0))
+    for row in _grouped(AttendanceReport.objects.all(), 'student_id'):
+        key = (row['student_id'], row['attendance_id__subject_id'], row['attendance_id__session_year_id'])
+        present, absent = totals[key]
+        totals[key] = (present + row['present'], absent + row['absent'])
+    return dict(totals)
+
+
+def expected_daily_rows():
+    """
+    Recount the daily rollup from AttendanceReport.
+
+    Returns:
+    - Dict of (subject_id, session_year_id, date) -> (present, absent, location_verified)
+    """
+    return {
+        (row['attendance_id__subject_id'], row['attendance_id__session_year_id'], row['attendance_id__attendance_date']):
+            (row['present'], row['absent'], row['location_verified'])
+        for row in _grouped(AttendanceReport.objects.all())
+    }
+
+
+def trend(rollups, params):
+    """
+    Weekly or monthly attendance series from DailyAttendanceRollup rows.
+
+    Parameters:
+    - rollups: DailyAttendanceRollup queryset, already limited to what the caller may see
+    - params: Query parameters; period ("week" or "month"), subject,
+      session_year, start and end ("YYYY-MM-DD", default the last TREND_DAYS days)
+
+    Returns:
+    - Dict with the period, date range and one point per period
+
+    Raises:
+    - ValueError for unknown periods or malformed parameters
+    """
+    period = params.get('period') or 'week'
+    if period not in TREND_PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(TREND_PERIODS)}")
+    end = datetime.date.fromisoformat(params['end']) if params.get('end') else datetime.date.today()
+    start = (
+        datetime.date.fromisoformat(params['start']) if params.get('start')
+        else end - datetime.timedelta(days=TREND_DAYS)
+    )
+
+    rollups = rollups.filter(date__range=(start, end))
+    if params.get('subject'):
+        rollups = rollups.filter(subject_id=int(params['subject']))
+    if params.get('session_year'):
+        rollups = rollups.filter(session_year_id=int(params['session_year']))
+
+    grouped = rollups.order_by().annotate(bucket=TREND_PERIODS[period]('date')).values('bucket').annotate(
+        present=Sum('present'), absent=Sum('absent'), location_verified=Sum('location_verified')
+    ).order_by('bucket')
+    series = []
+    for row in grouped:
+        total = row['present'] + row['absent']
+        series.append({
+            "period_start": row['bucket'].isoformat(),
+            "present": row['present'],
+            "absent": row['absent'],
+            "location_verified": row['location_verified'],
+            "total": total,
+            "attendance_rate": round(row['present'] / total * 100, 1) if total else 0.0,
+        })
+    return {"period": period, "start": start.isoformat(), "end": end.isoformat(), "series": series}
@@ -0,0 +1,253 @@
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from . import attendance_summary, enrolment, qr_registry, signed_tokens
+from .checkin_events import get_bus
+from .models import Attendance, AttendanceQRCode, AttendanceReport
+
+
+class CheckInError(Exception):
+    """Raised when a QR scan cannot be turned into an attendance report."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class DuplicateCheckIn(CheckInError):
+    """Raised when the student already has a report for this attendance session."""
+
+
+def _live_codes(**filters):
+    # Active, inside the scanning window, with the subject loaded for the registry
+    current = now()
+    return AttendanceQRCode.objects.select_related('subject').filter(
+        Q(start_time__isnull=True) | Q(start_time__lte=current),
+        is_active=True,
+        expiry_time__gte=current,
+        **filters
+    )
+
+
+def resolve_qr_code(token):
+    """
+    Return the live AttendanceQRCode for a token, or None if it is unknown,
+    inactive, not yet open or expired.
+
+    Tokens are served from the QR registry when possible. On a miss the code
+    is fetched together with its subject and registered for later scans.
+    """
+    if not token:
+        return None
+    qr_code = qr_registry.lookup(token)
+    if qr_code is not None:
+        return qr_code
+    qr_code = _live_codes(token=token).first()
+    if qr_code is not None:
+        qr_registry.register(qr_code)
+    return qr_code
+
+
+async def aresolve_qr_code(token):
+    """Async resolve_qr_code; the registry and a miss's query use the async cache and ORM."""
+    if not token:
+        return None
+    qr_code = await qr_registry.alookup(token)
+    if qr_code is not None:
+        return qr_code
+    qr_code = await _live_codes(token=token).afirst()
+    if qr_code is not None:
+        await qr_registry.aregister(qr_code)
+    return qr_code
+
+
+def _signed_code(signed):
+    # The payload names the code and its subject; expiry and deactivation
+    # still come from the row
+    return _live_codes(id=signed.qr_id, subject_id=signed.subject_id, rotating=True)
+
+
+def resolve_scan(token):
+    """
+    Resolve the token a student scanned to its live AttendanceQRCode.
+
+    Signed rotating tokens have their signature and time window checked
+    without the database, and only tokens that pass load their row. The
+    static token of a rotating code is refused, so a code passed around
+    outside the room cannot be used.
+    """
+    if signed_tokens.is_signed(token):
+        signed = signed_tokens.verify(token)
+        return _signed_code(signed).first() if signed else None
+    qr_code = resolve_qr_code(token)
+    if qr_code is not None and qr_code.rotating:
+        return None
+    return qr_code
+
+
+async def aresolve_scan(token):
+    """Async resolve_scan."""
+    if signed_tokens.is_signed(token):
+        signed = signed_tokens.verify(token)
+        return await _signed_code(signed).afirst() if signed else None
+    qr_code = await aresolve_qr_code(token)
+    if qr_code is not None and qr_code.rotating:
+        return None
+    return qr_code
+
+
+def get_attendance_session(subject_id, session_year_id, attendance_date=None):
+    """
+    Get or create the Attendance row scans record into for the given day.
+
+    Parameters:
+    - subject_id, session_year_id: Primary keys of the scanned code's subject and session
+    - attendance_date: Optional date, defaults to today
+    """
+    attendance_date = attendance_date or datetime.date.today()
+    lookup = {
+        'subject_id_id': subject_id,
+        'session_year_id_id': session_year_id,
+        'attendance_date': attendance_date,
+    }
+    attendance = Attendance.objects.filter(**lookup).first()
+    if attendance is not None:
+        return attendance
+    try:
+        with transaction.atomic():
+            return Attendance.objects.create(**lookup)
+    except IntegrityError:
+        # A concurrent first scan created it; the unique constraint kept it to one row
+        return Attendance.objects.get(**lookup)
+
+
+def _session_cache_key(subject_id, session_year_id, attendance_date):
+    return f"attendance_session_{subject_id}_{session_year_id}_{attendance_date.isoformat()}"
+
+
+def remember_attendance_session(attendance):
+    """
+    Cache an Attendance row's id until the end of its day, so scans insert
+    their reports against it without looking the session up.
+    """
+    day_end = datetime.datetime.combine(attendance.attendance_date + datetime.timedelta(days=1), datetime.time.min)
+    timeout = int((day_end - datetime.datetime.now()).total_seconds())
+    if timeout > 0:
+        cache.set(
+            _session_cache_key(attendance.subject_id_id, attendance.session_year_id_id, attendance.attendance_date),
+            attendance.id,
+            timeout=timeout
+        )
+
+
+def forget_attendance_session(attendance):
+    """Drop an Attendance row's cached id, e.g. once the row is deleted."""
+    cache.delete(
+        _session_cache_key(attendance.subject_id_id, attendance.session_year_id_id, attendance.attendance_date)
+    )
+
+
+def check_in(qr_code, user_id, **report_fields):
+    """
+    Record a present AttendanceReport for the student behind user_id.
+
+    Eligibility is checked against the QR code's enrolment snapshot, which
+    also supplies the student's id. The day's Attendance id comes from the
+    cache (warmed by prepare_class_sessions or the first scan), so the
+    report insert and the attendance summary and daily rollup increments
+    are normally the only queries. Duplicate scans are rejected by the unique
+    (student_id, attendance_id) constraint on insert rather than by a
+    separate existence check, so concurrent scans cannot both succeed.
+
+    With settings.CHECKIN_WRITE_BEHIND enabled the scan is appended to the
+    check-in journal instead and written later in bulk.
+
+    Accepted scans are published on the check-in event bus for the live feed.
+
+    Parameters:
+    - qr_code: Live AttendanceQRCode returned by resolve_qr_code
+    - user_id: CustomUser id of the scanning student
+    - report_fields: Extra AttendanceReport fields (location, verification details)
+
+    Returns:
+    - The created AttendanceReport, or None if the scan was journalled
+    """
+    snapshot = enrolment.get_snapshot(qr_code)
+    student_id = snapshot.student_id(user_id)
+    if student_id is None:
+        raise CheckInError('You are not enrolled in the course for this subject')
+
+    report = None
+    if settings.CHECKIN_WRITE_BEHIND:
+        from .checkin_journal import get_journal
+        get_journal().append(qr_code, user_id, report_fields)
+    else:
+        today = datetime.date.today()
+        session_key = _session_cache_key(qr_code.subject_id, qr_code.session_year_id, today)
+        attendance_id = cache.get(session_key)
+        while True:
+            attendance = None
+            try:
+                with transaction.atomic():
+                    if attendance_id is None:
+                        # Unscheduled class, or a worker whose cache is still cold
+                        attendance = get_attendance_session(qr_code.subject_id, qr_code.session_year_id)
+                        attendance_id = attendance.id
+                    report = AttendanceReport.objects.create(
+                        student_id_id=student_id,
+                        attendance_id_id=attendance_id,
+                        status=True,
+                        **report_fields
+                    )
+                    attendance_summary.record(
+                        student_id, qr_code.subject_id, qr_code.session_year_id, today,
+                        None, (True, report_fields.get('location_verified', False))
+                    )
+            except IntegrityError:
+                if attendance is None and not Attendance.objects.filter(id=attendance_id).exists():
+                    # The cached session was deleted (a foreign key failure, not
+                    # a duplicate); look the day's session up again
+                    cache.delete(session_key)
+                    attendance_id = None
+                    continue
+                raise DuplicateCheckIn('You have already marked attendance for this subject today')
+            break
+        # Only once committed, so a rolled-back session is never cached
+        if attendance is not None:
+            remember_attendance_session(attendance)
+
+    # Live feed for the teacher's screens
+    get_bus().publish(
+        qr_code, user_id, snapshot.name(user_id), report_fields.get('location_verified', False)
+    )
+    return report
+
+
+async def acheck_in(qr_code, user_id, **report_fields):
+    """
+    Async check_in. The async ORM cannot run transactions yet, so the
+    transaction runs in a worker thread while the event loop keeps serving.
+    """
+    return await sync_to_async(check_in)(qr_code, user_id, **report_fields)
+
+
+async def ahas_checked_in(qr_code, user_id):
+    """Whether the student behind user_id already checked in to today's session of qr_code."""
+    today = datetime.date.today()
+    if settings.CHECKIN_WRITE_BEHIND:
+        from .checkin_journal import seen_key
+        # Journalled scans may not have reached the database yet
+        if await cache.aget(seen_key(user_id, qr_code.subject_id, qr_code.session_year_id, today.isoformat())):
+            return True
+    return await AttendanceReport.objects.filter(
+        student_id__admin_id=user_id,
+        attendance_id__subject_id_id=qr_code.subject_id,
+        attendance_id__session_year_id_id=qr_code.session_year_id,
+        attendance_id__attendance_date=today
+    ).aexists()
@@ -0,0 +1,175 @@
+import asyncio
+import contextlib
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from .models import AttendanceReport
+
+# Channels are kept this long after their QR code expires, for late viewers
+RETENTION = datetime.timedelta(minutes=10)
+
+# Seconds before a channel lock left by a publisher that died is released
+LOCK_TIMEOUT = 5
+
+
+def _key(token, part):
+    return f"checkin_feed_{token}_{part}"
+
+
+@contextlib.contextmanager
+def _channel_lock(token):
+    """Serialise appends to one channel across every process sharing the cache."""
+    key = _key(token, 'lock')
+    while not cache.add(key, True, timeout=LOCK_TIMEOUT):
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+class CheckInBus:
+    """
+    Publish/subscribe of accepted check-ins, one channel per QR token.
+
+    A channel is a list of events in the shared cache. Every accepted scan is
+    appended under a short cache lock and numbered by its position, so ids
+    form one sequence whichever server process accepted the scan, and a
+    viewer resuming with Last-Event-ID on another process continues where it
+    left off. Viewers ask for the events after the last id they saw, so any
+    number of teacher pages and projector screens share one history and
+    never query the reports table per event.
+
+    Viewers waiting in the publishing process are woken at once; those in
+    other processes notice on their next poll of the channel's event count,
+    every CHECKIN_FEED_POLL_SECONDS. Each process seeds a channel from the
+    database the first time it serves it, so check-ins recorded before the
+    channel existed (or after it was evicted) are not lost.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._seeded = {}
+
+    def _prune(self):
+        cutoff = now() - RETENTION
+        for token in [token for token, expiry_time in self._seeded.items() if expiry_time < cutoff]:
+            del self._seeded[token]
+
+    def _append(self, qr_code, check_ins):
+        """Add (user_id, name, location_verified, checked_in_at) entries; returns how many were new."""
+        token = qr_code.token
+        timeout = max((qr_code.expiry_time + RETENTION - now()).total_seconds(), 1)
+        with _channel_lock(token):
+            events = cache.get(_key(token, 'events')) or []
+            user_ids = {event['user_id'] for event in events}
+            added = 0
+            for user_id, name, location_verified, checked_in_at in check_ins:
+                # The same student can arrive from the seed and from a publish
+                if user_id in user_ids:
+                    continue
+                user_ids.add(user_id)
+                events.append({
+                    'id': len(events) + 1,
+                    'user_id': user_id,
+                    'name': name,
+                    'location_verified': bool(location_verified),
+                    'time': checked_in_at.isoformat(),
+                })
+                added += 1
+            if added:
+                cache.set_many({_key(token, 'events'): events, _key(token, 'count'): len(events)}, timeout)
+        return added
+
+    def _wake(self, token):
+        with self._lock:
+            waiters = list(self._waiters.get(token, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def publish(self, qr_code, user_id, name, location_verified=False):
+        """Announce an accepted check-in for qr_code and wake every waiting viewer."""
+        try:
+            if not self._append(qr_code, [(user_id, name, location_verified, now())]):
+                return
+        except Exception as e:
+            # The check-in itself is already recorded; the feed catches up from the seed
+            print(f"Check-in feed publish failed: {e}")
+            return
+        self._wake(qr_code.token)
+
+    def seed(self, qr_code):
+        """Load the check-ins already recorded for today's session, once per channel and process."""
+        with self._lock:
+            if qr_code.token in self._seeded:
+                return
+        rows = AttendanceReport.objects.filter(
+            status=True,
+            attendance_id__subject_id_id=qr_code.subject_id,
+            attendance_id__session_year_id_id=qr_code.session_year_id,
+            attendance_id__attendance_date=datetime.date.today()
+        ).order_by('created_at').values_list(
+            'student_id__admin_id', 'student_id__admin__first_name', 'student_id__admin__last_name',
+            'location_verified', 'created_at'
+        )
+        check_ins = [
+            (user_id, f"{first_name} {last_name}".strip(), location_verified, created_at)
+            for user_id, first_name, last_name, location_verified, created_at in rows
+        ]
+        if check_ins and self._append(qr_code, check_ins):
+            self._wake(qr_code.token)
+        with self._lock:
+            self._seeded[qr_code.token] = qr_code.expiry_time
+            self._prune()
+
+    def count(self, token):
+        """Return the number of events in a channel."""
+        return cache.get(_key(token, 'count'), 0)
+
+    def events_after(self, token, after=0):
+        """Return the events of a channel with an id greater than after."""
+        return (cache.get(_key(token, 'events')) or [])[after:]
+
+    async def wait(self, qr_code, after=0, timeout=25.0):
+        """
+        Wait until the channel has events after the given id, or the timeout
+        passes, without holding a thread. Returns the (possibly empty) events.
+        """
+        token = qr_code.token
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        deadline = loop.time() + timeout
+        # Registered before the first check, so a publish in between still wakes it
+        with self._lock:
+            self._waiters.setdefault(token, set()).add(waiter)
+        try:
+            while await cache.aget(_key(token, 'count'), 0) <= after:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), min(remaining, settings.CHECKIN_FEED_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                waiter[1].clear()
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(token)
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[token]
+        return (await cache.aget(_key(token, 'events')) or [])[after:]
+
+
+_bus = CheckInBus()
+
+
+def get_bus():
+    """Return the check-in bus for this process."""
+    return _bus
@@ -0,0 +1,323 @@
+import datetime
+import glob
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+
+from . import attendance_summary
+from .models import AttendanceReport, Students
+
+# The directory lock is optional for deployment
+try:
+    import fcntl
+    LOCKING_AVAILABLE = True
+except ImportError:
+    LOCKING_AVAILABLE = False
+
+ACTIVE_SEGMENT = "journal.log"
+FLUSHING_SUFFIX = ".flushing"
+LOCK_FILE = "journal.lock"
+
+
+class JournalLocked(Exception):
+    """Another journal, in this or another process, is using the directory."""
+
+
+def seen_key(user_id, subject_id, session_year_id, date):
+    """
+    Cache key marking a journalled check-in for one student and session day.
+
+    The mark is only as durable and as shared as the cache: with a per-process
+    cache such as LocMemCache, or after the cache is cleared, a repeat scan is
+    journalled again and only dropped when written (see write_entries).
+    """
+    return "checkin_seen_{}_{}_{}_{}".format(user_id, subject_id, session_year_id, date)
+
+
+class CheckInJournal:
+    """
+    Write-behind buffer for accepted QR check-ins.
+
+    Each accepted scan is appended to a local journal file and fsynced before
+    the request is acknowledged. A background flusher rotates the journal into
+    a ".flushing" segment and inserts its entries with one bulk_create per
+    batch, deleting the segment only after the insert commits. Segments left
+    behind by a crash are picked up again by replay(), or by the next journal
+    opened on the directory.
+
+    Entries are keyed on (student, attendance session). Duplicates are
+    rejected when appended, as far as the cache remembers (see seen_key), and
+    skipped again on insert against the database, so replaying a segment that
+    was already partly written never creates a second report.
+
+    A journal holds an exclusive lock on its directory until close(), so a
+    replay cannot rotate segments under a live web process, and two web
+    processes cannot share a directory; either raises JournalLocked.
+
+    Parameters:
+    - directory: Folder that holds the journal segments
+    - batch_size: Flush once this many entries are pending
+    - max_age: Flush once the oldest pending entry is this many seconds old
+    - fsync: Force each append to disk before acknowledging it
+    - background: Start a flusher thread; when False call flush() yourself
+    """
+
+    def __init__(self, directory, batch_size=100, max_age=2.0, fsync=True, background=True):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.fsync = fsync
+        self.background = background
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, LOCK_FILE), "a")
+        if LOCKING_AVAILABLE:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._lock_file.close()
+                raise JournalLocked(f"The check-in journal in {directory} is in use by another process")
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._file = open(os.path.join(directory, ACTIVE_SEGMENT), "a", encoding="utf-8")
+        self._pending = 0
+        self._oldest = None
+        self._flusher = None
+        # Entries a previous process left behind; replay() refuses while this
+        # journal holds the lock, so they are due on the first flush instead
+        if self._file.tell() or glob.glob(os.path.join(directory, f"*{FLUSHING_SUFFIX}")):
+            self._pending = 1
+            self._oldest = time.monotonic() - max_age
+            if background:
+                self._ensure_flusher()
+
+    def close(self):
+        """Close the active segment and release the directory lock."""
+        with self._lock:
+            self._file.close()
+        self._lock_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def entry_key(entry):
+        return (entry["user_id"], entry["subject_id"], entry["session_year_id"], entry["date"])
+
+    def append(self, qr_code, user_id, report_fields):
+        """
+        Journal an accepted scan for qr_code by user_id.
+
+        Raises DuplicateCheckIn if the same student already checked into the
+        same attendance session.
+        """
+        from .checkin import DuplicateCheckIn
+
+        entry = {
+            "user_id": user_id,
+            "subject_id": qr_code.subject_id,
+            "session_year_id": qr_code.session_year_id,
+            "date": datetime.date.today().isoformat(),
+            "fields": report_fields,
+        }
+        if not cache.add(seen_key(*self.entry_key(entry)), True, timeout=24 * 60 * 60):
+            raise DuplicateCheckIn('You have already marked attendance for this subject today')
+
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            try:
+                self._file.write(line)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception:
+                # Not acknowledged, so the student must be able to scan again
+                cache.delete(seen_key(*self.entry_key(entry)))
+                raise
+            self._pending += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._pending >= self.batch_size:
+                self._wakeup.notify()
+        if self.background:
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run_flusher, name="checkin-flusher", daemon=True)
+            self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            with self._lock:
+                while not self._due():
+                    self._wakeup.wait(timeout=self.max_age)
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception as e:
+                # Segments stay on disk and are retried on the next pass
+                print(f"Check-in journal flush failed: {e}")
+                time.sleep(self.max_age)
+            finally:
+                close_old_connections()
+
+    def _due(self):
+        if not self._pending:
+            return False
+        if self._pending >= self.batch_size:
+            return True
+        return time.monotonic() - self._oldest >= self.max_age
+
+    def _rotate(self):
+        """Move the active segment aside so new scans go to a fresh file."""
+        with self._lock:
+            if not self._pending:
+                return
+            self._file.close()
+            segment = os.path.join(self.directory, f"journal.{time.time_ns()}.log{FLUSHING_SUFFIX}")
+            os.replace(os.path.join(self.directory, ACTIVE_SEGMENT), segment)
+            self._file = open(os.path.join(self.directory, ACTIVE_SEGMENT), "a", encoding="utf-8")
+            self._pending = 0
+            self._oldest = None
+
+    def flush(self):
+        """
+        Write every journalled entry to the database.
+
+        Returns:
+        - Number of AttendanceReport rows inserted
+        """
+        with self._flush_lock:
+            self._rotate()
+            inserted = 0
+            for segment in sorted(glob.glob(os.path.join(self.directory, f"*{FLUSHING_SUFFIX}"))):
+                inserted += self._flush_segment(segment)
+                os.unlink(segment)
+            return inserted
+
+    def replay(self):
+        """
+        Flush whatever a previous process left in the journal directory,
+        including the active segment. Use after a crash or restart.
+        """
+        with self._lock:
+            if os.path.getsize(os.path.join(self.directory, ACTIVE_SEGMENT)):
+                self._pending = max(self._pending, 1)
+        return self.flush()
+
+    def _flush_segment(self, segment):
+        with open(segment, encoding="utf-8") as f:
+            entries = []
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A torn final line from a crash mid-write
+                    print(f"Skipping unreadable journal line in {segment}")
+        inserted = 0
+        for start in range(0, len(entries), self.batch_size):
+            inserted += write_entries(entries[start:start + self.batch_size])
+        return inserted
+
+
+def write_entries(entries):
+    """
+    Insert journal entries as AttendanceReport rows with one bulk_create.
+    Entries whose (student, attendance) pair already exists are skipped, and
+    only rows actually inserted count towards the attendance summary.
+
+    Returns:
+    - Number of rows inserted
+    """
+    from .checkin import get_attendance_session
+
+    unique = {}
+    for entry in entries:
+        unique.setdefault(CheckInJournal.entry_key(entry), entry)
+    if not unique:
+        return 0
+
+    students = dict(
+        Students.objects.filter(admin_id__in={entry["user_id"] for entry in unique.values()})
+        .values_list("admin_id", "id")
+    )
+
+    with transaction.atomic():
+        sessions = {}
+        for entry in unique.values():
+            session_key = (entry["subject_id"], entry["session_year_id"], entry["date"])
+            if session_key not in sessions:
+                sessions[session_key] = get_attendance_session(
+                    entry["subject_id"], entry["session_year_id"], datetime.date.fromisoformat(entry["date"])
+                ).id
+
+        reports = []
+        for entry in unique.values():
+            student_id = students.get(entry["user_id"])
+            if student_id is None:
+                print(f"Skipping journalled check-in for unknown student user {entry['user_id']}")
+                continue
+            session_key = (entry["subject_id"], entry["session_year_id"], entry["date"])
+            reports.append((student_id, sessions[session_key], session_key, entry["fields"]))
+
+        already_recorded = set(
+            AttendanceReport.objects.filter(
+                attendance_id__in={attendance_id for _, attendance_id, _, _ in reports},
+                student_id__in={student_id for student_id, _, _, _ in reports},
+            ).values_list("student_id", "attendance_id")
+        )
+        reports = [report for report in reports if report[:2] not in already_recorded]
+        try:
+            with transaction.atomic():
+                AttendanceReport.objects.bulk_create([_report(*report) for report in reports])
+        except IntegrityError:
+            # A live check-in recorded some of these since the check above;
+            # insert one at a time to find which
+            inserted = []
+            for report in reports:
+                try:
+                    with transaction.atomic():
+                        _report(*report).save()
+                except IntegrityError:
+                    continue
+                inserted.append(report)
+            reports = inserted
+        attendance_summary.apply(
+            attendance_summary.change(
+                student_id, subject_id, session_year_id, date, None, (True, fields.get("location_verified", False))
+            )
+            for student_id, _, (subject_id, session_year_id, date), fields in reports
+        )
+    return len(reports)
+
+
+def _report(student_id, attendance_id, session_key, fields):
+    return AttendanceReport(student_id_id=student_id, attendance_id_id=attendance_id, status=True, **fields)
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Return the process-wide journal configured from settings."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = CheckInJournal(
+                settings.CHECKIN_JOURNAL_DIR,
+                batch_size=settings.CHECKIN_BATCH_SIZE,
+                max_age=settings.CHECKIN_BATCH_MAX_AGE,
+                fsync=settings.CHECKIN_JOURNAL_FSYNC,
+            )
+        return _journal
@@ -0,0 +1,254 @@
+"""
+Snapshot cache for the home dashboards.
+
+The computed context of admin_home, staff_home and student_home is cached
+per role and entity (e.g. "staff", user id 7) together with the version
+counters it was built from:
+
+- ("student", id): attendance of that student, or the student's enrolment
+- ("course", id): attendance in any subject of the course, or its subjects
+  and students changing
+- ("attendance",): any attendance write
+- ("enrolment",): courses, subjects, staff, students or session years changing
+- ("all",): every snapshot depends on it; see invalidate_all()
+
+Writers bump the counters (bump_attendance(), bump_enrolment()); nothing is
+deleted. A snapshot whose counters no longer match is stale: it is still
+served, and rebuilt in the background, for up to DASHBOARD_STALE_SECONDS
+after it was invalidated, so a burst of check-ins does not make every
+dashboard load recount. Each bump records when it happened, and a snapshot
+counts as invalidated from the latest bump of its changed counters as first
+seen, so later bumps do not extend the window. Snapshots invalidated
+longer ago are rebuilt in the request.
+
+Chart panels are not part of the page context: each one fetches its own
+snapshot from a JSON endpoint after the page has rendered (chart_data(),
+chart_response()).
+
+This module must stay importable from models.py, so it loads models lazily.
+"""
+
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+SNAPSHOT_PREFIX = 'dashboard_snapshot'
+VERSION_PREFIX = 'dashboard_version'
+BUMPED_PREFIX = 'dashboard_bumped'
+# Counters outlive snapshots; an evicted counter restarts from a fresh value
+VERSION_TIMEOUT = 7 * 24 * 3600
+# Longest a background rebuild may hold its lock
+REFRESH_LOCK_SECONDS = 30
+
+# Snapshot counters for this process; read them with stats()
+_counters = {'hits': 0, 'stale': 0, 'misses': 0, 'refreshes': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _version_key(dep):
+    return '_'.join((VERSION_PREFIX, *map(str, dep)))
+
+
+def _bumped_key(dep):
+    return '_'.join((BUMPED_PREFIX, *map(str, dep)))
+
+
+def _versions(deps):
+    keys = [_version_key(dep) for dep in deps]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # A new or evicted counter must never match an older snapshot
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+        found.update(cache.get_many(missing))
+    return [found.get(key) for key in keys]
+
+
+def stamp(deps):
+    """
+    The current value of the given counters, as a string that changes
+    whenever any of them is bumped; ("all",) is always included. For caches
+    outside this module that must follow the same invalidations.
+    """
+    return '-'.join(map(str, _versions([('all',), *(tuple(dep) for dep in deps)])))
+
+
+def bump(*deps):
+    """Invalidate every snapshot built from any of the given counters."""
+    # Recorded first, so a snapshot seen stale never finds an older time
+    cache.set_many({_bumped_key(dep): time.time() for dep in deps}, timeout=VERSION_TIMEOUT)
+    for dep in deps:
+        key = _version_key(dep)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=VERSION_TIMEOUT)
+
+
+def invalidate_all():
+    """Invalidate every snapshot, e.g. after the summary tables were rebuilt."""
+    bump(('all',))
+
+
+def _subject_courses(subject_ids):
+    from .models import Subjects
+
+    keys = {subject_id: f"dashboard_subject_course_{subject_id}" for subject_id in subject_ids}
+    found = cache.get_many(keys.values())
+    courses = {subject_id: found[key] for subject_id, key in keys.items() if key in found}
+    missing = [subject_id for subject_id in subject_ids if subject_id not in courses]
+    if missing:
+        loaded = dict(Subjects.objects.filter(id__in=missing).values_list('id', 'course_id'))
+        cache.set_many({keys[subject_id]: course_id for subject_id, course_id in loaded.items()})
+        courses.update(loaded)
+    return courses
+
+
+def bump_attendance(student_ids, subject_ids):
+    """Invalidate the dashboards that count attendance of these students in these subjects."""
+    subject_ids = set(subject_ids)
+    courses = set(_subject_courses(subject_ids).values()) if subject_ids else set()
+    bump(
+        ('attendance',),
+        *(('student', student_id) for student_id in set(student_ids)),
+        *(('course', course_id) for course_id in courses)
+    )
+
+
+def bump_enrolment(student_ids=(), course_ids=(), subject_ids=()):
+    """Invalidate the dashboards that show these students, courses or subjects."""
+    for subject_id in subject_ids:
+        cache.delete(f"dashboard_subject_course_{subject_id}")
+    bump(
+        ('enrolment',),
+        *(('student', student_id) for student_id in set(student_ids)),
+        *(('course', course_id) for course_id in set(course_ids) if course_id is not None)
+    )
+
+
+def _snapshot_key(role, entity):
+    return f"{SNAPSHOT_PREFIX}_{role}_{entity}"
+
+
+def _build(key, builder, known_deps=None):
+    # Read the counters before counting, so a write that lands mid-build
+    # leaves the new snapshot stale rather than hiding the write
+    before = _versions(known_deps) if known_deps else None
+    context, deps = builder()
+    deps = [('all',), *(tuple(dep) for dep in deps)]
+    versions = before if deps == known_deps else _versions(deps)
+    entry = {'context': context, 'deps': deps, 'versions': versions, 'built_at': time.time()}
+    cache.set(key, entry, timeout=settings.DASHBOARD_SNAPSHOT_TTL)
+    return entry
+
+
+def _invalidated_at(key, entry, versions):
+    """When the snapshot went stale, fixed the first time it is seen stale."""
+    changed = [dep for dep, built, current in zip(entry['deps'], entry['versions'], versions) if built != current]
+    bumped = cache.get_many([_bumped_key(dep) for dep in changed])
+    # A counter whose bump time was evicted counts as invalidated long ago
+    invalidated_at = max((bumped.get(_bumped_key(dep), 0) for dep in changed), default=0)
+    return cache.get_or_set(
+        f"{key}_stale_{entry['built_at']}", invalidated_at, timeout=settings.DASHBOARD_SNAPSHOT_TTL
+    )
+
+
+def _refresh(key, builder, known_deps):
+    try:
+        close_old_connections()
+        _build(key, builder, known_deps)
+        _count('refreshes')
+    except Exception as e:
+        # The stale snapshot stays in place; the next request retries
+        print(f"Dashboard refresh failed for {key}: {e}")
+    finally:
+        cache.delete(f"{key}_refreshing")
+        close_old_connections()
+
+
+def _spawn(target):
+    threading.Thread(target=target, name="dashboard-refresh", daemon=True).start()
+
+
+def snapshot(role, entity, builder):
+    """
+    The cached dashboard context for one role and entity.
+
+    Parameters:
+    - role: "admin", "staff" or "student", or a chart within one, e.g. "admin_chart_courses"
+    - entity: What the context is for within the role, e.g. the user id
+    - builder: Callable returning (context, deps); deps is the list of
+      version counters (see the module docstring) the context depends on.
+      The context must be picklable plain data.
+
+    Returns:
+    - The context dict
+    """
+    if not settings.DASHBOARD_CACHE:
+        return builder()[0]
+
+    key = _snapshot_key(role, entity)
+    entry = cache.get(key)
+    if entry is not None:
+        versions = _versions(entry['deps'])
+        if versions == entry['versions']:
+            _count('hits')
+            return entry['context']
+        if time.time() - _invalidated_at(key, entry, versions) < settings.DASHBOARD_STALE_SECONDS:
+            # One rebuild per snapshot; everyone else keeps the stale copy meanwhile
+            if cache.add(f"{key}_refreshing", 1, timeout=REFRESH_LOCK_SECONDS):
+                _spawn(lambda: _refresh(key, builder, entry['deps']))
+            _count('stale')
+            return entry['context']
+
+    _count('misses')
+    return _build(key, builder, entry and entry['deps'])['context']
+
+
+def chart_data(labels, datasets):
+    """
+    Chart.js data for a panel.
+
+    Parameters:
+    - labels: The x-axis (or slice) labels
+    - datasets: List of (label, values) pairs
+
+    Returns:
+    - Dict with labels and datasets, as the dashboard chart loader expects
+    """
+    return {
+        "labels": list(labels),
+        "datasets": [{"label": label, "data": list(values)} for label, values in datasets],
+    }
+
+
+def chart_response(request, data):
+    """
+    JSON response for a chart panel. The ETag is taken from the body, so a
+    browser revalidating an unchanged chart gets a 304 without the data.
+    """
+    response = JsonResponse({"status": "success", **data})
+    etag = quote_etag(hashlib.sha256(response.content).hexdigest()[:32])
+    response['ETag'] = etag
+    # Private per user; always revalidate, since the snapshot may have moved on
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def stats():
+    """Return a snapshot of the dashboard cache counters for this process."""
+    with _counters_lock:
+        return dict(_counters)
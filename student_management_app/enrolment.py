@@ -0,0 +1,72 @@
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from .models import Students
+
+
+class EnrolmentSnapshot:
+    """
+    The students allowed to check in to one QR code, captured when it is
+    generated. The subject's course and the session year cannot change for
+    the code's lifetime, so neither can this set.
+
+    Maps CustomUser id to Students id, so a scan can both check eligibility
+    and insert its report without looking the student up again. Display
+    names are kept alongside for the live check-in feed.
+    """
+
+    __slots__ = ('students', 'names')
+
+    def __init__(self, students, names=None):
+        self.students = dict(students)
+        self.names = dict(names or {})
+
+    def __contains__(self, user_id):
+        return user_id in self.students
+
+    def __len__(self):
+        return len(self.students)
+
+    def student_id(self, user_id):
+        """Students id for a CustomUser id, or None if the user is not enrolled."""
+        return self.students.get(user_id)
+
+    def name(self, user_id):
+        return self.names.get(user_id, '')
+
+
+def _cache_key(token):
+    return f"qr_enrolment_{token}"
+
+
+def build(course_id, session_year_id):
+    """Read the students enrolled in a course for a session year in one query."""
+    rows = Students.objects.filter(course_id_id=course_id, session_year_id_id=session_year_id).values_list(
+        'admin_id', 'id', 'admin__first_name', 'admin__last_name'
+    )
+    students = {}
+    names = {}
+    for user_id, student_id, first_name, last_name in rows:
+        students[user_id] = student_id
+        names[user_id] = f"{first_name} {last_name}".strip()
+    return EnrolmentSnapshot(students, names)
+
+
+def snapshot(qr_code):
+    """
+    Capture and cache the enrolment for a live AttendanceQRCode until its
+    expiry_time. The subject must already be loaded on the instance.
+    """
+    enrolment = build(qr_code.subject.course_id_id, qr_code.session_year_id)
+    timeout = int((qr_code.expiry_time - now()).total_seconds())
+    if timeout > 0:
+        cache.set(_cache_key(qr_code.token), enrolment, timeout=timeout)
+    return enrolment
+
+
+def get_snapshot(qr_code):
+    """Return the cached enrolment for a QR code, capturing it again on a miss."""
+    enrolment = cache.get(_cache_key(qr_code.token))
+    if enrolment is None:
+        enrolment = snapshot(qr_code)
+    return enrolment
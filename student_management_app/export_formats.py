@@ -0,0 +1,141 @@
+"""
+File formats for attendance exports.
+
+Every format is written from the same columnar row source (see
+attendance_export): a list of column names and an iterator of tuples in
+that order.
+
+- csv and jsonl are encoded TEXT_BATCH_ROWS rows at a time and streamed
+- parquet is written in row groups of PARQUET_ROW_GROUP rows with pyarrow,
+  when it is installed; each group is sent as soon as it is written
+- xlsx is a header row and the raw rows (the staff and student exports
+  keep their report layout; see utils.export_attendance_to_excel)
+
+The students x dates grid is written by utils.export_attendance_matrix, as
+xlsx or csv.
+"""
+
+import csv
+import io
+import json
+from itertools import chain, islice
+
+from django.http import StreamingHttpResponse
+from openpyxl.styles import Font
+
+from . import xlsx_stream
+
+# Parquet support is optional for deployment
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+# Format -> (content type, file extension)
+FORMATS = {
+    'xlsx': (xlsx_stream.CONTENT_TYPE, 'xlsx'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+# One row per report, or the students x dates grid (attendance_export.matrix())
+LAYOUTS = ('rows', 'matrix')
+MATRIX_FORMATS = ('xlsx', 'csv')
+
+TEXT_BATCH_ROWS = 500
+PARQUET_ROW_GROUP = 50000
+
+
+def check_format(fmt, layout='rows'):
+    """
+    Raises:
+    - ValueError if fmt or layout is unknown, fmt needs a library that is not
+      installed, or the layout cannot be written in fmt
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        raise ValueError("Parquet export needs pyarrow, which is not installed")
+    if layout not in LAYOUTS:
+        raise ValueError(f"layout must be one of: {', '.join(LAYOUTS)}")
+    if layout == 'matrix' and fmt not in MATRIX_FORMATS:
+        raise ValueError(f"The grid layout is available as: {', '.join(MATRIX_FORMATS)}")
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def stream_csv(columns, rows, types=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in _batches(rows, TEXT_BATCH_ROWS):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_jsonl(columns, rows, types=None):
+    for batch in _batches(rows, TEXT_BATCH_ROWS):
+        # Dates as ISO strings
+        yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in batch).encode('utf-8')
+
+
+def stream_xlsx(columns, rows, types=None):
+    header = [xlsx_stream.Styled(column, Font(bold=True)) for column in columns]
+    return xlsx_stream.stream_workbook(chain([header], rows), sheet_title="Attendance")
+
+
+def stream_parquet(columns, rows, types=None):
+    arrow_types = {'date': pa.date32(), 'int': pa.int64(), 'bool': pa.bool_()}
+    schema = pa.schema([(column, arrow_types.get((types or {}).get(column), pa.string())) for column in columns])
+    sink = xlsx_stream.ByteSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for batch in _batches(rows, PARQUET_ROW_GROUP):
+        arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    # The footer, with the schema and row group index
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    'xlsx': stream_xlsx,
+    'csv': stream_csv,
+    'jsonl': stream_jsonl,
+    'parquet': stream_parquet,
+}
+
+
+def response(fmt, columns, rows, filename, types=None):
+    """
+    Stream rows as a file download.
+
+    Parameters:
+    - fmt: A key of FORMATS, already checked with check_format()
+    - columns: Column names, in row order
+    - rows: Iterator of tuples
+    - filename: Download name without the extension
+    - types: Optional dict of column -> 'date', 'int' or 'bool' for typed
+      formats; other columns are text
+
+    Returns:
+    - StreamingHttpResponse
+    """
+    content_type, extension = FORMATS[fmt]
+    http_response = StreamingHttpResponse(WRITERS[fmt](columns, rows, types), content_type=content_type)
+    http_response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return http_response
@@ -0,0 +1,423 @@
+"""
+Background attendance exports.
+
+An export that may take longer than a request is allowed to (a term of
+several subjects, or every course) is queued as an ExportJob and built into
+a local file under EXPORT_JOB_DIR, which is not served as media. The browser
+polls the job's status and downloads the file when it is done.
+
+- Jobs run on EXPORT_JOB_WORKERS threads in the web process that queued
+  them, or, with EXPORT_JOB_WORKERS = 0, in: python manage.py run_export_jobs
+- A job's key hashes its kind, format and parameters together with the
+  dashboard version counters its rows depend on (dashboard_cache.stamp()).
+  An identical request gets the queued, running or finished job with the
+  same key instead of a new one, until the data changes or EXPORT_JOB_TTL
+  passes.
+- A running job records its progress every attendance_export.CHUNK_SIZE
+  rows; one that has not moved for EXPORT_JOB_STALE_SECONDS (its worker
+  died) is queued again.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import FileSystemStorage
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+from django.utils.timezone import now
+
+from . import attendance_export, dashboard_cache, export_formats
+from .models import AttendanceReport, ExportJob, Students, Subjects
+from .utils import export_attendance_matrix, export_attendance_to_excel
+
+KINDS = ('staff', 'student', 'admin')
+
+# What a job's parameters select, and how each format writes it
+Export = namedtuple('Export', ['reports', 'filename', 'deps', 'columns', 'rows', 'report', 'matrix'], defaults=(False,))
+
+# Job counters for this process; read them with stats()
+_counters = {'queued': 0, 'deduplicated': 0, 'built': 0, 'failed': 0}
+_counters_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def export_storage():
+    """Storage for finished export files."""
+    return FileSystemStorage(location=settings.EXPORT_JOB_DIR)
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def params_for(kind, data, user):
+    """
+    The job parameters for an export request, in one canonical form so
+    identical requests hash alike.
+
+    Parameters:
+    - kind: One of KINDS
+    - data: The request data, with the same fields as the direct export endpoints
+    - user: The requesting user; a student's export is always their own, and
+      a staff export must be of one of their subjects
+
+    Returns:
+    - Dict of JSON-serializable parameters
+
+    Raises:
+    - ValueError for missing or malformed parameters, or another staff member's subject
+    """
+    if kind == 'staff':
+        if not all(data.get(field) for field in ('subject', 'session_year', 'start_date', 'end_date')):
+            raise ValueError("Missing required fields")
+        subject = int(data['subject'])
+        if not Subjects.objects.filter(id=subject, staff_id__admin=user).exists():
+            raise ValueError("You don't have permission to export this subject")
+        return {
+            'subject': subject,
+            'session_year': int(data['session_year']),
+            'start_date': _date(data['start_date']),
+            'end_date': _date(data['end_date']),
+            'layout': data.get('layout') or 'rows',
+        }
+    if kind == 'student':
+        if not data.get('start_date') or not data.get('end_date'):
+            raise ValueError("Date range is required")
+        return {
+            'student': user.id,
+            'subject': int(data.get('subject') or 0),
+            'start_date': _date(data['start_date']),
+            'end_date': _date(data['end_date']),
+        }
+    if kind == 'admin':
+        params = {field: _date(data[field]) for field in ('start_date', 'end_date') if data.get(field)}
+        params.update({field: int(data[field]) for field in ('course', 'subject', 'session_year') if data.get(field)})
+        return params
+    raise ValueError(f"kind must be one of: {', '.join(KINDS)}")
+
+
+def _date_range(params):
+    start_date = datetime.date.fromisoformat(params['start_date'])
+    end_date = datetime.date.fromisoformat(params['end_date'])
+    return start_date, end_date
+
+
+def _staff_export(params):
+    subject = Subjects.objects.get(id=params['subject'])
+    start_date, end_date = _date_range(params)
+    reports = AttendanceReport.objects.filter(
+        attendance_id__subject_id=subject.id,
+        attendance_id__session_year_id=params['session_year'],
+        attendance_id__attendance_date__range=(start_date, end_date)
+    )
+    matrix = params.get('layout') == 'matrix'
+    return Export(
+        reports,
+        f"attendance_{subject.subject_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+        + ("_grid" if matrix else ""),
+        [('course', subject.course_id_id), ('enrolment',)],
+        attendance_export.STAFF_COLUMNS, attendance_export.staff_rows,
+        {'subject_name': subject.subject_name, 'date_range': f"{start_date} to {end_date}"},
+        matrix
+    )
+
+
+def _student_export(params):
+    student = Students.objects.select_related('admin').get(admin=params['student'])
+    start_date, end_date = _date_range(params)
+    reports = AttendanceReport.objects.filter(
+        student_id=student.id, attendance_id__attendance_date__range=(start_date, end_date)
+    )
+    if params['subject']:
+        subject_name = Subjects.objects.get(id=params['subject']).subject_name
+        reports = reports.filter(attendance_id__subject_id=params['subject'])
+    else:
+        subject_name = "All Subjects"
+        reports = reports.filter(attendance_id__subject_id__course_id=student.course_id_id)
+    student_name = f"{student.admin.first_name}_{student.admin.last_name}"
+    return Export(
+        reports,
+        f"attendance_{student_name}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}",
+        [('student', student.id), ('enrolment',)],
+        attendance_export.STUDENT_COLUMNS, attendance_export.student_rows,
+        {'subject_name': subject_name, 'date_range': f"{start_date} to {end_date}", 'for_student': True}
+    )
+
+
+def _admin_export(params):
+    reports = AttendanceReport.objects.all()
+    if params.get('start_date'):
+        reports = reports.filter(attendance_id__attendance_date__gte=params['start_date'])
+    if params.get('end_date'):
+        reports = reports.filter(attendance_id__attendance_date__lte=params['end_date'])
+    if params.get('course'):
+        reports = reports.filter(attendance_id__subject_id__course_id=params['course'])
+    if params.get('subject'):
+        reports = reports.filter(attendance_id__subject_id=params['subject'])
+    if params.get('session_year'):
+        reports = reports.filter(attendance_id__session_year_id=params['session_year'])
+    return Export(
+        reports, f"attendance_{datetime.date.today().strftime('%Y%m%d')}",
+        [('attendance',), ('enrolment',)],
+        attendance_export.HOD_COLUMNS, attendance_export.hod_rows, None
+    )
+
+
+EXPORTS = {'staff': _staff_export, 'student': _student_export, 'admin': _admin_export}
+
+
+def resolve(kind, params):
+    """
+    What an export's parameters (see params_for()) select.
+
+    Returns:
+    - Export: the AttendanceReport queryset, the download name without its
+      extension, the version counters it depends on, its flat columns and
+      row source, the report layout's arguments for xlsx (None for a flat
+      sheet), and whether it is the students x dates grid instead
+
+    Raises:
+    - ObjectDoesNotExist if the subject or student is gone
+    """
+    return EXPORTS[kind](params)
+
+
+def chunks(fmt, export, progress=None):
+    """The export's file in the given format, as an iterator of bytes chunks."""
+    if export.matrix:
+        return export_attendance_matrix(export.reports, fmt)
+    if fmt == 'xlsx' and export.report is not None:
+        return export_attendance_to_excel(export.reports, progress=progress, **export.report)
+    return export_formats.WRITERS[fmt](
+        list(export.columns), export.rows(export.reports, progress), attendance_export.COLUMN_TYPES
+    )
+
+
+def _key(kind, fmt, params, deps):
+    data = json.dumps([kind, fmt, params, dashboard_cache.stamp(deps)], sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def enqueue(user, kind, fmt, params):
+    """
+    Queue an export, or find the job already building or holding it.
+
+    Parameters:
+    - user: The requesting user, recorded on a new job
+    - kind: One of KINDS
+    - fmt: A key of export_formats.FORMATS, already checked
+    - params: From params_for()
+
+    Returns:
+    - ExportJob
+
+    Raises:
+    - ValueError if the selection is gone or has no attendance to export
+    """
+    try:
+        export = resolve(kind, params)
+    except ObjectDoesNotExist as e:
+        raise ValueError(str(e))
+    key = _key(kind, fmt, params, export.deps)
+    requeue_stale()
+
+    job = ExportJob.objects.filter(
+        key=key, created_at__gte=now() - datetime.timedelta(seconds=settings.EXPORT_JOB_TTL)
+    ).exclude(status=ExportJob.FAILED).order_by('-created_at').first()
+    if job is not None and (job.status != ExportJob.DONE or export_storage().exists(job.file)):
+        _count('deduplicated')
+        if job.status == ExportJob.QUEUED:
+            # Harmless if it is already waiting for a worker; run() claims each job once
+            _submit(job.id)
+        return job
+
+    if kind != 'admin' and not export.reports.exists():
+        raise ValueError("No attendance records found for the selected criteria")
+    extension = export_formats.FORMATS[fmt][1]
+    job = ExportJob.objects.create(
+        user=user, kind=kind, format=fmt, params=params, key=key, filename=f"{export.filename}.{extension}"
+    )
+    _count('queued')
+    _submit(job.id)
+    return job
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.EXPORT_JOB_WORKERS, thread_name_prefix='export-job')
+        return _pool
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run(job_id)
+    finally:
+        close_old_connections()
+
+
+def _submit(job_id):
+    if settings.EXPORT_JOB_WORKERS:
+        # After commit, so the worker's connection can see the job
+        transaction.on_commit(lambda: _get_pool().submit(_run_in_thread, job_id))
+
+
+def _write(name, file_chunks):
+    path = export_storage().path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Readers only ever see a complete file
+    partial = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(partial, 'wb') as output:
+            for chunk in file_chunks:
+                output.write(chunk)
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+
+
+def run(job_id):
+    """
+    Build one queued job's file.
+
+    Returns:
+    - False if the job was not queued, e.g. another worker claimed it first
+    """
+    if not ExportJob.objects.filter(id=job_id, status=ExportJob.QUEUED).update(
+        status=ExportJob.RUNNING, rows_written=0, updated_at=now()
+    ):
+        return False
+    job = ExportJob.objects.get(id=job_id)
+    jobs = ExportJob.objects.filter(id=job_id)
+    try:
+        export = resolve(job.kind, job.params)
+        rows_total = export.reports.count()
+        jobs.update(rows_total=rows_total, updated_at=now())
+
+        def progress(count):
+            jobs.update(rows_written=count, updated_at=now())
+
+        name = f"{job.key}.{export_formats.FORMATS[job.format][1]}"
+        _write(name, chunks(job.format, export, progress))
+        jobs.update(status=ExportJob.DONE, file=name, rows_written=rows_total, updated_at=now(), finished_at=now())
+        _count('built')
+    except Exception as e:
+        print(f"Export job {job_id} failed: {e}")
+        jobs.update(status=ExportJob.FAILED, error=str(e), updated_at=now(), finished_at=now())
+        _count('failed')
+    return True
+
+
+def requeue_stale():
+    """
+    Queue running jobs again whose progress stopped, e.g. because their
+    process exited, and hand each to this process's workers.
+
+    Returns:
+    - The number of jobs queued again
+    """
+    cutoff = now() - datetime.timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS)
+    stale = ExportJob.objects.filter(status=ExportJob.RUNNING, updated_at__lt=cutoff)
+    job_ids = list(stale.values_list('id', flat=True))
+    count = stale.filter(id__in=job_ids).update(status=ExportJob.QUEUED, updated_at=now())
+    for job_id in job_ids:
+        # A job another process requeued first is skipped by run()
+        _submit(job_id)
+    return count
+
+
+def run_pending(limit=None):
+    """
+    Build queued jobs, oldest first, in this process.
+
+    Returns:
+    - The number of jobs run
+    """
+    requeue_stale()
+    count = 0
+    while limit is None or count < limit:
+        job_id = ExportJob.objects.filter(status=ExportJob.QUEUED).order_by('created_at').values_list(
+            'id', flat=True
+        ).first()
+        if job_id is None:
+            break
+        if run(job_id):
+            count += 1
+    return count
+
+
+def purge_expired():
+    """
+    Delete jobs older than EXPORT_JOB_TTL, and their files.
+
+    Returns:
+    - The number of jobs deleted
+    """
+    expired = ExportJob.objects.filter(created_at__lt=now() - datetime.timedelta(seconds=settings.EXPORT_JOB_TTL))
+    files = set(expired.exclude(file='').values_list('file', flat=True))
+    count, _ = expired.delete()
+    storage = export_storage()
+    # A newer job with the same key may share the file
+    for name in files - set(ExportJob.objects.filter(file__in=files).values_list('file', flat=True)):
+        storage.delete(name)
+    return count
+
+
+def can_access(user, job):
+    """
+    Whether user may see a job. Jobs are shared by everyone who asks for
+    the same export, so this is whether user could have queued it: a staff
+    job is visible to its creator and to whoever teaches its subject now.
+    """
+    if job.kind == 'admin':
+        return user.user_type == '1'
+    if job.kind == 'staff':
+        return user.user_type == '2' and (
+            job.user_id == user.id
+            or Subjects.objects.filter(id=job.params.get('subject'), staff_id__admin=user).exists()
+        )
+    return user.user_type == '3' and job.params.get('student') == user.id
+
+
+def describe(job):
+    """The job's state, for the status endpoint."""
+    if job.status == ExportJob.DONE:
+        progress = 100
+    else:
+        progress = round(job.rows_written / job.rows_total * 100) if job.rows_total else 0
+    return {
+        "id": str(job.id),
+        "status": job.status,
+        "format": job.format,
+        "filename": job.filename,
+        "rows_total": job.rows_total,
+        "rows_written": job.rows_written,
+        "progress": progress,
+        "error": job.error,
+        "status_url": reverse('export_job_status', args=[job.id]),
+        "download_url": reverse('export_job_download', args=[job.id]) if job.status == ExportJob.DONE else None,
+    }
+
+
+def stats():
+    """Return a snapshot of the export job counters for this process."""
+    with _counters_lock:
+        return dict(_counters)
@@ -0,0 +1,138 @@
+import math
+
+import numpy as np
+from geopy.distance import geodesic
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = (1 / 298.257223563) * (2 - 1 / 298.257223563)
+
+# Haversine on the Gaussian radius of curvature at the mean latitude stays
+# within 0.34% of the WGS84 geodesic for distances up to a few kilometres,
+# i.e. about 0.34 m at 100 m. Decisions closer than this to a threshold are
+# re-checked with geopy's geodesic so results match the geodesic exactly.
+RELATIVE_ERROR = 0.0035
+ABSOLUTE_ERROR = 0.001  # meters
+
+# Error margin used when neither side reports a GPS accuracy
+DEFAULT_ERROR_MARGIN = 10
+
+
+def _gaussian_radius(mean_lat_rad):
+    sin2 = np.sin(mean_lat_rad) ** 2
+    meridional = WGS84_A * (1 - WGS84_E2) / (1 - WGS84_E2 * sin2) ** 1.5
+    normal = WGS84_A / np.sqrt(1 - WGS84_E2 * sin2)
+    return np.sqrt(meridional * normal)
+
+
+def _haversine_scalar(lat1, lon1, lat2, lon2):
+    # Same formula as haversine_distance using math, which is much faster
+    # than NumPy for a single pair of points
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    sin2 = math.sin((phi1 + phi2) / 2) ** 2
+    radius = math.sqrt(
+        WGS84_A * (1 - WGS84_E2) / (1 - WGS84_E2 * sin2) ** 1.5
+        * WGS84_A / math.sqrt(1 - WGS84_E2 * sin2)
+    )
+    h = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * radius * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Distance in meters between coordinates using haversine on a local
+    ellipsoidal radius. Accepts scalars or NumPy arrays.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    h = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(np.subtract(lon2, lon1)) / 2) ** 2)
+    return 2 * _gaussian_radius((phi1 + phi2) / 2) * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+
+def error_bound(distance):
+    """Maximum difference between haversine_distance and the geodesic for a distance."""
+    return distance * RELATIVE_ERROR + ABSOLUTE_ERROR
+
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    """Exact WGS84 distance in meters (slow path)."""
+    return geodesic((float(lat1), float(lon1)), (float(lat2), float(lon2))).meters
+
+
+def error_margin_for(accuracy1=None, accuracy2=None):
+    """Combined GPS error margin in meters for two optional accuracies."""
+    error_margin = 0
+    if accuracy1 is not None:
+        error_margin += float(accuracy1)
+    if accuracy2 is not None:
+        error_margin += float(accuracy2)
+    return error_margin or DEFAULT_ERROR_MARGIN
+
+
+def decision_thresholds(error_margin, radius):
+    """
+    Distances at which utils.is_within_radius can change its answer: the
+    reliability cut-off (twice the error margin) and both possible
+    effective radii.
+    """
+    return (2 * error_margin, float(radius), float(radius) - error_margin)
+
+
+def distance_between(lat1, lon1, lat2, lon2, thresholds=()):
+    """
+    Distance in meters, taking the fast haversine path unless the result is
+    within its error bound of one of the given decision thresholds.
+    """
+    distance = _haversine_scalar(float(lat1), float(lon1), float(lat2), float(lon2))
+    bound = error_bound(distance)
+    if any(abs(distance - threshold) <= bound for threshold in thresholds):
+        return geodesic_distance(lat1, lon1, lat2, lon2)
+    return distance
+
+
+def verify_batch(points, qr_code):
+    """
+    Check many student positions against one AttendanceQRCode in a single call.
+
+    Parameters:
+    - points: Sequence or (N, 3) array of (latitude, longitude, accuracy);
+      use NaN (or None) for an unknown accuracy
+    - qr_code: AttendanceQRCode with teacher_latitude, teacher_longitude and allowed_radius
+
+    Returns:
+    - dict of NumPy arrays keyed like utils.is_within_radius
+      (is_within, distance, error_margin, is_reliable, effective_radius)
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    lat, lon, accuracy = points[:, 0], points[:, 1], points[:, 2]
+    teacher_lat = float(qr_code.teacher_latitude)
+    teacher_lon = float(qr_code.teacher_longitude)
+    radius = float(qr_code.allowed_radius)
+
+    error_margin = np.where(np.isnan(accuracy) | (accuracy == 0), DEFAULT_ERROR_MARGIN, accuracy)
+    distance = haversine_distance(lat, lon, teacher_lat, teacher_lon)
+
+    # Re-check only the rows that sit on a decision boundary
+    bound = error_bound(distance)
+    ambiguous = np.zeros(len(points), dtype=bool)
+    for threshold in decision_thresholds(error_margin, radius):
+        ambiguous |= np.abs(distance - threshold) <= bound
+    for i in np.flatnonzero(ambiguous):
+        distance[i] = geodesic_distance(lat[i], lon[i], teacher_lat, teacher_lon)
+
+    is_reliable = error_margin < distance * 0.5
+    effective_radius = np.where(
+        ~is_reliable & (error_margin < radius),
+        np.maximum(radius - error_margin, 0),
+        radius
+    )
+    return {
+        'is_within': distance <= effective_radius,
+        'distance': distance,
+        'error_margin': error_margin,
+        'is_reliable': is_reliable,
+        'effective_radius': effective_radius,
+    }
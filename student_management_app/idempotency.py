@@ -0,0 +1,72 @@
+import hashlib
+import threading
+
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from . import signed_tokens
+
+HEADER = 'Idempotency-Key'
+
+# Replay counters for this process; read them with stats()
+_counters = {'absorbed': 0, 'stored': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _cache_key(user_id, key):
+    # Keys are scoped to the user so one student cannot replay another's response
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return f"checkin_idempotency_{user_id}_{digest}"
+
+
+def request_key(request):
+    """The client-supplied Idempotency-Key header, if any."""
+    key = request.headers.get(HEADER)
+    return f"header:{key}" if key else None
+
+
+def token_key(token):
+    """Key derived from the scanned token, so retries without a header are absorbed too."""
+    # A rotating code changes token every window; key its scans on the code itself
+    signed = signed_tokens.parse(token)
+    if signed is not None:
+        return f"qr:{signed.qr_id.hex}"
+    return f"token:{token}" if token else None
+
+
+def replay(user_id, *keys):
+    """
+    Return the stored response payload for the first key that has one, or
+    None if this is the first time the check-in has been seen.
+    """
+    for key in keys:
+        if key is None:
+            continue
+        payload = cache.get(_cache_key(user_id, key))
+        if payload is not None:
+            _count('absorbed')
+            return payload
+    return None
+
+
+def remember(user_id, qr_code, payload, *keys):
+    """
+    Store a successful check-in response under each key until the QR code
+    expires, so repeats within its lifetime never reach the database.
+    """
+    timeout = int((qr_code.expiry_time - now()).total_seconds())
+    if timeout <= 0:
+        return
+    cache.set_many({_cache_key(user_id, key): payload for key in keys if key is not None}, timeout=timeout)
+    _count('stored')
+
+
+def stats():
+    """Return a snapshot of the replay counters for this process."""
+    with _counters_lock:
+        return dict(_counters)
@@ -0,0 +1,89 @@
+"""
+Shared seeding helpers for the benchmark and load test commands.
+Everything created here is prefixed so cleanup() can remove it again.
+"""
+
+import datetime
+import random
+import uuid
+
+from django.utils.timezone import now
+
+from student_management_app.models import (
+    CustomUser, Courses, Subjects, Students, SessionYearModel,
+    Attendance, AttendanceQRCode
+)
+
+PREFIX = 'bench_'
+SESSION_START = datetime.date(1990, 1, 1)
+SESSION_END = datetime.date(1990, 12, 31)
+
+# Seeded classroom location; students are scattered within JITTER_METERS of it
+TEACHER_LOCATION = (28.6139, 77.2090)
+ALLOWED_RADIUS = 100
+JITTER_METERS = 40
+
+
+def seed_class(student_count, with_location=False, expiry_minutes=30):
+    """
+    Create a course, session, staff member, subject, live QR code and
+    student_count enrolled students.
+
+    Returns:
+    - (qr_code, staff_user, student_users)
+    """
+    course = Courses.objects.create(course_name=f"{PREFIX}course")
+    session = SessionYearModel.objects.create(session_start_year=SESSION_START, session_end_year=SESSION_END)
+    staff_user = CustomUser.objects.create_user(
+        username=f"{PREFIX}staff", email=f"{PREFIX}staff@example.com", password=None, user_type="2"
+    )
+    subject = Subjects.objects.create(
+        subject_name=f"{PREFIX}subject", course_id=course, staff_id=staff_user.staffs
+    )
+    qr_code = AttendanceQRCode.objects.create(
+        subject=subject,
+        session_year=session,
+        expiry_time=now() + datetime.timedelta(minutes=expiry_minutes),
+        token=f"{PREFIX}{uuid.uuid4()}",
+        teacher_latitude=TEACHER_LOCATION[0] if with_location else None,
+        teacher_longitude=TEACHER_LOCATION[1] if with_location else None,
+        allowed_radius=ALLOWED_RADIUS
+    )
+
+    student_users = []
+    for i in range(student_count):
+        student_users.append(CustomUser.objects.create_user(
+            username=f"{PREFIX}student{i}", email=f"{PREFIX}student{i}@example.com",
+            password=None, user_type="3"
+        ))
+    Students.objects.filter(admin__in=student_users).update(course_id=course, session_year_id=session)
+    return qr_code, staff_user, student_users
+
+
+def nearby_location():
+    """Return a (latitude, longitude) pair within JITTER_METERS of the seeded teacher."""
+    # Roughly 111 km per degree of latitude; good enough for a jitter
+    offset = JITTER_METERS / 111000
+    return (
+        TEACHER_LOCATION[0] + random.uniform(-offset, offset) / 2,
+        TEACHER_LOCATION[1] + random.uniform(-offset, offset) / 2,
+    )
+
+
+def cleanup():
+    """Remove everything seed_class created."""
+    subjects = Subjects.objects.filter(subject_name__startswith=PREFIX)
+    Attendance.objects.filter(subject_id__in=subjects).delete()
+    CustomUser.objects.filter(username__startswith=PREFIX, user_type="3").delete()
+    subjects.delete()
+    CustomUser.objects.filter(username__startswith=PREFIX).delete()
+    Courses.objects.filter(course_name__startswith=PREFIX).delete()
+    SessionYearModel.objects.filter(session_start_year=SESSION_START).delete()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,72 @@
+"""
+Burst benchmark for the QR check-in path
+Usage: python manage.py benchmark_checkin --students 300
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from student_management_app.checkin import CheckInError, check_in, resolve_qr_code
+from ._burst import cleanup, percentile, seed_class
+
+
+class Command(BaseCommand):
+    help = 'Simulate a class-start burst of QR scans and report queries and latency per scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=300, help='Number of students scanning')
+        parser.add_argument(
+            '--duplicates',
+            type=float,
+            default=0.2,
+            help='Fraction of students that scan a second time',
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data after the run')
+
+    def handle(self, *args, **options):
+        cleanup()
+        self.stdout.write(f"Seeding {options['students']} students...")
+        qr_code, _, student_users = seed_class(options['students'])
+        user_ids = [user.id for user in student_users]
+
+        scans = list(user_ids)
+        scans += random.sample(user_ids, int(len(user_ids) * options['duplicates']))
+        random.shuffle(scans)
+
+        timings = []
+        query_counts = []
+        accepted = 0
+        rejected = 0
+
+        try:
+            for user_id in scans:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    live_qr = resolve_qr_code(qr_code.token)
+                    try:
+                        check_in(live_qr, user_id)
+                        accepted += 1
+                    except CheckInError:
+                        rejected += 1
+                    timings.append(time.perf_counter() - started)
+                query_counts.append(len(queries))
+        finally:
+            if not options['keep']:
+                cleanup()
+
+        timings.sort()
+        self.stdout.write(f"Scans: {len(scans)} ({accepted} accepted, {rejected} duplicates rejected)")
+        self.stdout.write(f"Throughput: {len(scans) / sum(timings):.1f} scans/s")
+        self.stdout.write(
+            f"Latency ms: p50={percentile(timings, 50) * 1000:.2f} "
+            f"p95={percentile(timings, 95) * 1000:.2f} "
+            f"max={timings[-1] * 1000:.2f}"
+        )
+        self.stdout.write(
+            f"Queries per scan: min={min(query_counts)} max={max(query_counts)} "
+            f"avg={sum(query_counts) / len(query_counts):.2f}"
+        )
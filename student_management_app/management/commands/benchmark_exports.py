@@ -0,0 +1,81 @@
+"""
+Throughput of the attendance export formats over the same row source, and
+of the students x dates grid (a full year of one course is --students 500 --days 200)
+Usage: python manage.py benchmark_exports --students 200 --days 100
+"""
+
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from student_management_app import attendance_export, export_formats
+from student_management_app.models import Attendance, AttendanceReport, Students
+from student_management_app.utils import export_attendance_matrix, export_attendance_to_excel
+from ._burst import SESSION_START, cleanup, seed_class
+
+
+class Command(BaseCommand):
+    help = 'Time each attendance export format (xlsx report, xlsx, csv, jsonl, parquet, grid) over seeded reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help='Students in the seeded class')
+        parser.add_argument('--days', type=int, default=100, help='Attendance days, one report per student each')
+
+    def handle(self, *args, **options):
+        cleanup()
+        qr_code, _, student_users = seed_class(options['students'])
+
+        try:
+            attendances = Attendance.objects.bulk_create([
+                Attendance(
+                    subject_id=qr_code.subject, session_year_id=qr_code.session_year,
+                    attendance_date=SESSION_START + datetime.timedelta(days=day)
+                )
+                for day in range(options['days'])
+            ])
+            students = list(Students.objects.filter(admin__in=student_users))
+            for attendance in attendances:
+                AttendanceReport.objects.bulk_create([
+                    AttendanceReport(
+                        student_id=student, attendance_id=attendance,
+                        status=random.random() < 0.8, location_verified=random.random() < 0.5
+                    )
+                    for student in students
+                ])
+            reports = AttendanceReport.objects.filter(attendance_id__subject_id=qr_code.subject)
+            row_count = reports.count()
+
+            methods = [('xlsx report', lambda: export_attendance_to_excel(
+                reports, subject_name=qr_code.subject.subject_name, date_range="benchmark"
+            ))]
+            for fmt in export_formats.FORMATS:
+                try:
+                    export_formats.check_format(fmt)
+                except ValueError as e:
+                    self.stdout.write(self.style.WARNING(f"Skipping {fmt}: {e}"))
+                    continue
+                methods.append((fmt, lambda fmt=fmt: export_formats.WRITERS[fmt](
+                    list(attendance_export.HOD_COLUMNS), attendance_export.hod_rows(reports),
+                    attendance_export.COLUMN_TYPES
+                )))
+            methods.append(('grid xlsx', lambda: export_attendance_matrix(reports)))
+            methods.append(('grid csv', lambda: export_attendance_matrix(reports, 'csv')))
+
+            timings = []
+            for label, method in methods:
+                started = time.perf_counter()
+                size = sum(len(chunk) for chunk in method())
+                timings.append((label, time.perf_counter() - started, size))
+        finally:
+            cleanup()
+
+        self.stdout.write(f"Reports exported per format: {row_count}")
+        baseline = timings[0][1]
+        for label, elapsed, size in timings:
+            self.stdout.write(
+                f"  {label:12s} {elapsed * 1000:9.1f} ms  {row_count / elapsed:10.0f} rows/s  "
+                f"{size / 1024:9.1f} KiB  {baseline / elapsed:6.1f}x"
+            )
+        self.stdout.write(self.style.SUCCESS("✓ Export benchmark complete"))
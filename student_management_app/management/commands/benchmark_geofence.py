@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of location verification: geopy geodesic vs the geofence fast path
+Usage: python manage.py benchmark_geofence --points 10000
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from geopy.distance import geodesic
+
+from student_management_app import geofence
+from student_management_app.models import AttendanceQRCode
+from student_management_app.utils import is_within_radius
+from ._burst import ALLOWED_RADIUS, TEACHER_LOCATION
+
+
+def geodesic_is_within(student_lat, student_lon, teacher_lat, teacher_lon, radius, accuracy=None):
+    """The previous implementation: one geodesic solve per verification."""
+    distance = geodesic((student_lat, student_lon), (teacher_lat, teacher_lon)).meters
+    error_margin = accuracy or 10
+    effective_radius = radius
+    if not error_margin < distance * 0.5 and error_margin < radius:
+        effective_radius = max(radius - error_margin, 0)
+    return distance <= effective_radius
+
+
+class Command(BaseCommand):
+    help = 'Compare geodesic, fast single-point and batch location verification'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, default=10000, help='Number of student positions')
+
+    def handle(self, *args, **options):
+        points = []
+        for _ in range(options['points']):
+            destination = geodesic(meters=random.uniform(0, 2 * ALLOWED_RADIUS)).destination(
+                TEACHER_LOCATION, random.uniform(0, 360)
+            )
+            points.append((destination.latitude, destination.longitude, random.choice([5.0, 10.0, 20.0])))
+        qr_code = AttendanceQRCode(
+            teacher_latitude=TEACHER_LOCATION[0],
+            teacher_longitude=TEACHER_LOCATION[1],
+            allowed_radius=ALLOWED_RADIUS
+        )
+
+        started = time.perf_counter()
+        expected = [geodesic_is_within(lat, lon, *TEACHER_LOCATION, ALLOWED_RADIUS, acc) for lat, lon, acc in points]
+        geodesic_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        single = [is_within_radius(lat, lon, *TEACHER_LOCATION, ALLOWED_RADIUS, acc)['is_within'] for lat, lon, acc in points]
+        single_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch = geofence.verify_batch(points, qr_code)['is_within'].tolist()
+        batch_time = time.perf_counter() - started
+
+        count = len(points)
+        self.stdout.write(f"Points: {count}")
+        for label, elapsed in (
+            ('geodesic per call', geodesic_time),
+            ('is_within_radius (fast path)', single_time),
+            ('verify_batch', batch_time),
+        ):
+            self.stdout.write(
+                f"  {label:30s} {elapsed * 1000:9.2f} ms  {elapsed / count * 1e6:8.2f} us/point  "
+                f"{geodesic_time / elapsed:7.1f}x"
+            )
+        mismatches = sum(a != b for a, b in zip(expected, single)) + sum(a != b for a, b in zip(expected, batch))
+        self.stdout.write(f"Decision mismatches vs geodesic: {mismatches}")
@@ -0,0 +1,172 @@
+"""
+Compare per-process request capacity of the WSGI and ASGI deployments
+Usage: python manage.py benchmark_servers --students 200 --concurrency 50
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from student_management_app.models import Attendance
+from ._burst import cleanup, percentile, seed_class
+
+# One gunicorn process each, as on Render
+SERVERS = {
+    'wsgi': ['student_management_system.wsgi:application'],
+    'asgi': ['student_management_system.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+# The sync view served by WSGI and its async counterpart served by ASGI
+ENDPOINTS = {
+    'scan': {'wsgi': '/student_process_qr_scan/', 'asgi': '/student_process_qr_scan_async/'},
+    'roster': {'wsgi': '/get_students/', 'asgi': '/get_students_async/'},
+}
+
+
+class Command(BaseCommand):
+    help = 'Run the scan and roster endpoints under single-process WSGI and ASGI servers and compare capacity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help='Simulated students, one scan each')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent HTTP clients')
+        parser.add_argument('--roster-requests', type=int, default=200, help='Roster requests per server')
+        parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS))
+        parser.add_argument('--output', help='Optional path for the JSON results')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data after the run')
+
+    def handle(self, *args, **options):
+        cleanup()
+        self.stdout.write(f"Seeding a class of {options['students']} students...")
+        qr_code, staff_user, student_users = seed_class(options['students'])
+        student_cookies = [self.session_cookie(user) for user in student_users]
+        staff_cookie = self.session_cookie(staff_user)
+
+        results = {'students': options['students'], 'concurrency': options['concurrency'], 'servers': {}}
+        try:
+            for server in options['servers']:
+                Attendance.objects.filter(subject_id=qr_code.subject_id).delete()
+                port = self.free_port()
+                process = self.start_server(server, port)
+                try:
+                    base = f"http://127.0.0.1:{port}"
+                    scan_body = json.dumps({'token': qr_code.token}).encode()
+                    roster_body = urllib.parse.urlencode({
+                        'subject': qr_code.subject_id,
+                        'session_year': qr_code.session_year_id,
+                    }).encode()
+                    jobs = {
+                        'scan': [
+                            (base + ENDPOINTS['scan'][server], cookie, scan_body, 'application/json')
+                            for cookie in student_cookies
+                        ],
+                        'roster': [
+                            (base + ENDPOINTS['roster'][server], staff_cookie, roster_body,
+                             'application/x-www-form-urlencoded')
+                        ] * options['roster_requests'],
+                    }
+                    results['servers'][server] = {
+                        endpoint: self.run_phase(endpoint_jobs, options['concurrency'])
+                        for endpoint, endpoint_jobs in jobs.items()
+                    }
+                finally:
+                    process.terminate()
+                    process.wait(timeout=10)
+        finally:
+            if not options['keep']:
+                cleanup()
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✓ Results written to {options['output']}"))
+
+    @staticmethod
+    def session_cookie(user):
+        client = Client()
+        client.force_login(user)
+        return f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    @staticmethod
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def start_server(self, server, port):
+        command = [sys.executable, '-m', 'gunicorn', *SERVERS[server],
+                   '--workers', '1', '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+        process = subprocess.Popen(command, env=os.environ.copy(), stdout=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"{server} server exited with code {process.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                self.stdout.write(f"{server} server listening on port {port}")
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.kill()
+        raise CommandError(f"{server} server did not start within 30 seconds")
+
+    def run_phase(self, jobs, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda job: self.send(*job), jobs))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, _ in samples)
+        errors = Counter(error for _, error in samples if error)
+        return {
+            'requests': len(samples),
+            'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            'errors': dict(errors),
+        }
+
+    @staticmethod
+    def send(url, cookie, body, content_type):
+        request = urllib.request.Request(
+            url, data=body, headers={'Cookie': cookie, 'Content-Type': content_type}
+        )
+        started = time.perf_counter()
+        error = None
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                data = json.loads(response.read())
+            if isinstance(data, dict) and (data.get('status') == 'error' or 'error' in data):
+                error = (data.get('message') or data.get('error'))[:120]
+        except urllib.error.HTTPError as e:
+            error = f"http {e.code}"
+        except Exception as e:
+            error = f"exception: {type(e).__name__}"
+        return time.perf_counter() - started, error
+
+    def report(self, results):
+        for server, endpoints in results['servers'].items():
+            self.stdout.write(f"\n{server}:")
+            for endpoint, stats in endpoints.items():
+                latency = stats['latency_ms']
+                self.stdout.write(
+                    f"  {endpoint:7s} {stats['throughput_rps']:8.1f} req/s  "
+                    f"p50={latency['p50']}ms p95={latency['p95']}ms max={latency['max']}ms"
+                )
+                for message, count in sorted(stats['errors'].items(), key=lambda item: -item[1]):
+                    self.stdout.write(self.style.WARNING(f"    {count:5d}  {message}"))
@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of token validation: signed rotating tokens vs the database lookup
+Usage: python manage.py benchmark_tokens --lookups 5000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from student_management_app import qr_registry, signed_tokens
+from student_management_app.models import AttendanceQRCode
+from ._burst import cleanup, seed_class
+
+
+class Command(BaseCommand):
+    help = 'Compare stateless signed-token verification with the registry and database token lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=5000, help='Validations per method')
+
+    def handle(self, *args, **options):
+        cleanup()
+        qr_code, _, _ = seed_class(0)
+        AttendanceQRCode.objects.filter(pk=qr_code.pk).update(rotating=True)
+        qr_code.rotating = True
+        qr_registry.register(qr_code)
+        signed = signed_tokens.sign(qr_code)
+        lookups = options['lookups']
+
+        try:
+            def database():
+                return AttendanceQRCode.objects.filter(
+                    token=qr_code.token, is_active=True, expiry_time__gte=now()
+                ).first()
+
+            methods = (
+                ('database lookup', database),
+                ('registry lookup', lambda: qr_registry.lookup(qr_code.token)),
+                ('signed token verify', lambda: signed_tokens.verify(signed)),
+            )
+            timings = []
+            for label, method in methods:
+                if method() is None:
+                    self.stdout.write(self.style.WARNING(f"{label} rejected a valid token"))
+                started = time.perf_counter()
+                for _ in range(lookups):
+                    method()
+                timings.append((label, time.perf_counter() - started))
+        finally:
+            cleanup()
+
+        baseline = timings[0][1]
+        self.stdout.write(f"Validations per method: {lookups}")
+        for label, elapsed in timings:
+            self.stdout.write(
+                f"  {label:22s} {elapsed * 1000:9.2f} ms  {elapsed / lookups * 1e6:8.2f} us/token  "
+                f"{baseline / elapsed:7.1f}x"
+            )
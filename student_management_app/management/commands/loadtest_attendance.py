@@ -0,0 +1,224 @@
+"""
+Classroom-burst load test for the attendance endpoints
+Usage: python manage.py loadtest_attendance --students 300 --concurrency 20
+       python manage.py loadtest_attendance --compare loadtest_baseline.json
+"""
+
+import datetime
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from student_management_app.models import Attendance, AttendanceReport
+from ._burst import cleanup, nearby_location, percentile, seed_class
+
+ENDPOINTS = ['scan', 'upload', 'manual']
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent simulated students at the attendance endpoints and record a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100, help='Simulated students in the class')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent clients')
+        parser.add_argument(
+            '--endpoints',
+            nargs='+',
+            choices=ENDPOINTS,
+            default=ENDPOINTS,
+            help='Endpoints to exercise (scan, upload, manual)',
+        )
+        parser.add_argument(
+            '--manual-requests',
+            type=int,
+            default=10,
+            help='Number of save_attendance_data submissions, one per class date',
+        )
+        parser.add_argument('--output', default='loadtest_baseline.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', help='Previous JSON results to compare against')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data after the run')
+
+    def handle(self, *args, **options):
+        cleanup()
+        self.stdout.write(f"Seeding a class of {options['students']} students...")
+        qr_code, staff_user, student_users = seed_class(options['students'], with_location=True)
+        self._local = threading.local()
+
+        results = {
+            'generated_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'students': options['students'],
+            'concurrency': options['concurrency'],
+            'endpoints': {},
+        }
+        try:
+            for endpoint in options['endpoints']:
+                # Each phase starts from an empty class so scans are not rejected as duplicates
+                Attendance.objects.filter(subject_id=qr_code.subject_id).delete()
+                if endpoint == 'scan':
+                    jobs = [(self.scan_request, user, qr_code) for user in student_users]
+                elif endpoint == 'upload':
+                    png = self.qr_png(qr_code.token)
+                    jobs = [(self.upload_request, user, png) for user in student_users]
+                else:
+                    roster = json.dumps([{'id': user.id, 'status': 1} for user in student_users])
+                    jobs = [
+                        (self.manual_request, staff_user, (qr_code, roster, day))
+                        for day in range(options['manual_requests'])
+                    ]
+
+                self.stdout.write(f"Running {len(jobs)} '{endpoint}' requests...")
+                results['endpoints'][endpoint] = self.run_phase(jobs, options['concurrency'])
+                results['endpoints'][endpoint]['reports_written'] = AttendanceReport.objects.filter(
+                    attendance_id__subject_id=qr_code.subject_id
+                ).count()
+        finally:
+            if not options['keep']:
+                cleanup()
+
+        self.report(results)
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"✓ Results written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), results)
+
+    def run_phase(self, jobs, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(lambda job: self.timed(*job), jobs))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(sample['latency'] for sample in samples)
+        queries = [sample['queries'] for sample in samples]
+        errors = Counter(sample['error'] for sample in samples if sample['error'])
+        return {
+            'requests': len(samples),
+            'elapsed_seconds': round(elapsed, 3),
+            'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+                'p99': round(percentile(latencies, 99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            'queries_per_request': {
+                'avg': round(sum(queries) / len(queries), 2) if queries else 0.0,
+                'max': max(queries) if queries else 0,
+            },
+            'errors': dict(errors),
+            'error_rate': round(sum(errors.values()) / len(samples), 4) if samples else 0.0,
+        }
+
+    def timed(self, send, user, payload):
+        """Send one request as user from a pool thread and measure it."""
+        client = self.client_for(user)
+        error = None
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                error = send(client, payload)
+            except Exception as e:
+                error = f"exception: {type(e).__name__}"
+            latency = time.perf_counter() - started
+        return {'latency': latency, 'queries': len(queries), 'error': error}
+
+    def client_for(self, user):
+        # One logged-in test client per user per pool thread
+        clients = getattr(self._local, 'clients', None)
+        if clients is None:
+            clients = self._local.clients = {}
+        if user.id not in clients:
+            client = Client()
+            client.force_login(user)
+            clients[user.id] = client
+        return clients[user.id]
+
+    def scan_request(self, client, qr_code):
+        latitude, longitude = nearby_location()
+        response = client.post(
+            '/student_process_qr_scan/',
+            json.dumps({'token': qr_code.token, 'latitude': latitude, 'longitude': longitude, 'accuracy': 10}),
+            content_type='application/json'
+        )
+        return self.json_error(response)
+
+    def upload_request(self, client, png):
+        latitude, longitude = nearby_location()
+        response = client.post('/student_upload_qr/', {
+            'qr_image': SimpleUploadedFile('qr.png', png, content_type='image/png'),
+            'latitude': latitude,
+            'longitude': longitude,
+        })
+        return self.json_error(response)
+
+    def manual_request(self, client, payload):
+        qr_code, roster, day = payload
+        response = client.post('/save_attendance_data/', {
+            'student_ids': roster,
+            'subject_id': qr_code.subject_id,
+            'attendance_date': (datetime.date(1990, 1, 1) + datetime.timedelta(days=day)).isoformat(),
+            'session_year_id': qr_code.session_year_id,
+        })
+        if response.status_code != 200:
+            return f"http {response.status_code}"
+        body = response.content.decode()
+        return None if body == 'OK' else body[:120]
+
+    @staticmethod
+    def json_error(response):
+        if response.status_code != 200:
+            return f"http {response.status_code}"
+        try:
+            data = response.json()
+        except ValueError:
+            return 'non-json response'
+        return None if data.get('status') == 'success' else data.get('message', 'unknown error')[:120]
+
+    @staticmethod
+    def qr_png(token):
+        image = qrcode.make(token)
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def report(self, results):
+        for endpoint, stats in results['endpoints'].items():
+            latency = stats['latency_ms']
+            self.stdout.write(f"\n{endpoint}:")
+            self.stdout.write(f"  Throughput: {stats['throughput_rps']} req/s over {stats['requests']} requests")
+            self.stdout.write(f"  Latency ms: p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} max={latency['max']}")
+            self.stdout.write(
+                f"  Queries per request: avg={stats['queries_per_request']['avg']} "
+                f"max={stats['queries_per_request']['max']}"
+            )
+            self.stdout.write(f"  Reports written: {stats['reports_written']}")
+            if stats['errors']:
+                self.stdout.write(self.style.WARNING(f"  Errors ({stats['error_rate']:.1%}):"))
+                for message, count in sorted(stats['errors'].items(), key=lambda item: -item[1]):
+                    self.stdout.write(f"    {count:5d}  {message}")
+
+    def compare(self, baseline, results):
+        self.stdout.write("\nCompared with baseline:")
+        for endpoint, stats in results['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(endpoint)
+            if not before:
+                self.stdout.write(f"  {endpoint}: not in baseline")
+                continue
+            self.stdout.write(
+                f"  {endpoint}: throughput {before['throughput_rps']} -> {stats['throughput_rps']} req/s, "
+                f"p95 {before['latency_ms']['p95']} -> {stats['latency_ms']['p95']} ms, "
+                f"queries {before['queries_per_request']['avg']} -> {stats['queries_per_request']['avg']}, "
+                f"errors {before['error_rate']:.1%} -> {stats['error_rate']:.1%}"
+            )
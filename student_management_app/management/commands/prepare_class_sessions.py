@@ -0,0 +1,90 @@
+"""
+Pre-create today's attendance sessions for upcoming timetable slots and warm the scan caches
+Usage: python manage.py prepare_class_sessions
+       python manage.py prepare_class_sessions --lead 20 --dry-run
+Run it every few minutes (e.g. from cron) so each class is prepared before it starts.
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import localtime, now
+
+from student_management_app import dashboard_cache, enrolment, qr_registry
+from student_management_app.checkin import remember_attendance_session
+from student_management_app.models import Attendance, AttendanceQRCode, ClassSchedule
+
+
+class Command(BaseCommand):
+    help = "Create Attendance rows for today's upcoming classes and warm the QR and roster caches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lead',
+            type=int,
+            default=15,
+            help='Prepare slots starting within this many minutes (slots in progress are always included)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report the slots without preparing them')
+
+    def handle(self, *args, **options):
+        current = localtime(now())
+        today = current.date()
+        horizon = current + datetime.timedelta(minutes=options['lead'])
+        # Slots after midnight belong to tomorrow's run
+        latest_start = horizon.time() if horizon.date() == today else datetime.time.max
+
+        slots = list(ClassSchedule.objects.select_related('subject').filter(
+            weekday=today.weekday(),
+            start_time__lte=latest_start,
+            end_time__gte=current.time()
+        ))
+        if options['dry_run']:
+            for slot in slots:
+                self.stdout.write(f"[dry run] Would prepare {slot}")
+            self.stdout.write(self.style.SUCCESS(f"✓ [dry run] {len(slots)} slots due"))
+            return
+
+        pairs = {(slot.subject_id, slot.session_year_id) for slot in slots}
+        sessions = self.todays_sessions(pairs, today)
+        missing = pairs - sessions.keys()
+        if missing:
+            Attendance.objects.bulk_create([
+                Attendance(subject_id_id=subject_id, session_year_id_id=session_year_id, attendance_date=today)
+                for subject_id, session_year_id in missing
+            ], ignore_conflicts=True)  # A first scan may have created one meanwhile
+            # bulk_create sends no signals; the new sessions show on the dashboards
+            dashboard_cache.bump_attendance((), {subject_id for subject_id, _ in missing})
+            sessions = self.todays_sessions(pairs, today)
+        for attendance in sessions.values():
+            remember_attendance_session(attendance)
+
+        # Codes the staff already generated (or scheduled) for these slots
+        qr_codes = [
+            qr_code for qr_code in AttendanceQRCode.objects.select_related('subject').filter(
+                subject_id__in={subject_id for subject_id, _ in pairs},
+                is_active=True,
+                expiry_time__gte=now()
+            )
+            if (qr_code.subject_id, qr_code.session_year_id) in pairs
+        ]
+        for qr_code in qr_codes:
+            qr_registry.register(qr_code)
+            enrolment.snapshot(qr_code)
+
+        self.stdout.write(f"Slots due: {len(slots)}")
+        self.stdout.write(f"Attendance sessions created: {len(missing)}")
+        self.stdout.write(self.style.SUCCESS(f"✓ Warmed {len(sessions)} sessions and {len(qr_codes)} QR codes"))
+
+    @staticmethod
+    def todays_sessions(pairs, today):
+        """Map (subject id, session year id) to today's Attendance row."""
+        sessions = {}
+        subject_ids = {subject_id for subject_id, _ in pairs}
+        for attendance in Attendance.objects.filter(
+            attendance_date=today, subject_id_id__in=subject_ids
+        ):
+            key = (attendance.subject_id_id, attendance.session_year_id_id)
+            if key in pairs:
+                sessions[key] = attendance
+        return sessions
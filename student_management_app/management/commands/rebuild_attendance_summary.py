@@ -0,0 +1,64 @@
+"""
+Recount the attendance summary and daily rollup tables from AttendanceReport
+Usage: python manage.py rebuild_attendance_summary
+       python manage.py rebuild_attendance_summary --check
+Use it to backfill, or to repair drift after reports were changed outside the app's views.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from student_management_app import dashboard_cache
+from student_management_app.attendance_summary import expected_daily_rows, expected_rows
+from student_management_app.models import AttendanceSummary, DailyAttendanceRollup
+
+# (label, model, key fields, count fields, recount function)
+TABLES = [
+    ('summary', AttendanceSummary, ('student_id', 'subject_id', 'session_year_id'), ('present', 'absent'), expected_rows),
+    (
+        'daily rollup', DailyAttendanceRollup, ('subject_id', 'session_year_id', 'date'),
+        ('present', 'absent', 'location_verified'), expected_daily_rows
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the attendance summary and daily rollup tables from the attendance reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report drift; do not rewrite the tables')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        drift = 0
+        with transaction.atomic():
+            for label, model, key_fields, count_fields, recount in TABLES:
+                expected = recount()
+                current = {
+                    row[:len(key_fields)]: row[len(key_fields):]
+                    for row in model.objects.values_list(*key_fields, *count_fields)
+                }
+                missing = expected.keys() - current.keys()
+                stale = {key for key, counts in current.items() if any(counts)} - expected.keys()
+                wrong = {key for key in expected.keys() & current.keys() if tuple(expected[key]) != current[key]}
+                drift += len(missing) + len(wrong) + len(stale)
+
+                self.stdout.write(f"{label.capitalize()} rows expected: {len(expected)}")
+                self.stdout.write(f"  Missing: {len(missing)}, wrong counts: {len(wrong)}, stale: {len(stale)}")
+                if options['check']:
+                    continue
+
+                model.objects.all().delete()
+                model.objects.bulk_create([
+                    model(**dict(zip(key_fields, key)), **dict(zip(count_fields, counts)))
+                    for key, counts in expected.items()
+                ], batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f"✓ Rebuilt {len(expected)} {label} rows"))
+
+        if not options['check']:
+            # Run against the shared cache (CACHE_BACKEND) for this to reach the web workers
+            dashboard_cache.invalidate_all()
+
+        if options['check']:
+            style = self.style.SUCCESS if not drift else self.style.WARNING
+            self.stdout.write(style(f"{'✓' if not drift else '!'} {drift} rows out of date"))
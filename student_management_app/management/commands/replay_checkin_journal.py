@@ -0,0 +1,35 @@
+"""
+Replay the write-behind check-in journal after a crash or restart. Refuses
+to run while a web process still has the journal directory open.
+Usage: python manage.py replay_checkin_journal
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from student_management_app.checkin_journal import CheckInJournal, JournalLocked
+
+
+class Command(BaseCommand):
+    help = 'Insert any check-ins left in the write-behind journal into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--directory',
+            default=settings.CHECKIN_JOURNAL_DIR,
+            help='Journal directory (defaults to CHECKIN_JOURNAL_DIR)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Replaying check-in journal in {options['directory']}...")
+        try:
+            journal = CheckInJournal(
+                options['directory'],
+                batch_size=settings.CHECKIN_BATCH_SIZE,
+                background=False,
+            )
+        except JournalLocked as e:
+            raise CommandError(f"{e}; stop it first, it flushes its own journal")
+        with journal:
+            inserted = journal.replay()
+        self.stdout.write(self.style.SUCCESS(f"✓ Inserted {inserted} attendance reports"))
@@ -0,0 +1,30 @@
+"""
+Build queued background exports (see export_jobs) in this process, and
+delete expired ones. Needed when EXPORT_JOB_WORKERS is 0; otherwise it picks
+up jobs whose web process exited before finishing them.
+Usage: python manage.py run_export_jobs [--loop] [--interval 5]
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from student_management_app import export_jobs
+
+
+class Command(BaseCommand):
+    help = 'Build queued attendance export jobs and purge expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            purged = export_jobs.purge_expired()
+            built = export_jobs.run_pending()
+            if built or purged or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"✓ Ran {built} export job(s), purged {purged}"))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
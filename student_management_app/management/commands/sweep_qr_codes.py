@@ -0,0 +1,93 @@
+"""
+Deactivate expired QR codes and delete their stored images
+Usage: python manage.py sweep_qr_codes
+       python manage.py sweep_qr_codes --grace 60 --orphans --dry-run
+Run it periodically (e.g. from cron) to keep media/qr_codes/ bounded.
+"""
+
+import datetime
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from student_management_app import qr_registry
+from student_management_app.models import AttendanceQRCode
+from student_management_app.storage import qr_image_storage
+
+QR_IMAGE_DIR = 'qr_codes'
+
+
+class Command(BaseCommand):
+    help = 'Deactivate expired QR codes, remove their images and report the bytes reclaimed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=0,
+            help='Only sweep codes that expired at least this many minutes ago',
+        )
+        parser.add_argument(
+            '--orphans',
+            action='store_true',
+            help='Also delete image files that no QR code references',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed without removing it')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = now() - datetime.timedelta(minutes=options['grace'])
+        expired = AttendanceQRCode.objects.filter(expiry_time__lt=cutoff)
+
+        # Deactivate through update() and evict by hand; save() per row would
+        # send a signal per code
+        tokens = list(expired.filter(is_active=True).values_list('token', flat=True))
+        if not dry_run and tokens:
+            AttendanceQRCode.objects.filter(token__in=tokens).update(is_active=False)
+            for token in tokens:
+                qr_registry.evict(token)
+
+        # Content-addressed files can be shared, so keep anything a live code still uses
+        live_images = set(
+            AttendanceQRCode.objects.filter(expiry_time__gte=cutoff)
+            .exclude(qr_code_image='').values_list('qr_code_image', flat=True)
+        )
+        expired_images = set(expired.exclude(qr_code_image='').values_list('qr_code_image', flat=True))
+        doomed = expired_images - live_images
+
+        if options['orphans']:
+            referenced = set(
+                AttendanceQRCode.objects.exclude(qr_code_image='').values_list('qr_code_image', flat=True)
+            )
+            doomed |= {name for name in self.stored_images() if name not in referenced}
+
+        files_removed = 0
+        bytes_reclaimed = 0
+        for name in sorted(doomed):
+            if not qr_image_storage.exists(name):
+                continue
+            size = qr_image_storage.size(name)
+            if not dry_run:
+                qr_image_storage.delete(name)
+            files_removed += 1
+            bytes_reclaimed += size
+
+        if not dry_run and expired_images:
+            expired.exclude(qr_code_image='').update(qr_code_image='')
+
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(f"{prefix}QR codes deactivated: {len(tokens)}")
+        self.stdout.write(f"{prefix}Images removed: {files_removed}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {prefix}Reclaimed {bytes_reclaimed} bytes ({bytes_reclaimed / 1024 / 1024:.2f} MB)"
+        ))
+
+    @staticmethod
+    def stored_images():
+        """Yield the storage name of every file under media/qr_codes/."""
+        root = qr_image_storage.path(QR_IMAGE_DIR)
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                yield os.path.relpath(path, qr_image_storage.location).replace(os.sep, '/')
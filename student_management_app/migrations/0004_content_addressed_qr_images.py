@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-17 02:27
+
+from django.db import migrations, models
+import student_management_app.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0003_alter_courses_options_alter_students_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendanceqrcode',
+            name='qr_code_image',
+            field=models.ImageField(storage=student_management_app.storage.ContentAddressedStorage(), upload_to='qr_codes/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0004_content_addressed_qr_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendanceqrcode',
+            name='rotating',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0005_attendanceqrcode_rotating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendanceqrcode',
+            name='start_time',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
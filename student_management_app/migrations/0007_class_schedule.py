@@ -0,0 +1,32 @@
+# Generated by Django 4.2.16 on 2026-10-17 02:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0006_attendanceqrcode_start_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassSchedule',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('room', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.sessionyearmodel')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.subjects')),
+            ],
+            options={
+                'ordering': ['weekday', 'start_time'],
+                'indexes': [models.Index(fields=['weekday', 'start_time'], name='student_man_weekday_d3bc30_idx')],
+            },
+        ),
+    ]
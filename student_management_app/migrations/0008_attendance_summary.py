@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-17 02:41
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    AttendanceReport = apps.get_model('student_management_app', 'AttendanceReport')
+    AttendanceSummary = apps.get_model('student_management_app', 'AttendanceSummary')
+    grouped = AttendanceReport.objects.order_by().values(
+        'student_id', 'attendance_id__subject_id', 'attendance_id__session_year_id'
+    ).annotate(present=Count('id', filter=Q(status=True)), absent=Count('id', filter=Q(status=False)))
+    AttendanceSummary.objects.bulk_create([
+        AttendanceSummary(
+            student_id=row['student_id'],
+            subject_id=row['attendance_id__subject_id'],
+            session_year_id=row['attendance_id__session_year_id'],
+            present=row['present'],
+            absent=row['absent'],
+        )
+        for row in grouped
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0007_class_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('present', models.IntegerField(default=0)),
+                ('absent', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.sessionyearmodel')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.students')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.subjects')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject', 'session_year'], name='student_man_subject_c9ee63_idx')],
+                'unique_together': {('student', 'subject', 'session_year')},
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-17 02:46
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    AttendanceReport = apps.get_model('student_management_app', 'AttendanceReport')
+    DailyAttendanceRollup = apps.get_model('student_management_app', 'DailyAttendanceRollup')
+    grouped = AttendanceReport.objects.order_by().values(
+        'attendance_id__subject_id', 'attendance_id__session_year_id', 'attendance_id__attendance_date'
+    ).annotate(
+        present=Count('id', filter=Q(status=True)),
+        absent=Count('id', filter=Q(status=False)),
+        location_verified=Count('id', filter=Q(location_verified=True)),
+    )
+    DailyAttendanceRollup.objects.bulk_create([
+        DailyAttendanceRollup(
+            subject_id=row['attendance_id__subject_id'],
+            session_year_id=row['attendance_id__session_year_id'],
+            date=row['attendance_id__attendance_date'],
+            present=row['present'],
+            absent=row['absent'],
+            location_verified=row['location_verified'],
+        )
+        for row in grouped
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0008_attendance_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceRollup',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('present', models.IntegerField(default=0)),
+                ('absent', models.IntegerField(default=0)),
+                ('location_verified', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('session_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.sessionyearmodel')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='student_management_app.subjects')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='student_man_date_56ea6e_idx')],
+                'unique_together': {('subject', 'session_year', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.16 on 2026-10-17 03:49
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_sessions(apps, schema_editor):
+    """
+    Fold every extra session of a (subject, session year, day) into its
+    oldest one. A student with a report in both keeps one, present if
+    either was, and the summary and daily rollup lose the dropped report.
+    """
+    Attendance = apps.get_model('student_management_app', 'Attendance')
+    AttendanceReport = apps.get_model('student_management_app', 'AttendanceReport')
+    AttendanceSummary = apps.get_model('student_management_app', 'AttendanceSummary')
+    DailyAttendanceRollup = apps.get_model('student_management_app', 'DailyAttendanceRollup')
+
+    groups = Attendance.objects.order_by().values(
+        'subject_id', 'session_year_id', 'attendance_date'
+    ).annotate(sessions=Count('id'), keep=Min('id')).filter(sessions__gt=1)
+    for group in groups:
+        lookup = {
+            'subject_id_id': group['subject_id'],
+            'session_year_id_id': group['session_year_id'],
+            'attendance_date': group['attendance_date'],
+        }
+        extra = Attendance.objects.filter(**lookup).exclude(id=group['keep'])
+        kept = {report.student_id_id: report for report in AttendanceReport.objects.filter(attendance_id_id=group['keep'])}
+        for report in AttendanceReport.objects.filter(attendance_id__in=extra).order_by('id'):
+            existing = kept.get(report.student_id_id)
+            if existing is not None:
+                # Two reports for one student that day: keep the present one
+                if report.status and not existing.status:
+                    report, existing = existing, report
+                report.delete()
+                status = 'present' if report.status else 'absent'
+                AttendanceSummary.objects.filter(
+                    student_id=report.student_id_id, subject_id=group['subject_id'],
+                    session_year_id=group['session_year_id']
+                ).update(**{status: F(status) - 1})
+                counts = {status: F(status) - 1}
+                if report.location_verified:
+                    counts['location_verified'] = F('location_verified') - 1
+                DailyAttendanceRollup.objects.filter(
+                    subject_id=group['subject_id'], session_year_id=group['session_year_id'],
+                    date=group['attendance_date']
+                ).update(**counts)
+                report = existing
+            if report.attendance_id_id != group['keep']:
+                report.attendance_id_id = group['keep']
+                report.save(update_fields=['attendance_id'])
+            kept[report.student_id_id] = report
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('student_management_app', '0010_export_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('subject_id', 'session_year_id', 'attendance_date'), name='unique_attendance_session'),
+        ),
+    ]
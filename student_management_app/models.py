@@ -1,11 +1,14 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
 from django.utils.timezone import now
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from datetime import datetime, timedelta
 
+from . import dashboard_cache, qr_registry
+from .storage import qr_image_storage
+
 # ✅ Session Year Model
 class SessionYearModel(models.Model):
     id = models.AutoField(primary_key=True)
@@ -194,6 +197,14 @@ class Attendance(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     objects = models.Manager()
 
+    class Meta:
+        # ✅ One session per subject, session year and day, shared by scans and manual registers
+        constraints = [
+            models.UniqueConstraint(
+                fields=['subject_id', 'session_year_id', 'attendance_date'], name='unique_attendance_session'
+            )
+        ]
+
     def __str__(self):
         return f"{self.subject_id.subject_name} - {self.attendance_date.strftime('%B %d, %Y')}"
 
@@ -212,15 +223,57 @@ class AttendanceQRCode(models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     subject = models.ForeignKey(Subjects, on_delete=models.CASCADE)
     session_year = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE, default=1)  # ✅ Added default
-    qr_code_image = models.ImageField(upload_to="qr_codes/")
+    qr_code_image = models.ImageField(upload_to="qr_codes/", storage=qr_image_storage)  # ✅ Hash-named, sharded files
+    start_time = models.DateTimeField(null=True, blank=True)  # ✅ Scheduled codes only scan from here on
     expiry_time = models.DateTimeField()
     is_active = models.BooleanField(default=True)
     token = models.CharField(max_length=50, unique=True)  # Unique Token for Attendance
     teacher_latitude = models.FloatField(null=True, blank=True)
     teacher_longitude = models.FloatField(null=True, blank=True)
     allowed_radius = models.FloatField(default=100)  # Radius in meters
+    rotating = models.BooleanField(default=False)  # ✅ Projected as short-lived signed tokens
     # Network verification is handled via cache to avoid database changes
 
+    def is_open(self, at=None):
+        """Whether the code's scanning window (start_time to expiry_time) contains the given time."""
+        at = at or now()
+        return (self.start_time is None or self.start_time <= at) and at <= self.expiry_time
+
+# ✅ Class Schedule Model (weekly timetable slots)
+class ClassSchedule(models.Model):
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    subject = models.ForeignKey(Subjects, on_delete=models.CASCADE)
+    session_year = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE)
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)  # Same numbering as date.weekday()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    room = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+        indexes = [models.Index(fields=['weekday', 'start_time'])]
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.start_time and self.end_time and self.end_time <= self.start_time:
+            raise ValidationError("Class must end after it starts.")
+
+    def __str__(self):
+        return f"{self.subject.subject_name} - {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
 # ✅ Attendance Report Model
 class AttendanceReport(models.Model):
     id = models.AutoField(primary_key=True)
@@ -244,6 +297,79 @@ class AttendanceReport(models.Model):
         status_text = "Present" if self.status else "Absent"
         return f"{self.student_id.admin.username} - {self.attendance_id.subject_id.subject_name} ({self.attendance_id.attendance_date}) - {status_text}"
 
+# ✅ Attendance Summary Model (materialized present/absent counts, see attendance_summary.py)
+class AttendanceSummary(models.Model):
+    id = models.AutoField(primary_key=True)
+    student = models.ForeignKey(Students, on_delete=models.CASCADE)
+    subject = models.ForeignKey(Subjects, on_delete=models.CASCADE)
+    session_year = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE)
+    present = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    class Meta:
+        unique_together = ('student', 'subject', 'session_year')
+        indexes = [models.Index(fields=['subject', 'session_year'])]
+
+    @property
+    def total(self):
+        return self.present + self.absent
+
+    def __str__(self):
+        return f"{self.student_id} - {self.subject_id} ({self.session_year_id}): {self.present}/{self.total}"
+
+# ✅ Daily Attendance Rollup Model (per subject and day, for trend charts; see attendance_summary.py)
+class DailyAttendanceRollup(models.Model):
+    id = models.AutoField(primary_key=True)
+    subject = models.ForeignKey(Subjects, on_delete=models.CASCADE)
+    session_year = models.ForeignKey(SessionYearModel, on_delete=models.CASCADE)
+    date = models.DateField()
+    present = models.IntegerField(default=0)
+    absent = models.IntegerField(default=0)
+    location_verified = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    objects = models.Manager()
+
+    class Meta:
+        unique_together = ('subject', 'session_year', 'date')
+        indexes = [models.Index(fields=['date'])]
+
+    @property
+    def total(self):
+        return self.present + self.absent
+
+# ✅ Export Job Model (attendance exports built in the background; see export_jobs.py)
+class ExportJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)  # ✅ Who asked first; identical requests share the job
+    kind = models.CharField(max_length=10)  # ✅ "staff", "student" or "admin"
+    format = models.CharField(max_length=10)
+    params = models.JSONField(default=dict)
+    key = models.CharField(max_length=64, db_index=True)  # ✅ Parameters and data version, hashed
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    rows_total = models.IntegerField(default=0)
+    rows_written = models.IntegerField(default=0)
+    file = models.CharField(max_length=255, blank=True)  # ✅ Name in export_jobs.export_storage
+    filename = models.CharField(max_length=255, blank=True)  # ✅ Download name
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    objects = models.Manager()
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'updated_at'])]
+
+    def __str__(self):
+        return f"{self.kind} {self.format} export {self.id} ({self.status})"
+
 # ✅ Student Result Model
 class StudentResult(models.Model):
     id = models.AutoField(primary_key=True)
@@ -288,9 +414,55 @@ def create_user_profile(sender, instance, created, **kwargs):
                 session_year_id=default_session
             )
 
+# ✅ Keep the QR token registry in sync with deactivated or deleted codes
+@receiver(post_save, sender=AttendanceQRCode)
+def sync_qr_registry(sender, instance, **kwargs):
+    if not instance.is_active:
+        qr_registry.evict(instance.token)
+
+@receiver(post_delete, sender=AttendanceQRCode)
+def evict_deleted_qr_code(sender, instance, **kwargs):
+    qr_registry.evict(instance.token)
+
+# ✅ Invalidate dashboard snapshots when enrolment changes
+@receiver(post_save, sender=Students)
+@receiver(post_delete, sender=Students)
+def invalidate_student_dashboards(sender, instance, **kwargs):
+    dashboard_cache.bump_enrolment(student_ids=[instance.id], course_ids=[instance.course_id_id])
+
+@receiver(post_save, sender=Subjects)
+@receiver(post_delete, sender=Subjects)
+def invalidate_subject_dashboards(sender, instance, **kwargs):
+    dashboard_cache.bump_enrolment(course_ids=[instance.course_id_id], subject_ids=[instance.id])
+
+@receiver(post_save, sender=Courses)
+@receiver(post_delete, sender=Courses)
+@receiver(post_save, sender=Staffs)
+@receiver(post_delete, sender=Staffs)
+@receiver(post_save, sender=SessionYearModel)
+@receiver(post_delete, sender=SessionYearModel)
+def invalidate_dashboards(sender, instance, **kwargs):
+    dashboard_cache.bump_enrolment()
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def invalidate_attendance_dashboards(sender, instance, **kwargs):
+    # Sessions are counted on the dashboards even before anyone is marked
+    subject_id = instance.subject_id_id
+    transaction.on_commit(lambda: dashboard_cache.bump_attendance((), [subject_id]))
+
+@receiver(post_delete, sender=Attendance)
+def forget_deleted_attendance_session(sender, instance, **kwargs):
+    # Scans would otherwise keep inserting against the deleted session's cached id
+    from .checkin import forget_attendance_session
+    transaction.on_commit(lambda: forget_attendance_session(instance))
+
 # ✅ Save Profile for Existing Users
 @receiver(post_save, sender=CustomUser)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # A login only records last_login; the profile has nothing to save
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
     if hasattr(instance, "adminhod"):
         instance.adminhod.save()
     if hasattr(instance, "staffs"):
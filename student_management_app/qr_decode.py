@@ -0,0 +1,289 @@
+"""
+In-memory QR decode pipeline for uploaded photos.
+
+The upload is decoded once from its buffer, downscaled and converted to
+grayscale, then cheap centre crops are tried before the full frame. Each
+stage runs every available decoder in DECODER_ORDER. Decoding happens in a
+small pool of worker processes so a slow image cannot hold a web worker for
+longer than the per-image time budget: a worker still decoding when the
+budget runs out is killed and replaced, so the pool never grows past its
+size. A worker's start-up is not counted against the budget.
+
+This module must stay importable without Django so pool workers can load it.
+"""
+
+import multiprocessing
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from io import BytesIO
+
+from PIL import Image
+
+# Both decoders are optional for deployment
+try:
+    from pyzbar.pyzbar import decode as pyzbar_decode
+    PYZBAR_AVAILABLE = True
+except ImportError:
+    PYZBAR_AVAILABLE = False
+
+try:
+    import cv2
+    import numpy as np
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+    print("OpenCV not available - QR scanning will use alternative methods")
+
+DecodeResult = namedtuple('DecodeResult', ['token', 'decoder', 'stage'])
+
+# Longest side, in pixels, of the working image. QR codes shown on a
+# projector stay readable well below a phone camera's resolution.
+MAX_SIDE = 1280
+
+# Centre crops tried before the full frame, as a fraction of each side
+CROP_STAGES = (('center_50', 0.5), ('center_75', 0.75))
+
+
+def _decode_pyzbar(image):
+    decoded = pyzbar_decode(image)
+    return decoded[0].data.decode('utf-8') if decoded else None
+
+
+def _decode_opencv(image):
+    data, _, _ = cv2.QRCodeDetector().detectAndDecode(np.asarray(image))
+    return data or None
+
+
+DECODERS = {}
+if PYZBAR_AVAILABLE:
+    DECODERS['pyzbar'] = _decode_pyzbar
+if OPENCV_AVAILABLE:
+    DECODERS['opencv'] = _decode_opencv
+
+DECODER_ORDER = ['pyzbar', 'opencv']
+
+
+def _center_crop(image, fraction):
+    width, height = image.size
+    crop_w, crop_h = int(width * fraction), int(height * fraction)
+    left, top = (width - crop_w) // 2, (height - crop_h) // 2
+    return image.crop((left, top, left + crop_w, top + crop_h))
+
+
+def _stages(data, max_side):
+    """Yield (stage name, grayscale image) from cheapest to most expensive."""
+    image = Image.open(BytesIO(data))
+    original_size = image.size
+    # For JPEGs this decodes straight at a reduced scale
+    image.draft('L', (max_side, max_side))
+    gray = image.convert('L')
+    gray.thumbnail((max_side, max_side))
+
+    for name, fraction in CROP_STAGES:
+        yield name, _center_crop(gray, fraction)
+    yield 'full', gray
+
+    # Small or dense codes may need every pixel of the original photo
+    if max(original_size) > max_side:
+        yield 'full_resolution', Image.open(BytesIO(data)).convert('L')
+
+
+def decode_image_bytes(data, max_side=MAX_SIDE):
+    """
+    Decode a QR code from raw image bytes.
+
+    Returns:
+    - DecodeResult(token, decoder, stage), or None if nothing was found
+    """
+    decoders = [(name, DECODERS[name]) for name in DECODER_ORDER if name in DECODERS]
+    if not decoders:
+        return None
+    for stage, image in _stages(data, max_side):
+        for name, decoder in decoders:
+            try:
+                token = decoder(image)
+            except Exception as e:
+                print(f"{name} QR decode error at stage {stage}: {e}")
+                continue
+            if token:
+                return DecodeResult(token, name, stage)
+    return None
+
+
+# Longest wait, in seconds, for a new worker to import its decoders
+WORKER_START_TIMEOUT = 30.0
+
+
+class DecodeTimeout(Exception):
+    """No worker was free, or the decode did not finish, within the budget."""
+
+
+def _serve(conn):
+    """Worker process loop: decode each image received on conn and send back the result."""
+    conn.send(('ready', None))
+    while True:
+        try:
+            data = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send(('ok', decode_image_bytes(data)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+
+class _Worker:
+    """One decode process and its end of the pipe."""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def wait_ready(self):
+        if not self.ready:
+            if not self.conn.poll(WORKER_START_TIMEOUT):
+                raise RuntimeError("QR decode worker did not start")
+            self.conn.recv()
+            self.ready = True
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _DecodePool:
+    """
+    A fixed number of decode processes, each serving one image at a time.
+    Unlike a ProcessPoolExecutor, the process running a given image is
+    known, so one that overruns can be killed without touching the others.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.closed = False
+        # spawn keeps workers independent of the web server's threads and DB connections
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(_Worker(self._context))
+
+    def decode(self, data, timeout):
+        deadline = time.monotonic() + timeout
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise DecodeTimeout()
+        try:
+            started = time.monotonic()
+            worker.wait_ready()
+            # A worker that was still starting up does not use up the image's budget
+            deadline += time.monotonic() - started
+            worker.conn.send(data)
+            if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                worker = self._replace(worker)
+                raise DecodeTimeout()
+            status, value = worker.conn.recv()
+        except (EOFError, OSError, RuntimeError):
+            # The worker crashed or never started
+            worker = self._replace(worker)
+            raise
+        finally:
+            self._release(worker)
+        if status == 'error':
+            raise RuntimeError(value)
+        return value
+
+    def _replace(self, worker):
+        worker.kill()
+        return _Worker(self._context)
+
+    def _release(self, worker):
+        if self.closed:
+            worker.kill()
+        else:
+            self._idle.put(worker)
+
+    def close(self):
+        """Stop idle workers now and busy ones as soon as they are released."""
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                return
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """The shared decode pool, started again if the requested size changed."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool.workers != workers:
+            _pool.close()
+            _pool = None
+        if _pool is None:
+            _pool = _DecodePool(workers)
+        return _pool
+
+
+def _count(key):
+    with _counters_lock:
+        _counters[key] += 1
+
+
+def decode_upload(uploaded_file, workers=2, timeout=3.0):
+    """
+    Decode the QR code in an uploaded image without writing it to disk.
+
+    Parameters:
+    - uploaded_file: Django UploadedFile (or any file-like object)
+    - workers: Size of the decode process pool; 0 decodes in this process
+    - timeout: Per-image time budget in seconds when using the pool,
+      including any wait for a free worker
+
+    Returns:
+    - DecodeResult, or None if no code was found in the time budget
+    """
+    data = uploaded_file.read()
+    if not workers:
+        try:
+            result = decode_image_bytes(data)
+        except Exception as e:
+            print(f"QR decode failed: {e}")
+            _count('error')
+            return None
+    else:
+        try:
+            result = _get_pool(workers).decode(data, timeout)
+        except DecodeTimeout:
+            print(f"QR decode exceeded its {timeout}s budget")
+            _count('timeout')
+            return None
+        except Exception as e:
+            # The worker has already been replaced
+            print(f"QR decode failed: {e}")
+            _count('error')
+            return None
+
+    if result is None:
+        _count('not_found')
+    else:
+        _count(f"{result.decoder}:{result.stage}")
+    return result
+
+
+def stats():
+    """Return how often each decoder:stage succeeded, plus failures, in this process."""
+    with _counters_lock:
+        return dict(_counters)
@@ -0,0 +1,82 @@
+import threading
+
+from django.core.cache import cache
+from django.utils.timezone import now
+
+# Hit/miss counters for this process; read them with stats()
+_counters = {'hits': 0, 'misses': 0, 'registered': 0, 'evicted': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _cache_key(token):
+    return f"qr_registry_{token}"
+
+
+def _timeout(qr_code):
+    # Seconds the code stays live, or None if it should not be registered
+    timeout = int((qr_code.expiry_time - now()).total_seconds())
+    return timeout if qr_code.is_active and timeout > 0 else None
+
+
+def register(qr_code):
+    """
+    Store a live AttendanceQRCode in the cache until its expiry_time.
+
+    The subject must already be loaded on the instance so that cached entries
+    can be used by the scan endpoints without touching the database.
+    """
+    timeout = _timeout(qr_code)
+    if timeout is None:
+        return
+    cache.set(_cache_key(qr_code.token), qr_code, timeout=timeout)
+    _count('registered')
+
+
+async def aregister(qr_code):
+    """Async register, through the cache's async API."""
+    timeout = _timeout(qr_code)
+    if timeout is None:
+        return
+    await cache.aset(_cache_key(qr_code.token), qr_code, timeout=timeout)
+    _count('registered')
+
+
+def _live(qr_code):
+    if qr_code is None or not qr_code.is_active or not qr_code.is_open():
+        _count('misses')
+        return None
+    _count('hits')
+    return qr_code
+
+
+def lookup(token):
+    """
+    Return the cached AttendanceQRCode for a token, or None on a miss.
+    Entries outside their start_time..expiry_time window are treated as misses.
+    """
+    return _live(cache.get(_cache_key(token)))
+
+
+async def alookup(token):
+    """Async lookup, through the cache's async API."""
+    return _live(await cache.aget(_cache_key(token)))
+
+
+def evict(token):
+    """Remove a token from the registry, e.g. when its code is deactivated."""
+    cache.delete(_cache_key(token))
+    _count('evicted')
+
+
+def stats():
+    """Return a snapshot of the registry counters for this process."""
+    with _counters_lock:
+        snapshot = dict(_counters)
+    lookups = snapshot['hits'] + snapshot['misses']
+    snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+    return snapshot
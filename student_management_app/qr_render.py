@@ -0,0 +1,55 @@
+import hashlib
+from functools import lru_cache
+from io import BytesIO
+
+import qrcode
+import qrcode.image.svg
+
+# Rendered codes kept in memory per process; a class generates one code but
+# every projector refresh and share link asks for it again
+CACHE_SIZE = 128
+
+FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def scan_url(request, token):
+    """The URL encoded in a QR code: the scan page with the token attached."""
+    return f"{request.build_absolute_uri('/scan-attendance/')}?token={token}"
+
+
+def etag(data, fmt):
+    """
+    Strong ETag for a rendered code. The image is fully determined by its
+    data and format, so no rendering is needed to answer a revalidation.
+    """
+    return '"{}"'.format(hashlib.sha256(f"{fmt}:{data}".encode('utf-8')).hexdigest()[:32])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def render(data, fmt):
+    """
+    Draw a QR code for data.
+
+    Parameters:
+    - data: The text to encode (usually scan_url())
+    - fmt: 'png' or 'svg' (a single compact <path>)
+
+    Returns:
+    - The image as bytes
+    """
+    if fmt == 'svg':
+        image = qrcode.make(data, image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        image = qrcode.make(data)
+    buffer = BytesIO()
+    image.save(buffer)
+    return buffer.getvalue()
+
+
+def stats():
+    """LRU hit/miss counters for this process."""
+    info = render.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max_size': info.maxsize}
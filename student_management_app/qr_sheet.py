@@ -0,0 +1,106 @@
+"""
+Printable QR sheets for a batch of scheduled codes.
+
+Each code is drawn on its own A4 page with its subject and scanning window,
+and the pages are joined into one PDF. Pages are rendered in a small process
+pool so a full day's timetable does not hold a web worker for the sum of the
+encodes.
+
+This module must stay importable without Django so pool workers can load it.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+# A4 at 150 dpi
+PAGE_SIZE = (1240, 1754)
+PAGE_DPI = 150
+MARGIN = 120
+QR_SIDE = 1000
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn keeps workers independent of the web server's threads and DB connections
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_page(data, title, lines=()):
+    """
+    Draw one sheet page.
+
+    Parameters:
+    - data: The text to encode (usually qr_render.scan_url())
+    - title: Large heading above the code, e.g. the subject name
+    - lines: Smaller lines printed under the code (window, room, token)
+
+    Returns:
+    - The page as PNG bytes
+    """
+    page = Image.new('L', PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(page)
+    title_font = ImageFont.load_default(size=56)
+    body_font = ImageFont.load_default(size=32)
+
+    draw.text((PAGE_SIZE[0] // 2, MARGIN), title, fill=0, font=title_font, anchor='mt')
+
+    code = qrcode.make(data).get_image().convert('L').resize((QR_SIDE, QR_SIDE), Image.NEAREST)
+    top = MARGIN + 120
+    page.paste(code, ((PAGE_SIZE[0] - QR_SIDE) // 2, top))
+
+    y = top + QR_SIDE + 60
+    for line in lines:
+        draw.text((PAGE_SIZE[0] // 2, y), line, fill=0, font=body_font, anchor='mt')
+        y += 50
+
+    # Bilevel pages keep both the worker's reply and the PDF small
+    buffer = BytesIO()
+    page.convert('1', dither=Image.Dither.NONE).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def build_pdf(pages, workers=2):
+    """
+    Render pages and join them into a single PDF.
+
+    Parameters:
+    - pages: List of (data, title, lines) tuples, one per page
+    - workers: Size of the render process pool; 0 renders in this process
+
+    Returns:
+    - The PDF as bytes
+    """
+    if workers and len(pages) > 1:
+        try:
+            rendered = list(_get_pool(workers).map(render_page, *zip(*pages)))
+        except Exception as e:
+            # A crashed worker breaks the pool; start a fresh one next time
+            print(f"QR sheet pool failed, rendering in process: {e}")
+            _reset_pool()
+            rendered = [render_page(*page) for page in pages]
+    else:
+        rendered = [render_page(*page) for page in pages]
+
+    images = [Image.open(BytesIO(png)) for png in rendered]
+    buffer = BytesIO()
+    images[0].save(buffer, format='PDF', save_all=True, append_images=images[1:], resolution=PAGE_DPI)
+    return buffer.getvalue()
@@ -0,0 +1,89 @@
+"""
+Stateless, rotating QR tokens.
+
+A rotating code is projected as a signed token that names the QR code, its
+subject and the current time window, e.g.
+
+    r1.<qr id hex>.<subject id>.<window>.<signature>
+
+Scans check the HMAC signature and that the window is current (or within
+QR_ROTATION_GRACE_WINDOWS of it) without touching the database; only scans
+that pass load the AttendanceQRCode row. A screenshot stops working once
+its window has passed.
+"""
+
+import base64
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+PREFIX = 'r1'
+KEY_SALT = 'student_management_app.signed_tokens'
+
+SignedToken = namedtuple('SignedToken', ['qr_id', 'subject_id', 'window'])
+
+
+def is_signed(token):
+    return bool(token) and token.startswith(PREFIX + '.')
+
+
+def current_window(at=None):
+    """Index of the rotation window containing the given Unix time (default now)."""
+    return int((time.time() if at is None else at) // settings.QR_ROTATION_SECONDS)
+
+
+def seconds_until_rotation(at=None):
+    at = time.time() if at is None else at
+    return settings.QR_ROTATION_SECONDS - (at % settings.QR_ROTATION_SECONDS)
+
+
+def _signature(payload):
+    digest = salted_hmac(KEY_SALT, payload, algorithm='sha256').digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def sign(qr_code, window=None):
+    """Signed token for qr_code in the given rotation window (default: the current one)."""
+    window = current_window() if window is None else window
+    payload = f"{PREFIX}.{qr_code.id.hex}.{qr_code.subject_id}.{window}"
+    return f"{payload}.{_signature(payload)}"
+
+
+def parse(token):
+    """
+    Split a signed token into its fields without checking the signature.
+
+    Returns:
+    - SignedToken, or None if the token is not well formed
+    """
+    if not is_signed(token):
+        return None
+    parts = token.split('.')
+    if len(parts) != 5:
+        return None
+    try:
+        return SignedToken(uuid.UUID(hex=parts[1]), int(parts[2]), int(parts[3]))
+    except ValueError:
+        return None
+
+
+def verify(token, at=None):
+    """
+    Check a signed token's signature and freshness.
+
+    Returns:
+    - SignedToken if the token is authentic and its window is current, otherwise None
+    """
+    signed = parse(token)
+    if signed is None:
+        return None
+    payload, _, signature = token.rpartition('.')
+    if not constant_time_compare(signature, _signature(payload)):
+        return None
+    window = current_window(at)
+    if not window - settings.QR_ROTATION_GRACE_WINDOWS <= signed.window <= window:
+        return None
+    return signed
@@ -0,0 +1,32 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File storage that names each file by the SHA-256 of its content.
+
+    Files land in two levels of shard directories under the upload_to
+    prefix (qr_codes/ab/cd/abcd....png), so no directory grows large.
+    Saving content that is already stored returns the existing name instead
+    of writing a suffixed copy.
+    """
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(directory, digest[:2], digest[2:4], digest + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+qr_image_storage = ContentAddressedStorage()
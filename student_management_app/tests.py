@@ -1,3 +1,1514 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import inspect
+import json
+import os
+import re
+import shutil
+import tempfile
+import tracemalloc
+import uuid
+from collections import Counter
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import QuerySet
+from django.contrib import admin
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from student_management_app.models import (
+    CustomUser, Courses, Subjects, Students, SessionYearModel,
+    Attendance, AttendanceReport, AttendanceQRCode, AttendanceSummary, ClassSchedule, DailyAttendanceRollup, ExportJob
+)
+from geopy.distance import geodesic
+from openpyxl import Workbook, load_workbook
+from openpyxl.worksheet import _writer as openpyxl_writer
+from openpyxl.writer.excel import ExcelWriter
+from PIL import Image
+
+from student_management_app import (
+    attendance_export, attendance_summary, checkin_events, checkin_journal, dashboard_cache, export_formats, export_jobs, geofence,
+    idempotency, qr_decode, qr_registry, signed_tokens, xlsx_stream
+)
+from student_management_app.checkin_events import CheckInBus
+from student_management_app.checkin import (
+    CheckInError, DuplicateCheckIn, aresolve_qr_code, check_in, get_attendance_session, resolve_qr_code, resolve_scan
+)
+from student_management_app.checkin_journal import CheckInJournal
+from student_management_app.utils import is_within_radius
+
+
+def create_class(student_count=1):
+    """Create a course, session, subject, live QR code and enrolled students."""
+    course = Courses.objects.create(course_name="Test Course")
+    session = SessionYearModel.objects.create(
+        session_start_year=datetime.date(2024, 1, 1),
+        session_end_year=datetime.date(2024, 12, 31)
+    )
+    staff_user = CustomUser.objects.create_user(
+        username="test_staff", email="staff@test.com", password="pass", user_type="2"
+    )
+    subject = Subjects.objects.create(
+        subject_name="Test Subject", course_id=course, staff_id=staff_user.staffs
+    )
+    qr_code = AttendanceQRCode.objects.create(
+        subject=subject,
+        session_year=session,
+        expiry_time=now() + datetime.timedelta(minutes=30),
+        token=str(uuid.uuid4())
+    )
+    users = []
+    for i in range(student_count):
+        user = CustomUser.objects.create_user(
+            username=f"test_student{i}", email=f"student{i}@test.com", password="pass", user_type="3"
+        )
+        Students.objects.filter(admin=user).update(course_id=course, session_year_id=session)
+        users.append(user)
+    return qr_code, users
+
+
+class CheckInTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=3)
+
+    def test_resolve_qr_code_ignores_expired_and_inactive(self):
+        self.assertEqual(resolve_qr_code(self.qr_code.token), self.qr_code)
+        self.qr_code.is_active = False
+        self.qr_code.save()
+        self.assertIsNone(resolve_qr_code(self.qr_code.token))
+        self.assertIsNone(resolve_qr_code(""))
+
+    def test_duplicate_scan_fails_on_insert(self):
+        check_in(self.qr_code, self.users[0].id)
+        with self.assertRaises(DuplicateCheckIn):
+            check_in(self.qr_code, self.users[0].id)
+        self.assertEqual(AttendanceReport.objects.count(), 1)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_concurrent_first_scans_share_one_session(self):
+        subject_id, session_year_id = self.qr_code.subject_id, self.qr_code.session_year_id
+        existing = Attendance.objects.create(
+            subject_id_id=subject_id, session_year_id_id=session_year_id, attendance_date=datetime.date.today()
+        )
+        # The other scan's session is committed after this one looked for it
+        with mock.patch.object(QuerySet, "first", return_value=None):
+            self.assertEqual(get_attendance_session(subject_id, session_year_id), existing)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_check_in_query_count_is_fixed(self):
+        qr_code = resolve_qr_code(self.qr_code.token)
+        # First scan of the day also captures the enrolment and creates the session
+        check_in(qr_code, self.users[0].id)
+        for user in self.users[1:]:
+            # Transaction open/close, the report insert and the summary and daily
+            # rollup upserts; the session id is cached
+            with self.assertNumQueries(5):
+                check_in(qr_code, user.id)
+
+    def test_students_outside_the_enrolment_are_rejected(self):
+        outsider = CustomUser.objects.create_user(
+            username="outsider", email="outsider@test.com", password="pass", user_type="3"
+        )
+        Students.objects.filter(admin=outsider).update(
+            course_id=Courses.objects.create(course_name="Other Course")
+        )
+        with self.assertRaisesMessage(CheckInError, 'not enrolled'):
+            check_in(self.qr_code, outsider.id)
+        # The snapshot is fixed for the code's lifetime, even after enrolling
+        Students.objects.filter(admin=outsider).update(
+            course_id=self.qr_code.subject.course_id, session_year_id=self.qr_code.session_year
+        )
+        with self.assertRaises(CheckInError):
+            check_in(self.qr_code, outsider.id)
+
+    def test_staff_progress_reports_expected_and_checked_in(self):
+        check_in(self.qr_code, self.users[0].id)
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        response = self.client.get(f"/staff_qr_progress/?token={self.qr_code.token}")
+        self.assertEqual(response.json()["expected"], 3)
+        self.assertEqual(response.json()["checked_in"], 1)
+
+    def test_process_qr_scan_view(self):
+        self.client.force_login(self.users[0])
+        url = "/student_process_qr_scan/"
+        body = json.dumps({"token": self.qr_code.token})
+        response = self.client.post(url, body, content_type="application/json")
+        self.assertEqual(response.json()["status"], "success")
+        # Without the stored response (e.g. another worker) the insert rejects the repeat
+        cache.clear()
+        response = self.client.post(url, body, content_type="application/json")
+        self.assertEqual(response.json()["status"], "error")
+        self.assertIn("already marked", response.json()["message"])
+
+
+
+class CheckInSessionCacheTests(TransactionTestCase):
+    """Foreign keys are only checked on commit, so these need real transactions."""
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=2)
+
+    def test_scans_after_the_session_is_deleted(self):
+        check_in(self.qr_code, self.users[0].id)
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        response = self.client.post("/delete_attendance/", {"attendance_id": Attendance.objects.get().id})
+        self.assertEqual(response.json()["status"], "success")
+
+        check_in(self.qr_code, self.users[0].id)
+        self.assertEqual(AttendanceReport.objects.get().attendance_id, Attendance.objects.get())
+
+    def test_a_stale_cached_session_is_looked_up_again(self):
+        check_in(self.qr_code, self.users[0].id)
+        attendance = Attendance.objects.get()
+        # As if the row were deleted without going through the ORM
+        cache.set(f"attendance_session_{self.qr_code.subject_id}_{self.qr_code.session_year_id}_"
+                  f"{datetime.date.today().isoformat()}", attendance.id + 100)
+
+        check_in(self.qr_code, self.users[1].id)
+        self.assertEqual(AttendanceReport.objects.filter(attendance_id=attendance).count(), 2)
+        with self.assertRaises(DuplicateCheckIn):
+            check_in(self.qr_code, self.users[1].id)
+
+
+class QRRegistryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, _ = create_class()
+
+    def test_registered_token_skips_database(self):
+        resolve_qr_code(self.qr_code.token)
+        hits = qr_registry.stats()['hits']
+        with self.assertNumQueries(0):
+            qr_code = resolve_qr_code(self.qr_code.token)
+        self.assertEqual(qr_code.subject.subject_name, "Test Subject")
+        self.assertEqual(qr_registry.stats()['hits'], hits + 1)
+
+    def test_expired_entry_is_a_miss(self):
+        self.qr_code.expiry_time = now() - datetime.timedelta(seconds=1)
+        qr_registry.register(self.qr_code)
+        self.assertIsNone(qr_registry.lookup(self.qr_code.token))
+
+    def test_deactivated_and_deleted_codes_are_evicted(self):
+        qr_registry.register(self.qr_code)
+        self.qr_code.is_active = False
+        self.qr_code.save()
+        self.assertIsNone(qr_registry.lookup(self.qr_code.token))
+
+        self.qr_code.is_active = True
+        qr_registry.register(self.qr_code)
+        self.qr_code.delete()
+        self.assertIsNone(qr_registry.lookup(self.qr_code.token))
+
+    async def test_async_resolve_uses_the_async_cache_api(self):
+        # The blocking calls would stall the event loop on a network cache
+        blocking = AssertionError("blocking cache call on the event loop")
+        async_cache = mock.Mock(get=mock.Mock(side_effect=blocking), set=mock.Mock(side_effect=blocking))
+        async_cache.aget = mock.AsyncMock(side_effect=cache.aget)
+        async_cache.aset = mock.AsyncMock(side_effect=cache.aset)
+        with mock.patch.object(qr_registry, "cache", async_cache):
+            self.assertEqual(await aresolve_qr_code(self.qr_code.token), self.qr_code)
+            self.assertEqual(await aresolve_qr_code(self.qr_code.token), self.qr_code)
+        async_cache.aset.assert_awaited_once()
+        self.assertEqual(async_cache.aget.await_count, 2)
+
+
+class CheckInJournalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=3)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def journal(self):
+        journal = CheckInJournal(self.directory, batch_size=2, fsync=False, background=False)
+        self.addCleanup(journal.close)
+        return journal
+
+    def test_flush_bulk_inserts_journalled_scans(self):
+        journal = self.journal()
+        for user in self.users:
+            journal.append(self.qr_code, user.id, {"location_verified": True})
+        with self.assertRaises(DuplicateCheckIn):
+            journal.append(self.qr_code, self.users[0].id, {})
+        self.assertEqual(AttendanceReport.objects.count(), 0)
+
+        self.assertEqual(journal.flush(), 3)
+        self.assertEqual(AttendanceReport.objects.filter(location_verified=True).count(), 3)
+        self.assertEqual(Attendance.objects.count(), 1)
+
+    def test_replay_after_crash_is_exactly_once(self):
+        journal = self.journal()
+        journal.append(self.qr_code, self.users[0].id, {})
+        check_in(self.qr_code, self.users[1].id)
+        journal.append(self.qr_code, self.users[1].id, {})
+
+        # The process dies and a new one finds the unflushed journal on disk
+        journal.close()
+        with CheckInJournal(self.directory, fsync=False, background=False) as replayed:
+            self.assertEqual(replayed.replay(), 1)
+        self.assertEqual(self.journal().replay(), 0)
+        self.assertEqual(AttendanceReport.objects.count(), 2)
+        self.assertEqual(AttendanceSummary.objects.filter(present=1).count(), 2)
+
+    def test_next_journal_flushes_what_the_last_one_left(self):
+        journal = self.journal()
+        journal.append(self.qr_code, self.users[0].id, {})
+        journal.close()
+
+        # A restarted web process opens the journal before anyone replays it
+        self.assertEqual(self.journal().flush(), 1)
+        self.assertEqual(AttendanceReport.objects.count(), 1)
+
+    def test_failed_append_can_be_retried(self):
+        journal = CheckInJournal(self.directory, fsync=True, background=False)
+        self.addCleanup(journal.close)
+        with mock.patch("os.fsync", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                journal.append(self.qr_code, self.users[0].id, {})
+        journal.append(self.qr_code, self.users[0].id, {})
+        self.assertEqual(journal.flush(), 1)
+
+    @skipUnless(checkin_journal.LOCKING_AVAILABLE, "fcntl is not available")
+    def test_replay_refuses_a_journal_in_use(self):
+        journal = self.journal()
+        journal.append(self.qr_code, self.users[0].id, {})
+        with self.assertRaisesMessage(CommandError, "in use by another process"):
+            call_command("replay_checkin_journal", directory=self.directory, stdout=StringIO())
+        self.assertEqual(AttendanceReport.objects.count(), 0)
+
+        journal.close()
+        out = StringIO()
+        call_command("replay_checkin_journal", directory=self.directory, stdout=out)
+        self.assertIn("Inserted 1 attendance reports", out.getvalue())
+
+    def test_summary_counts_only_rows_actually_inserted(self):
+        journal = self.journal()
+        for user in self.users[:2]:
+            journal.append(self.qr_code, user.id, {})
+        check_in(self.qr_code, self.users[1].id)
+
+        # As if the live check-in committed between the duplicate check and the insert
+        with mock.patch.object(AttendanceReport.objects, "filter", return_value=AttendanceReport.objects.none()):
+            self.assertEqual(journal.flush(), 1)
+        self.assertEqual(AttendanceReport.objects.count(), 2)
+        self.assertEqual(AttendanceSummary.objects.get(student=self.users[1].students).present, 1)
+        self.assertEqual(DailyAttendanceRollup.objects.get().present, 2)
+
+    def test_check_in_uses_journal_in_write_behind_mode(self):
+        checkin_journal._journal = self.journal()
+        self.addCleanup(setattr, checkin_journal, "_journal", None)
+        with override_settings(CHECKIN_WRITE_BEHIND=True):
+            self.assertIsNone(check_in(self.qr_code, self.users[0].id))
+        self.assertEqual(AttendanceReport.objects.count(), 0)
+        self.assertEqual(checkin_journal.get_journal().flush(), 1)
+
+
+class GeofenceTests(TestCase):
+    teacher = (28.6139, 77.2090)
+
+    def point_at(self, meters, bearing=45):
+        destination = geodesic(meters=meters).destination(self.teacher, bearing)
+        return destination.latitude, destination.longitude
+
+    def test_haversine_matches_geodesic_at_classroom_scale(self):
+        for meters in (5, 50, 100, 250):
+            lat, lon = self.point_at(meters)
+            distance = geofence.haversine_distance(lat, lon, *self.teacher)
+            self.assertLess(abs(distance - meters), 0.5)
+
+    def test_is_within_radius_contract_near_the_boundary(self):
+        # Just inside and just outside the radius take the geodesic fallback
+        inside = is_within_radius(*self.point_at(99.9), *self.teacher, 100, 20)
+        outside = is_within_radius(*self.point_at(100.1), *self.teacher, 100, 20)
+        self.assertTrue(inside['is_within'])
+        self.assertFalse(outside['is_within'])
+        self.assertEqual(
+            set(inside),
+            {'is_within', 'distance', 'error_margin', 'is_reliable', 'effective_radius', 'original_radius'}
+        )
+        missing = is_within_radius(None, None, *self.teacher, 100)
+        self.assertFalse(missing['is_within'])
+
+    def test_batch_agrees_with_single_checks(self):
+        qr_code = AttendanceQRCode(
+            teacher_latitude=self.teacher[0], teacher_longitude=self.teacher[1], allowed_radius=100
+        )
+        points = []
+        for i, meters in enumerate((10, 85, 89.9, 95, 99.99, 100.01, 150)):
+            accuracy = None if i % 2 else 5
+            points.append((*self.point_at(meters, bearing=i * 50), accuracy))
+        result = geofence.verify_batch(points, qr_code)
+        for i, (lat, lon, accuracy) in enumerate(points):
+            single = is_within_radius(lat, lon, *self.teacher, 100, accuracy)
+            self.assertEqual(bool(result['is_within'][i]), single['is_within'])
+            self.assertEqual(bool(result['is_reliable'][i]), single['is_reliable'])
+
+
+class QRDecodePipelineTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.seen_sizes = []
+
+    def photo(self, size=(4000, 3000)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'white').save(buffer, format='JPEG')
+        return buffer.getvalue()
+
+    def fake_decoder(self, token, stage_width):
+        def decode(image):
+            self.seen_sizes.append(image.size)
+            self.assertEqual(image.mode, 'L')
+            return token if image.size[0] == stage_width else None
+        return decode
+
+    def use_decoder(self, decoder):
+        patcher = mock.patch.multiple(qr_decode, DECODERS={'fake': decoder}, DECODER_ORDER=['fake'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_crops_are_tried_before_the_downscaled_full_frame(self):
+        self.use_decoder(self.fake_decoder('abc', stage_width=qr_decode.MAX_SIDE))
+        result = qr_decode.decode_upload(BytesIO(self.photo()), workers=0)
+        self.assertEqual(result, qr_decode.DecodeResult('abc', 'fake', 'full'))
+        self.assertEqual(self.seen_sizes, [(640, 480), (960, 720), (1280, 960)])
+        self.assertEqual(qr_decode.stats()['fake:full'], 1)
+
+    def test_falls_back_to_full_resolution(self):
+        self.use_decoder(self.fake_decoder('abc', stage_width=4000))
+        result = qr_decode.decode_upload(BytesIO(self.photo()), workers=0)
+        self.assertEqual(result.stage, 'full_resolution')
+
+    def test_upload_view_uses_pipeline(self):
+        qr_code, users = create_class()
+        self.use_decoder(self.fake_decoder(qr_code.token, stage_width=320))
+        self.client.force_login(users[0])
+        with override_settings(QR_DECODE_WORKERS=0):
+            response = self.client.post('/student_upload_qr/', {
+                'qr_image': SimpleUploadedFile('qr.jpg', self.photo((640, 640)), content_type='image/jpeg'),
+            })
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(response.json()['decode_stage'], 'center_50')
+
+    def test_overrunning_worker_is_killed_and_replaced(self):
+        self.addCleanup(setattr, qr_decode, '_pool', None)
+        patcher = mock.patch.object(qr_decode, '_counters', Counter())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        pool = qr_decode._get_pool(1)
+        self.addCleanup(pool.close)
+        self.assertIs(qr_decode._get_pool(1), pool)
+
+        # Start-up is outside the budget, so even a first decode has its full time
+        self.assertIsNone(qr_decode.decode_upload(BytesIO(self.photo((64, 64))), workers=1, timeout=2))
+        self.assertEqual(qr_decode.stats()['not_found'], 1)
+
+        # The worker is still busy when the budget runs out
+        stuck = pool._idle.queue[0]
+        with mock.patch.object(stuck.conn, "poll", return_value=False):
+            self.assertIsNone(qr_decode.decode_upload(BytesIO(self.photo()), workers=1, timeout=0.1))
+        self.assertEqual(qr_decode.stats()['timeout'], 1)
+        self.assertFalse(stuck.process.is_alive())
+        self.assertIsNot(pool._idle.queue[0], stuck)
+        self.assertEqual(pool._idle.qsize(), 1)
+        self.assertIsNone(qr_decode.decode_upload(BytesIO(self.photo((64, 64))), workers=1, timeout=2))
+        self.assertEqual(qr_decode.stats()['not_found'], 2)
+
+        # A new size replaces the pool and stops the old workers
+        resized = qr_decode._get_pool(2)
+        self.addCleanup(resized.close)
+        self.assertIsNot(resized, pool)
+        self.assertTrue(pool.closed)
+        self.assertEqual(pool._idle.qsize(), 0)
+
+
+class AsyncEndpointTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=2)
+        self.async_client.force_login(self.users[0])
+
+    async def test_scan_then_status(self):
+        status_url = f'/student_checkin_status/?token={self.qr_code.token}'
+        response = await self.async_client.get(status_url)
+        self.assertFalse(response.json()['checked_in'])
+
+        scan = json.dumps({'token': self.qr_code.token})
+        response = await self.async_client.post(
+            '/student_process_qr_scan_async/', scan, content_type='application/json'
+        )
+        self.assertEqual(response.json()['status'], 'success')
+        response = await self.async_client.post(
+            '/student_process_qr_scan_async/', scan, content_type='application/json'
+        )
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+        response = await self.async_client.get(status_url)
+        self.assertTrue(response.json()['checked_in'])
+        self.assertEqual(await AttendanceReport.objects.acount(), 1)
+
+    async def test_roster(self):
+        staff_user = await CustomUser.objects.aget(username='test_staff')
+        await sync_to_async(self.async_client.force_login)(staff_user)
+        response = await self.async_client.post('/get_students_async/', {
+            'subject': self.qr_code.subject_id,
+            'session_year': self.qr_code.session_year_id,
+        })
+        self.assertEqual(sorted(student['id'] for student in response.json()), sorted(user.id for user in self.users))
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=2)
+        self.client.force_login(self.users[0])
+
+    def scan(self, **headers):
+        return self.client.post(
+            '/student_process_qr_scan/', json.dumps({'token': self.qr_code.token}),
+            content_type='application/json', headers=headers
+        )
+
+    def test_repeat_scan_replays_original_response(self):
+        first = self.scan()
+        absorbed = idempotency.stats()['absorbed']
+        with CaptureQueriesContext(connection) as queries:
+            second = self.scan()
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(idempotency.stats()['absorbed'], absorbed + 1)
+        # Only the session and user lookups of the auth middleware remain
+        self.assertFalse([q for q in queries.captured_queries if 'attendance' in q['sql'].lower()])
+
+    def test_replays_are_scoped_to_the_user(self):
+        self.scan(**{'Idempotency-Key': 'abc'})
+        self.client.force_login(self.users[1])
+        response = self.scan(**{'Idempotency-Key': 'abc'})
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(AttendanceReport.objects.count(), 2)
+
+
+class CheckInFeedTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=3)
+        patcher = mock.patch.object(checkin_events, '_bus', CheckInBus())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        self.url = f"/staff_checkin_feed/?token={self.qr_code.token}"
+
+    def read_feed(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        return b"".join(response.streaming_content).decode()
+
+    def test_feed_sends_history_then_resumes_after_last_event(self):
+        check_in(self.qr_code, self.users[0].id)
+        body = self.read_feed()
+        self.assertIn('"expected": 3', body)
+        self.assertIn("id: 1\n", body)
+
+        check_in(self.qr_code, self.users[1].id)
+        body = self.read_feed(**{'Last-Event-ID': '1'})
+        self.assertIn("id: 2\n", body)
+        self.assertNotIn("id: 1\n", body)
+
+    def test_feed_cost_does_not_grow_with_check_ins(self):
+        check_in(self.qr_code, self.users[0].id)
+        self.read_feed()
+        with CaptureQueriesContext(connection) as one_check_in:
+            self.read_feed()
+        check_in(self.qr_code, self.users[1].id)
+        check_in(self.qr_code, self.users[2].id)
+        with CaptureQueriesContext(connection) as three_check_ins:
+            body = self.read_feed()
+        self.assertIn("id: 3\n", body)
+        self.assertEqual(len(three_check_ins), len(one_check_in))
+
+    def test_channel_is_seeded_from_existing_reports(self):
+        check_in(self.qr_code, self.users[0].id)
+        # A fresh process has an empty bus
+        with mock.patch.object(checkin_events, '_bus', CheckInBus()):
+            body = self.read_feed()
+        self.assertIn("id: 1\n", body)
+
+    async def test_waiting_viewer_is_woken_by_publish(self):
+        bus = CheckInBus()
+        waiting = asyncio.ensure_future(bus.wait(self.qr_code, 0, timeout=5))
+        await asyncio.sleep(0)
+        await sync_to_async(bus.publish, thread_sensitive=False)(self.qr_code, 1, "Test Student")
+        events = await asyncio.wait_for(waiting, 1)
+        self.assertEqual([event['name'] for event in events], ["Test Student"])
+
+    @override_settings(CHECKIN_FEED_POLL_SECONDS=0.05)
+    async def test_check_ins_reach_viewers_in_other_processes(self):
+        # Each bus stands for a server process; only the cache is shared
+        wsgi_bus, asgi_bus = CheckInBus(), CheckInBus()
+        waiting = asyncio.ensure_future(asgi_bus.wait(self.qr_code, 0, timeout=5))
+        await asyncio.sleep(0)
+        await sync_to_async(wsgi_bus.publish, thread_sensitive=False)(self.qr_code, 1, "First Student")
+        events = await asyncio.wait_for(waiting, 1)
+        self.assertEqual([(event['id'], event['name']) for event in events], [(1, "First Student")])
+
+        # Ids are shared too, so resuming on either process continues the sequence
+        await sync_to_async(asgi_bus.publish, thread_sensitive=False)(self.qr_code, 2, "Second Student")
+        events = await sync_to_async(wsgi_bus.events_after, thread_sensitive=False)(self.qr_code.token, 1)
+        self.assertEqual([(event['id'], event['name']) for event in events], [(2, "Second Student")])
+
+    @override_settings(CHECKIN_FEED_STREAM_SECONDS=0.5)
+    async def test_asgi_stream_pushes_new_check_ins(self):
+        staff_user = await CustomUser.objects.aget(username="test_staff")
+        await sync_to_async(self.async_client.force_login)(staff_user)
+        response = await self.async_client.get(self.url)
+        await sync_to_async(check_in)(self.qr_code, self.users[0].id)
+        body = "".join([chunk.decode() async for chunk in response.streaming_content])
+        self.assertIn("id: 1\n", body)
+
+
+class QRImageStorageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.qr_code, _ = create_class()
+
+    def test_images_are_hash_named_and_deduplicated(self):
+        self.qr_code.qr_code_image.save("qr_1_1.png", ContentFile(b"png bytes"), save=True)
+        first = self.qr_code.qr_code_image.name
+        self.qr_code.qr_code_image.save("qr_1_1.png", ContentFile(b"png bytes"), save=True)
+        self.assertEqual(self.qr_code.qr_code_image.name, first)
+        digest = first.rsplit("/", 1)[1][:-4]
+        self.assertEqual(first, f"qr_codes/{digest[:2]}/{digest[2:4]}/{digest}.png")
+
+    def test_sweep_removes_expired_images_and_deactivates(self):
+        self.qr_code.qr_code_image.save("qr.png", ContentFile(b"expired"), save=False)
+        self.qr_code.expiry_time = now() - datetime.timedelta(minutes=1)
+        self.qr_code.save()
+        live = AttendanceQRCode.objects.create(
+            subject=self.qr_code.subject, session_year=self.qr_code.session_year,
+            expiry_time=now() + datetime.timedelta(minutes=30), token=str(uuid.uuid4())
+        )
+        live.qr_code_image.save("qr.png", ContentFile(b"live"), save=True)
+        expired_path = self.qr_code.qr_code_image.path
+
+        out = StringIO()
+        call_command("sweep_qr_codes", stdout=out)
+
+        self.qr_code.refresh_from_db()
+        self.assertFalse(self.qr_code.is_active)
+        self.assertEqual(self.qr_code.qr_code_image.name, "")
+        self.assertFalse(os.path.exists(expired_path))
+        self.assertTrue(os.path.exists(live.qr_code_image.path))
+        self.assertIn("Reclaimed 7 bytes", out.getvalue())
+
+
+class QRRenderTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, _ = create_class()
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+
+    def test_renders_png_and_svg_with_strong_etag(self):
+        response = self.client.get(f"/qr_image/{self.qr_code.token}.png")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertTrue(response.content.startswith(b"\x89PNG"))
+        self.assertIn("immutable", response["Cache-Control"])
+
+        svg = self.client.get(f"/qr_image/{self.qr_code.token}.svg")
+        self.assertEqual(svg["Content-Type"], "image/svg+xml")
+        self.assertNotEqual(svg["ETag"], response["ETag"])
+
+        qr_registry.register(self.qr_code)
+        with self.assertNumQueries(2):  # session and user; the token is found in the registry
+            cached = self.client.get(
+                f"/qr_image/{self.qr_code.token}.png", headers={"If-None-Match": response["ETag"]}
+            )
+        self.assertEqual(cached.status_code, 304)
+
+    def test_unknown_token_or_format_is_404(self):
+        self.assertEqual(self.client.get("/qr_image/nope.png").status_code, 404)
+        self.assertEqual(self.client.get(f"/qr_image/{self.qr_code.token}.gif").status_code, 404)
+
+    def test_removed_token_is_404_even_with_a_matching_etag(self):
+        response = self.client.get(f"/qr_image/{self.qr_code.token}.png")
+        qr_registry.evict(self.qr_code.token)
+        self.qr_code.delete()
+        response = self.client.get(
+            f"/qr_image/{self.qr_code.token}.png", headers={"If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_generate_returns_urls_without_writing_an_image(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with override_settings(MEDIA_ROOT=media_root):
+            response = self.client.post("/staff_generate_qr/", {
+                "subject": self.qr_code.subject_id,
+                "session_year": self.qr_code.session_year_id,
+            })
+        data = response.json()
+        self.assertNotIn("qr_data_url", data)
+        self.assertEqual(data["qr_code_url"], f"/qr_image/{data['token']}.png")
+        self.assertEqual(os.listdir(media_root), [])
+        self.assertEqual(self.client.get(data["qr_svg_url"]).status_code, 200)
+
+
+class SignedTokenTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class()
+        AttendanceQRCode.objects.filter(pk=self.qr_code.pk).update(rotating=True)
+        self.qr_code.refresh_from_db()
+
+    def test_verify_checks_signature_and_window(self):
+        token = signed_tokens.sign(self.qr_code)
+        with self.assertNumQueries(0):
+            signed = signed_tokens.verify(token)
+        self.assertEqual(signed.qr_id, self.qr_code.id)
+        self.assertEqual(signed.subject_id, self.qr_code.subject_id)
+
+        tampered = signed_tokens.sign(self.qr_code).replace(f".{self.qr_code.subject_id}.", ".999.")
+        self.assertIsNone(signed_tokens.verify(tampered))
+        self.assertIsNone(signed_tokens.verify("r1.garbage"))
+
+        window = signed_tokens.current_window()
+        grace = settings.QR_ROTATION_GRACE_WINDOWS
+        self.assertIsNotNone(signed_tokens.verify(signed_tokens.sign(self.qr_code, window - grace)))
+        self.assertIsNone(signed_tokens.verify(signed_tokens.sign(self.qr_code, window - grace - 1)))
+        self.assertIsNone(signed_tokens.verify(signed_tokens.sign(self.qr_code, window + 1)))
+
+    def test_rotating_code_only_accepts_signed_tokens(self):
+        self.assertIsNone(resolve_scan(self.qr_code.token))
+        self.assertEqual(resolve_scan(signed_tokens.sign(self.qr_code)), self.qr_code)
+
+    def test_signed_scan_and_rotating_token_views(self):
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        data = self.client.get(f"/staff_rotating_token/?token={self.qr_code.token}").json()
+        self.assertTrue(signed_tokens.is_signed(data["token"]))
+        self.assertEqual(self.client.get(data["qr_svg_url"]).status_code, 200)
+
+        self.client.force_login(self.users[0])
+        response = self.client.post(
+            "/student_process_qr_scan/", json.dumps({"token": data["token"]}), content_type="application/json"
+        )
+        self.assertEqual(response.json()["status"], "success")
+
+
+class TimetableBatchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, _ = create_class()
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+
+    def post_batch(self, entries, **options):
+        body = dict(options, entries=entries)
+        return self.client.post("/staff_generate_qr_batch/", json.dumps(body), content_type="application/json")
+
+    def entry(self, start, end):
+        return {
+            "subject": self.qr_code.subject_id, "session_year": str(self.qr_code.session_year_id),
+            "start_time": start, "expiry_time": end,
+        }
+
+    def test_codes_are_inserted_at_once_and_open_in_their_window(self):
+        current = now()
+        entries = [
+            self.entry((current - datetime.timedelta(minutes=5)).isoformat(), (current + datetime.timedelta(hours=1)).isoformat()),
+            self.entry((current + datetime.timedelta(hours=2)).isoformat(), (current + datetime.timedelta(hours=3)).isoformat()),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_batch(entries, format="json")
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+
+        open_code, later_code = response.json()["codes"]
+        self.assertEqual(resolve_scan(open_code["token"]).token, open_code["token"])
+        self.assertIsNone(resolve_scan(later_code["token"]))
+        # Sheets can still be printed before the window opens
+        self.assertEqual(self.client.get(later_code["qr_code_url"]).status_code, 200)
+
+    @override_settings(QR_SHEET_WORKERS=0)
+    def test_returns_a_printable_sheet_with_a_page_per_code(self):
+        tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+        response = self.post_batch(
+            [self.entry("09:00", "10:00"), self.entry("11:00", "12:00"), self.entry("14:00", "15:00")], date=tomorrow
+        )
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertEqual(len(re.findall(rb"/Type\s*/Page\b", response.content)), 3)
+        self.assertEqual(AttendanceQRCode.objects.filter(start_time__date=tomorrow).count(), 3)
+
+    def test_rejects_other_staff_subjects_and_bad_windows(self):
+        other = CustomUser.objects.create_user(
+            username="other_staff", email="other@test.com", password="pass", user_type="2"
+        )
+        self.client.force_login(other)
+        self.assertEqual(self.post_batch([self.entry("09:00", "10:00")]).status_code, 400)
+
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        self.assertEqual(self.post_batch([self.entry("10:00", "09:00")]).status_code, 400)
+        self.assertEqual(AttendanceQRCode.objects.count(), 1)
+
+
+class ClassScheduleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=2)
+        weekday = datetime.date.today().weekday()
+        for day in (weekday, (weekday + 1) % 7):
+            ClassSchedule.objects.create(
+                subject=self.qr_code.subject, session_year=self.qr_code.session_year, weekday=day,
+                start_time=datetime.time(0, 0), end_time=datetime.time(23, 59, 59), room="101"
+            )
+
+    def test_prepares_todays_sessions_once(self):
+        call_command("prepare_class_sessions", stdout=StringIO())
+        call_command("prepare_class_sessions", stdout=StringIO())
+        self.assertEqual(Attendance.objects.count(), 1)
+        self.assertEqual(Attendance.objects.get().attendance_date, datetime.date.today())
+
+    def test_first_scan_after_preparing_only_inserts(self):
+        call_command("prepare_class_sessions", stdout=StringIO())
+        qr_code = resolve_qr_code(self.qr_code.token)
+        # Transaction open/close, the report insert and the two counter upserts
+        with self.assertNumQueries(5):
+            check_in(qr_code, self.users[0].id)
+
+    def test_admin_form_rejects_a_class_that_ends_before_it_starts(self):
+        request = RequestFactory().get("/")
+        request.user = CustomUser.objects.create_superuser(
+            username="admin", email="admin@test.com", password="pass", user_type="1"
+        )
+        form = admin.site._registry[ClassSchedule].get_form(request)(data={
+            "subject": self.qr_code.subject_id, "session_year": self.qr_code.session_year_id,
+            "weekday": 0, "start_time": "10:00", "end_time": "09:00", "room": "",
+        })
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), ["Class must end after it starts."])
+
+
+# Measures the dashboard computation itself, so snapshots are off
+@override_settings(
+    STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage", DASHBOARD_CACHE=False
+)
+class AdminHomeTests(TestCase):
+
+    def setUp(self):
+        self.qr_code, users = create_class(student_count=10)
+        self.attendance = Attendance.objects.create(
+            subject_id=self.qr_code.subject, session_year_id=self.qr_code.session_year,
+            attendance_date=datetime.date.today()
+        )
+        AttendanceReport.objects.bulk_create([
+            AttendanceReport(student_id=user.students, attendance_id=self.attendance, status=True) for user in users
+        ])
+        call_command("rebuild_attendance_summary", stdout=StringIO())
+        self.client.force_login(CustomUser.objects.create_user(
+            username="test_hod", email="hod@test.com", password="pass", user_type="1"
+        ))
+
+    def add_students(self, count):
+        """Enrol count more students with a report each, skipping the per-user signals and the summary upkeep."""
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"bulk_student{i}", email=f"bulk{i}@test.com", user_type="3") for i in range(count)
+        ])
+        students = Students.objects.bulk_create([
+            Students(admin=user, course_id=self.qr_code.subject.course_id, session_year_id=self.qr_code.session_year)
+            for user in users
+        ])
+        AttendanceReport.objects.bulk_create([
+            AttendanceReport(student_id=student, attendance_id=self.attendance, status=True) for student in students
+        ])
+        call_command("rebuild_attendance_summary", stdout=StringIO())
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def get_charts(self):
+        charts, queries = {}, {}
+        for name in ("courses", "subjects", "staff", "students"):
+            response, queries[name] = self.get(f"/admin_home_chart/{name}/")
+            charts[name] = response.json()
+        return charts, queries
+
+    def test_query_count_does_not_grow_with_students(self):
+        response, small = self.get("/admin_home/")
+        self.assertEqual(response.context["all_student_count"], 10)
+        _, small_charts = self.get_charts()
+
+        self.add_students(9990)
+        response, large = self.get("/admin_home/")
+        self.assertEqual(large, small)
+        self.assertEqual(response.context["all_student_count"], 10000)
+        charts, large_charts = self.get_charts()
+        self.assertEqual(large_charts, small_charts)
+        self.assertEqual(charts["courses"]["datasets"][1]["data"], [10000])
+        self.assertEqual(charts["staff"]["datasets"][0]["data"], [1])
+        self.assertEqual(sum(charts["students"]["datasets"][0]["data"]), 10000)
+
+    def test_shell_does_not_compute_charts(self):
+        response, _ = self.get("/admin_home/")
+        self.assertNotIn("student_name_list", response.context)
+        self.assertContains(response, 'data-chart-url="/admin_home_chart/students/"')
+        self.assertEqual(self.client.get("/admin_home_chart/unknown/").status_code, 404)
+
+
+class AttendanceSummaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=3)
+        self.staff = CustomUser.objects.get(username="test_staff")
+
+    def assertSummaryMatchesReports(self):
+        current = {
+            (row.student_id, row.subject_id, row.session_year_id): (row.present, row.absent)
+            for row in AttendanceSummary.objects.exclude(present=0, absent=0)
+        }
+        self.assertEqual(current, attendance_summary.expected_rows())
+
+    def test_write_paths_keep_the_summary_in_step(self):
+        check_in(self.qr_code, self.users[0].id)
+        self.assertSummaryMatchesReports()
+
+        self.client.force_login(self.staff)
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        self.client.post("/save_attendance_data/", {
+            "student_ids": json.dumps([{"id": user.id, "status": i % 2} for i, user in enumerate(self.users)]),
+            "subject_id": self.qr_code.subject_id,
+            "attendance_date": yesterday,
+            "session_year_id": self.qr_code.session_year_id,
+        })
+        self.assertSummaryMatchesReports()
+        row = AttendanceSummary.objects.get(student=self.users[0].students)
+        self.assertEqual((row.present, row.absent, row.total), (1, 1, 2))
+
+        manual = Attendance.objects.get(attendance_date=yesterday)
+        self.client.post("/update_attendance_data/", {
+            "student_ids": json.dumps([{"id": self.users[0].id, "status": 1}]),
+            "attendance_date": manual.id,
+        })
+        self.assertSummaryMatchesReports()
+
+        self.client.post("/delete_attendance/", {"attendance_id": manual.id})
+        self.assertSummaryMatchesReports()
+        self.assertEqual(AttendanceSummary.objects.get(student=self.users[0].students).present, 1)
+
+    def test_a_failing_student_rolls_back_the_whole_batch(self):
+        self.client.force_login(self.staff)
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        # The unknown student fails after the first report has been written
+        batch = [{"id": self.users[0].id, "status": 1}, {"id": 0, "status": 1}, {"id": self.users[1].id, "status": 1}]
+        response = self.client.post("/save_attendance_data/", {
+            "student_ids": json.dumps(batch),
+            "subject_id": self.qr_code.subject_id,
+            "attendance_date": yesterday,
+            "session_year_id": self.qr_code.session_year_id,
+        })
+        self.assertTrue(response.content.startswith(b"Error"))
+        self.assertFalse(Attendance.objects.filter(attendance_date=yesterday).exists())
+        self.assertFalse(AttendanceSummary.objects.exclude(present=0, absent=0).exists())
+        self.assertFalse(DailyAttendanceRollup.objects.exclude(present=0, absent=0).exists())
+
+        self.client.post("/save_attendance_data/", {
+            "student_ids": json.dumps([{"id": user.id, "status": 0} for user in self.users]),
+            "subject_id": self.qr_code.subject_id,
+            "attendance_date": yesterday,
+            "session_year_id": self.qr_code.session_year_id,
+        })
+        manual = Attendance.objects.get(attendance_date=yesterday)
+        response = self.client.post("/update_attendance_data/", {
+            "student_ids": json.dumps(batch),
+            "attendance_date": manual.id,
+        })
+        self.assertEqual(response.content, b"Error")
+        self.assertFalse(AttendanceReport.objects.filter(attendance_id=manual, status=True).exists())
+        self.assertSummaryMatchesReports()
+        self.assertEqual(DailyAttendanceRollup.objects.get().absent, 3)
+
+    def test_rebuild_repairs_drift(self):
+        check_in(self.qr_code, self.users[0].id)
+        AttendanceSummary.objects.update(present=5)
+        out = StringIO()
+        call_command("rebuild_attendance_summary", "--check", stdout=out)
+        self.assertIn("1 rows out of date", out.getvalue())
+        call_command("rebuild_attendance_summary", stdout=StringIO())
+        self.assertSummaryMatchesReports()
+
+    def test_student_home_reads_the_summary(self):
+        check_in(self.qr_code, self.users[0].id)
+        AttendanceSummary.objects.update(present=7)
+        self.client.force_login(self.users[0])
+        with override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage"):
+            response = self.client.get("/student_home/")
+        self.assertEqual(response.context["attendance_present"], 7)
+        chart = self.client.get("/student_home_chart/subjects/").json()
+        self.assertEqual(chart["datasets"][0]["data"], [7])
+
+
+class AttendanceTrendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=3)
+        self.subject = self.qr_code.subject
+        # Two sessions a month apart, written through the manual save path
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        for days_ago, statuses in ((35, [1, 1, 0]), (0, [1, 0, 0])):
+            self.client.post("/save_attendance_data/", {
+                "student_ids": json.dumps([{"id": user.id, "status": status} for user, status in zip(self.users, statuses)]),
+                "subject_id": self.subject.id,
+                "attendance_date": (datetime.date.today() - datetime.timedelta(days=days_ago)).isoformat(),
+                "session_year_id": self.qr_code.session_year_id,
+            })
+
+    def test_daily_rollup_follows_writes(self):
+        rollup = {
+            (row.subject_id, row.session_year_id, row.date): (row.present, row.absent, row.location_verified)
+            for row in DailyAttendanceRollup.objects.all()
+        }
+        self.assertEqual(rollup, attendance_summary.expected_daily_rows())
+        self.assertEqual(sorted(rollup.values()), [(1, 2, 1), (2, 1, 2)])
+
+    def test_staff_and_hod_trend_series(self):
+        with self.assertNumQueries(3):  # session, user and the grouped rollup query
+            data = self.client.get("/staff_attendance_trend/?period=week").json()
+        self.assertEqual([point["present"] for point in data["series"]], [2, 1])
+        self.assertEqual(data["series"][1]["attendance_rate"], 33.3)
+
+        self.client.force_login(CustomUser.objects.create_user(
+            username="test_hod", email="hod@test.com", password="pass", user_type="1"
+        ))
+        data = self.client.get("/admin_attendance_trend/?period=month").json()
+        self.assertEqual(sum(point["total"] for point in data["series"]), 6)
+        self.assertEqual(self.client.get("/admin_attendance_trend/?period=decade").status_code, 400)
+
+    def test_other_staff_see_none_of_it(self):
+        self.client.force_login(CustomUser.objects.create_user(
+            username="other_staff", email="other@test.com", password="pass", user_type="2"
+        ))
+        self.assertEqual(self.client.get("/staff_attendance_trend/").json()["series"], [])
+
+
+@override_settings(STATICFILES_STORAGE="django.contrib.staticfiles.storage.StaticFilesStorage")
+class DashboardCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.qr_code, self.users = create_class(student_count=2)
+        self.staff = CustomUser.objects.get(username="test_staff")
+
+    def get(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.context, len(queries)
+
+    @override_settings(DASHBOARD_STALE_SECONDS=0)
+    def test_check_in_invalidates_only_affected_dashboards(self):
+        context, built = self.get(self.users[0], "/student_home/")
+        self.assertEqual(context["attendance_present"], 0)
+        self.get(self.users[1], "/student_home/")
+        context, cached = self.get(self.users[0], "/student_home/")
+        self.assertLess(cached, built)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in(self.qr_code, self.users[0].id)
+
+        context, queries = self.get(self.users[0], "/student_home/")
+        self.assertEqual(context["attendance_present"], 1)
+        self.assertEqual(queries, built)
+        # A classmate's page does not count this check-in, so it stays cached
+        context, queries = self.get(self.users[1], "/student_home/")
+        self.assertEqual(queries, cached)
+        self.client.force_login(self.staff)
+        chart = self.client.get("/staff_home_chart/students/").json()
+        self.assertEqual(chart["datasets"][0]["data"], [1, 0])
+
+    @override_settings(DASHBOARD_STALE_SECONDS=0)
+    def test_enrolment_invalidates_staff_dashboard(self):
+        context, _ = self.get(self.staff, "/staff_home/")
+        self.assertEqual(context["students_count"], 2)
+        user = CustomUser.objects.create_user(
+            username="late_student", email="late@test.com", password="pass", user_type="3"
+        )
+        Students.objects.filter(admin=user).update(course_id=self.qr_code.subject.course_id)
+        # update() sends no signal; saving the student does
+        user.students.refresh_from_db()
+        user.students.save()
+        context, _ = self.get(self.staff, "/staff_home/")
+        self.assertEqual(context["students_count"], 3)
+
+    def present(self):
+        return self.client.get("/staff_home_chart/students/").json()["datasets"][0]["data"]
+
+    def test_stale_snapshot_served_while_one_refresh_runs(self):
+        self.client.force_login(self.staff)
+        self.present()
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in(self.qr_code, self.users[0].id)
+
+        refreshes = []
+        with mock.patch.object(dashboard_cache, "_spawn", refreshes.append):
+            for _ in range(3):
+                self.assertEqual(self.present(), [0, 0])
+        self.assertEqual(len(refreshes), 1)
+
+        refreshes[0]()
+        self.assertEqual(self.present(), [1, 0])
+
+    def test_stale_window_starts_at_the_invalidation(self):
+        self.client.force_login(self.staff)
+        self.present()
+        # Built long before the check-in that invalidates it
+        key = dashboard_cache._snapshot_key("staff_chart_students", self.staff.id)
+        entry = cache.get(key)
+        cache.set(key, {**entry, "built_at": entry["built_at"] - 3600})
+        with self.captureOnCommitCallbacks(execute=True):
+            check_in(self.qr_code, self.users[0].id)
+
+        with mock.patch.object(dashboard_cache, "_spawn") as spawn:
+            self.assertEqual(self.present(), [0, 0])
+        spawn.assert_called_once()
+
+        # A snapshot first seen stale long after the check-in waits for a rebuild
+        cache.delete(f"{key}_stale_{entry['built_at'] - 3600}")
+        for dep in cache.get(key)["deps"]:
+            bumped_at = cache.get(dashboard_cache._bumped_key(dep))
+            if bumped_at is not None:
+                cache.set(dashboard_cache._bumped_key(dep), bumped_at - 3600)
+        self.assertEqual(self.present(), [1, 0])
+
+    def test_staff_home_snapshot_holds_plain_rows(self):
+        context, _ = self.get(self.staff, "/staff_home/")
+        subject = self.qr_code.subject
+        self.assertEqual(context["subjects"], [{
+            "id": subject.id, "subject_name": subject.subject_name,
+            "course_id": subject.course_id_id, "course_name": subject.course_id.course_name,
+        }])
+        self.assertContains(self.client.get("/staff_home/"), subject.course_id.course_name)
+
+    def test_unchanged_chart_revalidates_with_304(self):
+        self.client.force_login(self.staff)
+        response = self.client.get("/staff_home_chart/subjects/")
+        self.assertIn("private", response["Cache-Control"])
+        response = self.client.get("/staff_home_chart/subjects/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+
+class AttendanceExportTests(TestCase):
+
+    def setUp(self):
+        self.qr_code, self.users = create_class(student_count=3)
+        self.today = datetime.date.today().isoformat()
+        self.client.force_login(CustomUser.objects.get(username="test_staff"))
+        self.client.post("/save_attendance_data/", {
+            "student_ids": json.dumps([{"id": user.id, "status": i % 2} for i, user in enumerate(self.users)]),
+            "subject_id": self.qr_code.subject_id,
+            "attendance_date": self.today,
+            "session_year_id": self.qr_code.session_year_id,
+        })
+
+    def export(self, url, **data):
+        temp_files = len(openpyxl_writer.ALL_TEMP_FILES)
+        response = self.client.post(url, {"start_date": self.today, "end_date": self.today, **data})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        workbook = load_workbook(BytesIO(b"".join(response.streaming_content)))
+        # Rows went straight into the response, not through openpyxl's temp files
+        self.assertEqual(len(openpyxl_writer.ALL_TEMP_FILES), temp_files)
+        return workbook.active
+
+    def test_staff_export_keeps_the_import_layout(self):
+        sheet = self.export(
+            "/staff_export_attendance_data/",
+            subject=self.qr_code.subject_id, session_year=self.qr_code.session_year_id
+        )
+        rows = list(sheet.values)
+        self.assertEqual(rows[0], ("Student ID", "Student Name", "Date", "Status"))
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ["test_student0", "test_student1", "test_student2"])
+        self.assertTrue(sheet["A1"].font.b)
+        self.assertEqual(sheet.column_dimensions["A"].width, len("test_student0") + 2)
+
+    def test_student_export_has_title_and_statistics(self):
+        self.client.force_login(self.users[1])
+        sheet = self.export("/student_export_attendance_data/", subject="0")
+        self.assertTrue(sheet["A1"].value.startswith("Attendance Report - All Subjects"))
+        self.assertEqual({str(cell_range) for cell_range in sheet.merged_cells.ranges}, {"A1:F1", "A2:F2"})
+        self.assertEqual(sheet["A4"].value, "Date")
+        self.assertEqual(sheet["C5"].value, "Present")
+        self.assertEqual((sheet["A9"].value, sheet["B9"].value), ("Total Records:", 1))
+        # Sized by the statistics labels rather than the merged title
+        self.assertEqual(sheet.column_dimensions["A"].width, len("Location Verification Rate:") + 2)
+
+    def test_export_queries_do_not_depend_on_rows(self):
+        data = {
+            "subject": self.qr_code.subject_id, "session_year": self.qr_code.session_year_id,
+            "start_date": self.today, "end_date": self.today,
+        }
+        attendance = Attendance.objects.get()
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f"bulk_student{i}", email=f"bulk{i}@test.com", user_type="3") for i in range(200)
+        ])
+        students = Students.objects.bulk_create([
+            Students(admin=user, course_id=self.qr_code.subject.course_id, session_year_id=self.qr_code.session_year)
+            for user in users
+        ])
+        AttendanceReport.objects.bulk_create([
+            AttendanceReport(student_id=student, attendance_id=attendance, status=True) for student in students
+        ])
+        # Session, user, subject, session year, the two existence checks and the joined rows
+        with self.assertNumQueries(7):
+            response = self.client.post("/staff_export_attendance_data/", data)
+            rows = list(load_workbook(BytesIO(b"".join(response.streaming_content))).active.values)
+        self.assertEqual(len(rows), 204)
+
+        self.client.force_login(self.users[1])
+        # Session, user, student, subjects, existence check, the joined rows and the statistics aggregate
+        with self.assertNumQueries(6):
+            response = self.client.post("/student_export_attendance_data/", {**data, "subject": "0"})
+            b"".join(response.streaming_content)
+
+    def test_statistics_come_from_one_aggregate(self):
+        reports = AttendanceReport.objects.all()
+        with self.assertNumQueries(1):
+            stats = attendance_export.statistics(reports)
+        self.assertEqual(stats, {"total": 3, "present": 1, "absent": 2, "location_verified": 1})
+
+    def test_staff_export_as_csv(self):
+        response = self.client.post("/staff_export_attendance_data/", {
+            "subject": self.qr_code.subject_id, "session_year": self.qr_code.session_year_id,
+            "start_date": self.today, "end_date": self.today, "format": "csv",
+        })
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertTrue(response["Content-Disposition"].endswith('.csv"'))
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], ",".join(attendance_export.STAFF_COLUMNS))
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[1].startswith(f"test_student0,,,{self.today},"))
+
+    def test_student_export_as_jsonl(self):
+        self.client.force_login(self.users[1])
+        response = self.client.post("/student_export_attendance_data/", {
+            "subject": "0", "start_date": self.today, "end_date": self.today, "format": "jsonl",
+        })
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [{
+            "attendance_date": self.today, "subject_name": self.qr_code.subject.subject_name,
+            "status": True, "location_verified": True, "teacher_first_name": "", "teacher_last_name": "",
+        }])
+
+    def test_unknown_or_unavailable_format_is_an_error(self):
+        data = {
+            "subject": self.qr_code.subject_id, "session_year": self.qr_code.session_year_id,
+            "start_date": self.today, "end_date": self.today, "format": "xml",
+        }
+        response = self.client.post("/staff_export_attendance_data/", data)
+        self.assertEqual(response.json()["status"], "error")
+        with mock.patch.object(export_formats, "PARQUET_AVAILABLE", False):
+            response = self.client.post("/staff_export_attendance_data/", {**data, "format": "parquet"})
+        self.assertIn("pyarrow", response.json()["message"])
+
+    def test_admin_export_filters_and_formats(self):
+        self.client.force_login(CustomUser.objects.create_user(
+            username="test_hod", email="hod@test.com", password="pass", user_type="1"
+        ))
+        response = self.client.get("/admin_export_attendance_data/", {"course": self.qr_code.subject.course_id_id})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], ",".join(attendance_export.HOD_COLUMNS))
+        self.assertEqual(len(rows), 4)
+
+        response = self.client.get("/admin_export_attendance_data/", {"format": "xlsx", "end_date": "2000-01-01"})
+        self.assertEqual(list(load_workbook(BytesIO(b"".join(response.streaming_content))).active.values), [
+            tuple(attendance_export.HOD_COLUMNS)
+        ])
+        response = self.client.get("/admin_export_attendance_data/", {"start_date": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(export_formats.PARQUET_AVAILABLE, "pyarrow is not installed")
+    def test_admin_export_as_parquet(self):
+        import pyarrow.parquet as pq
+
+        self.client.force_login(CustomUser.objects.create_user(
+            username="test_hod", email="hod@test.com", password="pass", user_type="1"
+        ))
+        response = self.client.get("/admin_export_attendance_data/", {"format": "parquet"})
+        table = pq.read_table(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(table.column_names, list(attendance_export.HOD_COLUMNS))
+        self.assertEqual(sorted(table.column("status").to_pylist()), [False, False, True])
+        self.assertEqual(table.column("attendance_date").to_pylist(), [datetime.date.today()] * 3)
+
+    def test_staff_export_as_grid(self):
+        yesterday = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        self.client.post("/save_attendance_data/", {
+            "student_ids": json.dumps([{"id": user.id, "status": 1} for user in self.users[:2]]),
+            "subject_id": self.qr_code.subject_id,
+            "attendance_date": yesterday,
+            "session_year_id": self.qr_code.session_year_id,
+        })
+        data = {
+            "subject": self.qr_code.subject_id, "session_year": self.qr_code.session_year_id,
+            "start_date": yesterday, "end_date": self.today, "layout": "matrix", "format": "csv",
+        }
+        response = self.client.post("/staff_export_attendance_data/", data)
+        self.assertTrue(response["Content-Disposition"].endswith('_grid.csv"'))
+        rows = [row.split(",") for row in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [
+            ["Student ID", "Student Name", yesterday, self.today, "Present", "Absent", "Attendance %"],
+            ["test_student0", " ", "P", "A", "1", "1", "50.0"],
+            ["test_student1", " ", "P", "P", "2", "0", "100.0"],
+            ["test_student2", " ", "", "A", "0", "1", "0.0"],
+            ["Present", "", "2", "1", "3", "", ""],
+            ["Absent", "", "0", "2", "", "2", ""],
+        ])
+
+        response = self.client.post("/staff_export_attendance_data/", {**data, "format": "xlsx"})
+        sheet = load_workbook(BytesIO(b"".join(response.streaming_content))).active
+        self.assertEqual((sheet["C2"].value, sheet["D5"].value), ("P", 1))
+        self.assertTrue(sheet["A5"].font.b)
+
+        response = self.client.post("/staff_export_attendance_data/", {**data, "format": "jsonl"})
+        self.assertEqual(response.json()["status"], "error")
+
+    def test_grid_is_pivoted_from_one_query(self):
+        # The triples, then the student names
+        with self.assertNumQueries(2):
+            grid = attendance_export.matrix(AttendanceReport.objects.all())
+        self.assertEqual([username for username, _ in grid.students], ["test_student0", "test_student1", "test_student2"])
+        self.assertEqual(grid.grid.tolist(), [[0], [1], [0]])
+
+    def test_grid_counts_a_student_present_at_any_session_that_day(self):
+        # Sessions of two more subjects on the same day, in either order
+        for status in (True, False):
+            subject = Subjects.objects.create(
+                subject_name=f"Subject {status}", course_id=self.qr_code.subject.course_id,
+                staff_id=self.qr_code.subject.staff_id
+            )
+            second = Attendance.objects.create(
+                subject_id=subject, session_year_id=self.qr_code.session_year, attendance_date=datetime.date.today()
+            )
+            AttendanceReport.objects.bulk_create([
+                AttendanceReport(student_id=user.students, attendance_id=second, status=status) for user in self.users
+            ])
+        grid = attendance_export.matrix(AttendanceReport.objects.all())
+        self.assertEqual(grid.grid.tolist(), [[1], [1], [1]])
+
+        AttendanceReport.objects.filter(status=True).exclude(student_id=self.users[1].students).delete()
+        grid = attendance_export.matrix(AttendanceReport.objects.all())
+        self.assertEqual(grid.grid.tolist(), [[0], [1], [0]])
+
+    def test_openpyxl_internals_used_by_the_streaming_writer(self):
+        # xlsx_stream relies on these private openpyxl details; an upgrade that
+        # moves any of them has to fail here rather than produce broken files
+        self.assertIn("out", inspect.signature(openpyxl_writer.WorksheetWriter.__init__).parameters)
+        for method in ("write_top", "write_row", "write_tail", "close"):
+            self.assertTrue(hasattr(openpyxl_writer.WorksheetWriter, method), method)
+        self.assertIn("self.write_worksheet(", inspect.getsource(ExcelWriter._write_worksheets))
+
+        ws = Workbook(write_only=True).create_sheet("Sheet")
+        self.assertIsNone(ws._writer)
+        self.assertTrue(hasattr(ws, "_charts") and hasattr(ws, "_images"))
+        ws._id = 1
+        self.assertEqual(ws.path, "/xl/worksheets/sheet1.xml")
+        # A writer bound before the first append is used instead of a temp file
+        ws._writer = openpyxl_writer.WorksheetWriter(ws, out=BytesIO())
+        self.assertIsNotNone(ws._writer._rels)
+
+        rows = [["Title"], ["Subtitle"], ["a", 1]]
+        sheet = load_workbook(BytesIO(b"".join(xlsx_stream.stream_workbook(rows, merged=["A1:B1", "A2:B2"])))).active
+        self.assertEqual(list(sheet.values), [("Title", None), ("Subtitle", None), ("a", 1)])
+        self.assertEqual({str(cell_range) for cell_range in sheet.merged_cells.ranges}, {"A1:B1", "A2:B2"})
+
+    def test_memory_does_not_grow_with_rows(self):
+        def peak(count):
+            rows = ([f"student{i}", f"Student {i}", "2024-01-01", "Present"] for i in range(count))
+            tracemalloc.start()
+            for _ in xlsx_stream.stream_workbook(rows):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak
+
+        small, large = peak(2000), peak(20000)
+        self.assertLess(large, small * 1.5)
+
+
+@override_settings(EXPORT_JOB_WORKERS=0)
+class ExportJobTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, export_dir)
+        override = override_settings(EXPORT_JOB_DIR=export_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.qr_code, self.users = create_class(student_count=3)
+        self.staff = CustomUser.objects.get(username="test_staff")
+        self.today = datetime.date.today().isoformat()
+        self.client.force_login(self.staff)
+        self.save_attendance(self.today)
+        self.data = {
+            "subject": self.qr_code.subject_id, "session_year": self.qr_code.session_year_id,
+            "start_date": "2000-01-01", "end_date": "2099-12-31",
+        }
+
+    def save_attendance(self, date):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/save_attendance_data/", {
+                "student_ids": json.dumps([{"id": user.id, "status": 1} for user in self.users]),
+                "subject_id": self.qr_code.subject_id,
+                "attendance_date": date,
+                "session_year_id": self.qr_code.session_year_id,
+            })
+
+    def enqueue(self, url="/staff_export_job/", **data):
+        response = self.client.post(url, {**self.data, **data})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["job"]
+
+    def test_job_builds_the_same_file_as_the_direct_export(self):
+        job = self.enqueue()
+        self.assertEqual(job["status"], "queued")
+        self.assertIsNone(job["download_url"])
+
+        call_command("run_export_jobs", stdout=StringIO())
+        job = self.client.get(job["status_url"]).json()["job"]
+        self.assertEqual((job["status"], job["rows_written"], job["progress"]), ("done", 3, 100))
+        self.assertTrue(job["filename"].endswith("_20000101_20991231.xlsx"))
+
+        response = self.client.get(job["download_url"])
+        self.assertIn(job["filename"], response["Content-Disposition"])
+        rows = list(load_workbook(BytesIO(b"".join(response.streaming_content))).active.values)
+        self.assertEqual(rows[0], ("Student ID", "Student Name", "Date", "Status"))
+        self.assertEqual(len(rows), 4)
+
+    def test_identical_requests_share_a_job_until_the_data_changes(self):
+        first = self.enqueue()
+        self.assertEqual(self.enqueue()["id"], first["id"])
+        export_jobs.run_pending()
+        self.assertEqual(self.enqueue()["id"], first["id"])
+        self.assertNotEqual(self.enqueue(format="csv")["id"], first["id"])
+
+        self.save_attendance((datetime.date.today() - datetime.timedelta(days=1)).isoformat())
+        second = self.enqueue()
+        self.assertNotEqual(second["id"], first["id"])
+        export_jobs.run_pending()
+        self.assertEqual(self.client.get(second["status_url"]).json()["job"]["rows_written"], 6)
+
+    def test_jobs_are_visible_only_to_who_could_queue_them(self):
+        staff_job = self.enqueue()
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.client.get(staff_job["status_url"]).status_code, 404)
+
+        student_job = self.enqueue("/student_export_job/", subject="0", format="jsonl")
+        export_jobs.run_pending()
+        response = self.client.get(f"/export_job/{student_job['id']}/download/")
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 1)
+        self.client.force_login(self.users[1])
+        self.assertEqual(self.client.get(student_job["status_url"]).status_code, 404)
+
+    def test_staff_jobs_are_limited_to_the_subject_teacher(self):
+        staff_job = self.enqueue()
+        other_staff = CustomUser.objects.create_user(
+            username="other_staff", email="other@test.com", password="pass", user_type="2"
+        )
+        self.client.force_login(other_staff)
+        self.assertEqual(self.client.get(staff_job["status_url"]).status_code, 404)
+        self.assertEqual(self.client.get(f"/export_job/{staff_job['id']}/download/").status_code, 404)
+
+        response = self.client.post("/staff_export_job/", self.data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["message"], "You don't have permission to export this subject")
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+        # The subject's new teacher inherits its jobs
+        Subjects.objects.filter(id=self.qr_code.subject_id).update(staff_id=other_staff.staffs)
+        self.assertEqual(self.client.get(staff_job["status_url"]).status_code, 200)
+
+    def test_grid_layout_job(self):
+        job = self.enqueue(layout="matrix")
+        export_jobs.run_pending()
+        job = self.client.get(job["status_url"]).json()["job"]
+        self.assertTrue(job["filename"].endswith("_grid.xlsx"))
+        response = self.client.get(job["download_url"])
+        rows = list(load_workbook(BytesIO(b"".join(response.streaming_content))).active.values)
+        self.assertEqual(rows[1][:3], ("test_student0", " ", "P"))
+        self.assertEqual(len(rows), 6)
+
+    def test_invalid_or_empty_requests_are_rejected(self):
+        response = self.client.post("/staff_export_job/", {**self.data, "end_date": "tomorrow"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post("/staff_export_job/", {**self.data, "end_date": "2000-01-02"})
+        self.assertEqual(response.json()["message"], "No attendance records found for the selected criteria")
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_stalled_jobs_run_again_and_expired_jobs_are_purged(self):
+        job = ExportJob.objects.get(id=self.enqueue()["id"])
+        ExportJob.objects.filter(id=job.id).update(
+            status=ExportJob.RUNNING, updated_at=now() - datetime.timedelta(hours=1)
+        )
+        self.assertEqual(export_jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertTrue(export_jobs.export_storage().exists(job.file))
+
+        ExportJob.objects.filter(id=job.id).update(created_at=now() - datetime.timedelta(days=2))
+        self.assertEqual(export_jobs.purge_expired(), 1)
+        self.assertFalse(export_jobs.export_storage().exists(job.file))
+
+    @override_settings(EXPORT_JOB_WORKERS=1)
+    def test_jobs_go_to_the_worker_pool_after_commit(self):
+        with mock.patch.object(export_jobs, "_get_pool") as pool:
+            with self.captureOnCommitCallbacks() as callbacks:
+                job = self.enqueue()
+            pool.assert_not_called()
+            for callback in callbacks:
+                callback()
+        pool.return_value.submit.assert_called_once_with(export_jobs._run_in_thread, uuid.UUID(job["id"]))
+
+    @override_settings(EXPORT_JOB_WORKERS=1)
+    def test_every_stalled_job_goes_back_to_the_worker_pool(self):
+        with mock.patch.object(export_jobs, "_get_pool"):
+            stalled = [ExportJob.objects.get(id=self.enqueue(layout=layout)["id"]) for layout in ("rows", "matrix")]
+        ExportJob.objects.filter(id__in=[job.id for job in stalled]).update(
+            status=ExportJob.RUNNING, updated_at=now() - datetime.timedelta(hours=1)
+        )
+        with mock.patch.object(export_jobs, "_get_pool") as pool:
+            with self.captureOnCommitCallbacks(execute=True):
+                # A request for some other export still requeues both
+                self.enqueue(start_date="2000-01-02")
+        submitted = {call.args[1] for call in pool.return_value.submit.call_args_list}
+        self.assertTrue({job.id for job in stalled} <= submitted)
+        self.assertEqual(ExportJob.objects.filter(status=ExportJob.QUEUED).count(), 3)
@@ -10,7 +10,14 @@ urlpatterns = [
     path('get_user_details/', views.get_user_details, name="get_user_details"),
     path('logout_user/', views.logout_user, name="logout_user"),
     path('scan-attendance/', views.scan_attendance_qr, name="scan_attendance_qr"),
+    path('qr_image/<str:token>.<str:fmt>', views.qr_image, name="qr_image"),
+    path('export_job/<uuid:job_id>/', views.export_job_status, name="export_job_status"),
+    path('export_job/<uuid:job_id>/download/', views.export_job_download, name="export_job_download"),
     path('admin_home/', HodViews.admin_home, name="admin_home"),
+    path('admin_home_chart/<str:chart>/', HodViews.admin_home_chart, name="admin_home_chart"),
+    path('admin_attendance_trend/', HodViews.admin_attendance_trend, name="admin_attendance_trend"),
+    path('admin_export_attendance_data/', HodViews.admin_export_attendance_data, name="admin_export_attendance_data"),
+    path('admin_export_job/', HodViews.admin_export_job, name="admin_export_job"),
     path('add_staff/', HodViews.add_staff, name="add_staff"),
     path('add_staff_save/', HodViews.add_staff_save, name="add_staff_save"),
     path('manage_staff/', HodViews.manage_staff, name="manage_staff"),
@@ -51,8 +58,11 @@ urlpatterns = [
     path('admin_profile_update/', HodViews.admin_profile_update, name="admin_profile_update"),
 
     path('staff_home/', StaffViews.staff_home, name="staff_home"),
+    path('staff_home_chart/<str:chart>/', StaffViews.staff_home_chart, name="staff_home_chart"),
+    path('staff_attendance_trend/', StaffViews.staff_attendance_trend, name="staff_attendance_trend"),
     path("staff_take_attendance/", StaffViews.staff_take_attendance, name="staff_take_attendance"),
     path('get_students/', StaffViews.get_students, name="get_students"),
+    path('get_students_async/', StaffViews.get_students_async, name="get_students_async"),
     path('save_attendance_data/', StaffViews.save_attendance_data, name="save_attendance_data"),
     path('staff_update_attendance/', StaffViews.staff_update_attendance, name="staff_update_attendance"),
     path('get_attendance_dates/', StaffViews.get_attendance_dates, name="get_attendance_dates"),
@@ -60,6 +70,11 @@ urlpatterns = [
     path('update_attendance_data/', StaffViews.update_attendance_data, name="update_attendance_data"),
     path('staff_view_attendance/', StaffViews.staff_view_attendance, name="staff_view_attendance"),
     path("staff_generate_qr/", StaffViews.staff_generate_qr, name="staff_generate_qr"),
+    path("staff_generate_qr_batch/", StaffViews.staff_generate_qr_batch, name="staff_generate_qr_batch"),
+    path('staff_rotating_token/', StaffViews.staff_rotating_token, name="staff_rotating_token"),
+    path('staff_qr_progress/', StaffViews.staff_qr_progress, name="staff_qr_progress"),
+    path('staff_checkin_feed/', StaffViews.staff_checkin_feed, name="staff_checkin_feed"),
+    path('staff_qr_registry_stats/', StaffViews.staff_qr_registry_stats, name="staff_qr_registry_stats"),
     # Network info URL removed
     path('staff_profile/', StaffViews.staff_profile, name="staff_profile"),
     path('staff_profile_update/', StaffViews.staff_profile_update, name="staff_profile_update"),
@@ -69,19 +84,24 @@ urlpatterns = [
     path('staff_feedback/', StaffViews.staff_feedback, name="staff_feedback"),
     path('staff_export_attendance/', StaffViews.staff_export_attendance, name="staff_export_attendance"),
     path('staff_export_attendance_data/', StaffViews.staff_export_attendance_data, name="staff_export_attendance_data"),
+    path('staff_export_job/', StaffViews.staff_export_job, name="staff_export_job"),
     path('staff_import_attendance/', StaffViews.staff_import_attendance, name="staff_import_attendance"),
     path('staff_import_attendance_data/', StaffViews.staff_import_attendance_data, name="staff_import_attendance_data"),
     path('staff_download_import_template/', StaffViews.staff_download_import_template, name="staff_download_import_template"),
     path('delete_attendance/', StaffViews.delete_attendance, name="delete_attendance"),
 
     path('student_home/', StudentViews.student_home, name="student_home"),
+    path('student_home_chart/<str:chart>/', StudentViews.student_home_chart, name="student_home_chart"),
     path('student_view_attendance/', StudentViews.student_view_attendance, name="student_view_attendance"),
     path('student_view_attendance_post/', StudentViews.student_view_attendance_post, name="student_view_attendance_post"),
     path('student_upload_qr/', StudentViews.student_upload_qr, name="student_upload_qr"),
     path('student_scan_qr/', StudentViews.student_scan_qr, name="student_scan_qr"),
     path('student_process_qr_scan/', StudentViews.student_process_qr_scan, name="student_process_qr_scan"),
+    path('student_process_qr_scan_async/', StudentViews.student_process_qr_scan_async, name="student_process_qr_scan_async"),
+    path('student_checkin_status/', StudentViews.student_checkin_status, name="student_checkin_status"),
     path('student_export_attendance/', StudentViews.student_export_attendance, name="student_export_attendance"),
     path('student_export_attendance_data/', StudentViews.student_export_attendance_data, name="student_export_attendance_data"),
+    path('student_export_job/', StudentViews.student_export_job, name="student_export_job"),
     path('student_profile/', StudentViews.student_profile, name="student_profile"),
     path('student_profile_update/', StudentViews.student_profile_update, name="student_profile_update"),
     path('student_view_result/', StudentViews.student_view_result, name="student_view_result"),
@@ -1,5 +1,3 @@
-import math
-from geopy.distance import geodesic
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from django.http import HttpResponse
@@ -7,17 +5,24 @@ import os
 from datetime import datetime
 from django.conf import settings
 import tempfile
+from itertools import islice
 
-def calculate_distance(lat1, lon1, lat2, lon2, accuracy1=None, accuracy2=None):
+from . import attendance_export, export_formats, geofence, xlsx_stream
+
+def calculate_distance(lat1, lon1, lat2, lon2, accuracy1=None, accuracy2=None, radius=None):
     """
-    Calculate the distance between two geographic coordinates using geodesic distance.
+    Calculate the distance between two geographic coordinates.
     Returns distance in meters.
 
+    Uses the fast haversine path from geofence and only falls back to geopy's
+    geodesic when the result is too close to a decision threshold to trust.
+
     Parameters:
     - lat1, lon1: First point coordinates
     - lat2, lon2: Second point coordinates
     - accuracy1: Optional accuracy in meters for the first point
     - accuracy2: Optional accuracy in meters for the second point
+    - radius: Optional allowed radius the distance will be compared against
     """
     if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
         return {
@@ -27,23 +32,17 @@ def calculate_distance(lat1, lon1, lat2, lon2, accuracy1=None, accuracy2=None):
         }
 
     try:
-        # Use geopy's geodesic distance calculation (more accurate than manual calculation)
-        point1 = (float(lat1), float(lon1))
-        point2 = (float(lat2), float(lon2))
-
-        # Calculate distance in meters
-        distance = geodesic(point1, point2).meters
-
         # Calculate error margin based on provided accuracy values
-        error_margin = 0
-        if accuracy1 is not None:
-            error_margin += float(accuracy1)
-        if accuracy2 is not None:
-            error_margin += float(accuracy2)
+        # (defaults to 10 meters if no accuracy is provided)
+        error_margin = geofence.error_margin_for(accuracy1, accuracy2)
 
-        # If no accuracy provided, use a default error margin of 10 meters
-        if error_margin == 0:
-            error_margin = 10
+        # Distances near the reliability cut-off or the radius are re-checked
+        # with the exact geodesic so decisions match it
+        if radius is not None:
+            thresholds = geofence.decision_thresholds(error_margin, radius)
+        else:
+            thresholds = (2 * error_margin,)
+        distance = geofence.distance_between(lat1, lon1, lat2, lon2, thresholds=thresholds)
 
         # Determine if the measurement is reliable
         # A measurement is considered reliable if the error margin is less than 50% of the distance
@@ -79,7 +78,8 @@ def is_within_radius(student_lat, student_lon, teacher_lat, teacher_lon, radius,
     result = calculate_distance(
         student_lat, student_lon,
         teacher_lat, teacher_lon,
-        student_accuracy, teacher_accuracy
+        student_accuracy, teacher_accuracy,
+        radius=radius
     )
 
     # Get the distance from the result
@@ -219,23 +219,20 @@ def verify_network_connectivity(student_ip, teacher_ip, student_ssid=None, teach
 
     return verification_result
 
-def export_attendance_to_excel(attendance_data, subject_name=None, date_range=None, for_student=False):
+def export_attendance_to_excel(attendance_data, subject_name=None, date_range=None, for_student=False, progress=None):
     """
-    Generate Excel file from attendance data
+    Generate Excel file from attendance data, streamed as it is written
 
     Parameters:
     - attendance_data: QuerySet of AttendanceReport objects
     - subject_name: Optional subject name for the report title
     - date_range: Optional date range for the report title
     - for_student: Boolean indicating if this is a student's personal report
+    - progress: Optional callable given the number of reports written so far
 
     Returns:
-    - Path to the temporary Excel file
+    - Iterator of .xlsx bytes chunks for a StreamingHttpResponse
     """
-    # Create a new workbook and select the active worksheet
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-
     # Set the title of the worksheet
     title = "Attendance Report"
     if subject_name:
@@ -243,151 +240,112 @@ def export_attendance_to_excel(attendance_data, subject_name=None, date_range=No
     if date_range:
         title += f" ({date_range})"
 
-    worksheet.title = "Attendance Data"
-
     # Define styles
     header_font = Font(name='Arial', bold=True, size=12, color='FFFFFF')
     header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
     header_alignment = Alignment(horizontal='center', vertical='center')
 
-    # Only add title and info for student reports, not for teacher reports (import compatibility)
-    if for_student:
-        # Add title
-        worksheet.merge_cells('A1:F1')
-        title_cell = worksheet.cell(row=1, column=1)
-        title_cell.value = title
-        title_cell.font = Font(name='Arial', bold=True, size=14)
-        title_cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        # Add report generation info
-        worksheet.merge_cells('A2:F2')
-        gen_info_cell = worksheet.cell(row=2, column=1)
-        gen_info_cell.value = f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        gen_info_cell.font = Font(italic=True)
-        gen_info_cell.alignment = Alignment(horizontal='center')
-
     # Define headers based on report type
     if for_student:
         headers = ['Date', 'Subject', 'Status', 'Location Verified', 'Teacher']
-        # Add headers at row 4 for student reports (keep title and info)
-        for col_num, header in enumerate(headers, 1):
-            cell = worksheet.cell(row=4, column=col_num)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-        row_num = 5
     else:
         # Use exact column names expected by the import function - keep it simple for import compatibility
         headers = ['Student ID', 'Student Name', 'Date', 'Status']
+    header_row = [xlsx_stream.Styled(header, header_font, header_fill, header_alignment) for header in headers]
+
+    # Statistics labels come after the data, possibly past the rows measured for column widths
+    statistics_labels = [
+        ["Total Records:"], ["Present Count:"], ["Absent Count:"],
+        ["Location Verified Count:"], ["Location Verification Rate:"]
+    ]
+
+    def rows():
+        # Only add title and info for student reports, not for teacher reports (import compatibility)
+        if for_student:
+            yield [xlsx_stream.Styled(
+                title, Font(name='Arial', bold=True, size=14), alignment=Alignment(horizontal='center', vertical='center')
+            )]
+            yield [xlsx_stream.Styled(
+                f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                Font(italic=True), alignment=Alignment(horizontal='center')
+            )]
+            yield []
+        # Teacher reports start with the headers at row 1 (no title or merged cells)
+        yield header_row
 
-        # For import compatibility, start headers at row 1 (no title or merged cells)
-        # Add headers directly at row 1
-        for col_num, header in enumerate(headers, 1):
-            cell = worksheet.cell(row=1, column=col_num)
-            cell.value = header
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
-
-        # Add data rows starting from row 2
-        row_num = 2
-    present_count = 0
-    absent_count = 0
-    location_verified_count = 0
-
-    for record in attendance_data:
         if for_student:
             # Student's personal report
-            worksheet.cell(row=row_num, column=1).value = record.attendance_id.attendance_date.strftime('%Y-%m-%d')
-            worksheet.cell(row=row_num, column=2).value = record.attendance_id.subject_id.subject_name
-            status = "Present" if record.status else "Absent"
-            worksheet.cell(row=row_num, column=3).value = status
-            location_verified = "Yes" if hasattr(record, 'location_verified') and record.location_verified else "No"
-            worksheet.cell(row=row_num, column=4).value = location_verified
-            worksheet.cell(row=row_num, column=5).value = f"{record.attendance_id.subject_id.staff_id.admin.first_name} {record.attendance_id.subject_id.staff_id.admin.last_name}"
+            for record in attendance_export.student_rows(attendance_data, progress):
+                yield [
+                    record.attendance_date.strftime('%Y-%m-%d'),
+                    record.subject_name,
+                    "Present" if record.status else "Absent",
+                    "Yes" if record.location_verified else "No",
+                    f"{record.teacher_first_name} {record.teacher_last_name}",
+                ]
         else:
             # Teacher's report for all students - simplified for easy import
-            # Column 1: Student ID (username for import compatibility)
-            worksheet.cell(row=row_num, column=1).value = record.student_id.admin.username
-            # Column 2: Student Name (for reference only)
-            worksheet.cell(row=row_num, column=2).value = f"{record.student_id.admin.first_name} {record.student_id.admin.last_name}"
-            # Column 3: Date
-            worksheet.cell(row=row_num, column=3).value = record.attendance_id.attendance_date.strftime('%Y-%m-%d')
-            # Column 4: Status (Present/Absent)
-            status = "Present" if record.status else "Absent"
-            worksheet.cell(row=row_num, column=4).value = status
-
-        # Update statistics
-        if record.status:
-            present_count += 1
-        else:
-            absent_count += 1
-
-        if hasattr(record, 'location_verified') and record.location_verified:
-            location_verified_count += 1
-
-        row_num += 1
-
-    # Only add statistics for student reports, not for teacher reports (import compatibility)
-    if for_student:
-        # Add statistics section
-        row_num += 2  # Add some space
-
-        worksheet.cell(row=row_num, column=1).value = "Statistics"
-        worksheet.cell(row=row_num, column=1).font = Font(bold=True)
-
-        worksheet.cell(row=row_num+1, column=1).value = "Total Records:"
-        worksheet.cell(row=row_num+1, column=2).value = len(attendance_data)
-
-        worksheet.cell(row=row_num+2, column=1).value = "Present Count:"
-        worksheet.cell(row=row_num+2, column=2).value = present_count
+            # Student ID is the username for import compatibility; the name is for reference only
+            for record in attendance_export.staff_rows(attendance_data, progress):
+                yield [
+                    record.student_username,
+                    f"{record.student_first_name} {record.student_last_name}",
+                    record.attendance_date.strftime('%Y-%m-%d'),
+                    "Present" if record.status else "Absent",
+                ]
+
+        # Only add statistics for student reports, not for teacher reports (import compatibility)
+        if for_student:
+            stats = attendance_export.statistics(attendance_data)
+            # Add statistics section after some space
+            yield []
+            yield []
+            yield [xlsx_stream.Styled("Statistics", Font(bold=True))]
+            yield ["Total Records:", stats['total']]
+            yield ["Present Count:", stats['present']]
+            yield ["Absent Count:", stats['absent']]
+            yield ["Location Verified Count:", stats['location_verified']]
+
+            if stats['present'] > 0:
+                location_verification_rate = (stats['location_verified'] / stats['present']) * 100
+                yield ["Location Verification Rate:", f"{location_verification_rate:.2f}%"]
+
+    return xlsx_stream.stream_workbook(
+        rows(),
+        sheet_title="Attendance Data",
+        merged=["A1:F1", "A2:F2"] if for_student else (),
+        width_hints=statistics_labels if for_student else ()
+    )
 
-        worksheet.cell(row=row_num+3, column=1).value = "Absent Count:"
-        worksheet.cell(row=row_num+3, column=2).value = absent_count
+def export_attendance_matrix(attendance_data, fmt='xlsx'):
+    """
+    Generate the attendance grid: one row per student, one column per date
+    with P/A cells, and present/absent totals per student and per date
 
-        worksheet.cell(row=row_num+4, column=1).value = "Location Verified Count:"
-        worksheet.cell(row=row_num+4, column=2).value = location_verified_count
+    Parameters:
+    - attendance_data: QuerySet of AttendanceReport objects
+    - fmt: "xlsx" or "csv" (see export_formats.MATRIX_FORMATS)
 
-        if present_count > 0:
-            location_verification_rate = (location_verified_count / present_count) * 100
-            worksheet.cell(row=row_num+5, column=1).value = "Location Verification Rate:"
-            worksheet.cell(row=row_num+5, column=2).value = f"{location_verification_rate:.2f}%"
+    Returns:
+    - Iterator of bytes chunks for a StreamingHttpResponse
+    """
+    attendance = attendance_export.matrix(attendance_data)
+    grid_rows = attendance_export.matrix_rows(attendance)
+    if fmt == 'csv':
+        return export_formats.stream_csv(next(grid_rows), grid_rows)
 
-    # Auto-adjust column widths - Fixed to handle merged cells
-    for i, column in enumerate(worksheet.columns, 1):
-        length = 0
-        for cell in column:
-            try:
-                if cell.value:
-                    length = max(length, len(str(cell.value)))
-            except:
-                pass  # Skip cells that don't have a value attribute (like merged cells)
-
-        if length > 0:
-            # Get column letter safely using column index
-            column_letter = openpyxl.utils.get_column_letter(i)
-            # Setting width with a little buffer
-            worksheet.column_dimensions[column_letter].width = length + 2
+    header_font = Font(name='Arial', bold=True, size=12, color='FFFFFF')
+    header_fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+    header_alignment = Alignment(horizontal='center', vertical='center')
 
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx', prefix='attendance_export_') as tmp:
-        temp_filename = tmp.name
-        # Close the file handle before saving to avoid file access issues on Windows
+    def rows():
+        yield [xlsx_stream.Styled(value, header_font, header_fill, header_alignment) for value in next(grid_rows)]
+        yield from islice(grid_rows, len(attendance.students))
+        # Per-date totals
+        for row in grid_rows:
+            yield [xlsx_stream.Styled(row[0], Font(bold=True)), *row[1:]]
 
-    # Save workbook to the closed temp file
-    try:
-        workbook.save(temp_filename)
-    except Exception as e:
-        # If saving fails, make sure we clean up
-        if os.path.exists(temp_filename):
-            try:
-                os.unlink(temp_filename)
-            except:
-                pass
-        raise e
-
-    return temp_filename
+    return xlsx_stream.stream_workbook(rows(), sheet_title="Attendance Grid")
 
 def export_attendance_to_excel_new(attendance_reports, subject_name="", date_range="", for_student=False):
     """
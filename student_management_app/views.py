@@ -1,5 +1,5 @@
 from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import FileResponse, HttpResponseRedirect, HttpResponse, HttpResponseNotModified, Http404, JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.urls import reverse
@@ -7,6 +7,8 @@ from django.core.management import call_command
 from io import StringIO
 
 from student_management_app.EmailBackEnd import EmailBackEnd
+from student_management_app.models import AttendanceQRCode, ExportJob
+from student_management_app import export_formats, export_jobs, qr_registry, qr_render, signed_tokens
 
 
 def home(request):
@@ -174,3 +176,58 @@ def setup_database_endpoint(request):
             """)
 
 
+def qr_image(request, token, fmt):
+    """
+    Render the QR code for a token on request, as PNG or SVG.
+
+    The image for a token never changes, so it is served with a strong ETag
+    and immutable cache headers, and recent renders are kept in memory.
+    """
+    if fmt not in qr_render.FORMATS:
+        raise Http404("Unknown QR image format")
+
+    # Checked before the ETag, so a revoked token is not revalidated from a cached copy
+    if signed_tokens.is_signed(token):
+        # Rotating tokens are checked by signature alone
+        if signed_tokens.verify(token) is None:
+            raise Http404("Unknown QR token")
+    elif qr_registry.lookup(token) is None and not AttendanceQRCode.objects.filter(token=token).exists():
+        raise Http404("Unknown QR token")
+
+    data = qr_render.scan_url(request, token)
+    etag = qr_render.etag(data, fmt)
+    cache_control = "private, max-age=31536000, immutable"
+    if etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = cache_control
+        return response
+
+    response = HttpResponse(qr_render.render(data, fmt), content_type=qr_render.FORMATS[fmt])
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
+
+
+def _export_job(request, job_id):
+    job = ExportJob.objects.filter(id=job_id).first()
+    if job is None or not export_jobs.can_access(request.user, job):
+        raise Http404("Unknown export job")
+    return job
+
+
+def export_job_status(request, job_id):
+    """Progress of a background export (see export_jobs), for any role's export page to poll."""
+    return JsonResponse({"status": "success", "job": export_jobs.describe(_export_job(request, job_id))})
+
+
+def export_job_download(request, job_id):
+    """The finished file of a background export."""
+    job = _export_job(request, job_id)
+    storage = export_jobs.export_storage()
+    if job.status != ExportJob.DONE or not storage.exists(job.file):
+        raise Http404("Export is not ready")
+    return FileResponse(
+        storage.open(job.file), as_attachment=True, filename=job.filename,
+        content_type=export_formats.FORMATS[job.format][0]
+    )
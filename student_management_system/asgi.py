@@ -5,6 +5,9 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+
+Served next to the WSGI app with:
+gunicorn student_management_system.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
@@ -12,5 +15,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_management_system.settings')
+# Persistent connections are tied to a thread, and async views hop between threads
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
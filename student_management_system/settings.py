@@ -78,7 +78,7 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 if DATABASE_URL:
     # Production: Use PostgreSQL
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)
+        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)))
     }
     print("Using PostgreSQL database from DATABASE_URL")
 
@@ -147,6 +147,68 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Write-behind check-in: accepted scans are journalled to local disk and
+# inserted in batches. Each web process needs its own CHECKIN_JOURNAL_DIR (the
+# journal locks it). Replay leftovers with: python manage.py replay_checkin_journal
+CHECKIN_WRITE_BEHIND = os.environ.get('CHECKIN_WRITE_BEHIND', 'False').lower() == 'true'
+CHECKIN_JOURNAL_DIR = os.environ.get('CHECKIN_JOURNAL_DIR', os.path.join(BASE_DIR, 'checkin_journal'))
+CHECKIN_BATCH_SIZE = int(os.environ.get('CHECKIN_BATCH_SIZE', 100))
+CHECKIN_BATCH_MAX_AGE = float(os.environ.get('CHECKIN_BATCH_MAX_AGE', 2.0))  # seconds
+CHECKIN_JOURNAL_FSYNC = os.environ.get('CHECKIN_JOURNAL_FSYNC', 'True').lower() == 'true'
+
+# Background exports: files are built into EXPORT_JOB_DIR (not served as
+# media) by EXPORT_JOB_WORKERS threads per process. Set it to 0 to leave
+# jobs to: python manage.py run_export_jobs --loop
+# Finished files are reused for identical requests until the data changes
+# or EXPORT_JOB_TTL passes; a running job with no progress for
+# EXPORT_JOB_STALE_SECONDS is assumed lost and run again.
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR', os.path.join(BASE_DIR, 'exports'))
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 1))
+EXPORT_JOB_TTL = int(os.environ.get('EXPORT_JOB_TTL', 24 * 3600))  # seconds
+EXPORT_JOB_STALE_SECONDS = int(os.environ.get('EXPORT_JOB_STALE_SECONDS', 300))
+
+# Cache for the QR registry, enrolment snapshots and attendance session ids.
+# The default is per process; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# cache (e.g. django.core.cache.backends.redis.RedisCache) so the
+# prepare_class_sessions command warms every web worker.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Home dashboards are served from per-user snapshots, invalidated when
+# attendance or enrolment changes. An invalidated snapshot is still served
+# (and rebuilt in the background) for DASHBOARD_STALE_SECONDS after the
+# change that invalidated it.
+DASHBOARD_CACHE = os.environ.get('DASHBOARD_CACHE', 'True').lower() == 'true'
+DASHBOARD_SNAPSHOT_TTL = int(os.environ.get('DASHBOARD_SNAPSHOT_TTL', 600))  # seconds
+DASHBOARD_STALE_SECONDS = float(os.environ.get('DASHBOARD_STALE_SECONDS', 15))
+
+# Uploaded QR photos are decoded in a small process pool with a per-image
+# time budget. Set QR_DECODE_WORKERS to 0 to decode in the request process.
+QR_DECODE_WORKERS = int(os.environ.get('QR_DECODE_WORKERS', 2))
+QR_DECODE_TIMEOUT = float(os.environ.get('QR_DECODE_TIMEOUT', 3.0))  # seconds
+
+# Printable timetable sheets are rendered in their own process pool; set
+# QR_SHEET_WORKERS to 0 to render in the request process.
+QR_SHEET_WORKERS = int(os.environ.get('QR_SHEET_WORKERS', 2))
+
+# Live check-in feed. Under ASGI each server-sent-events connection stays open
+# this long; under WSGI it returns at once and the browser retries after
+# CHECKIN_FEED_RETRY_MS, so no worker is held by a watching teacher.
+CHECKIN_FEED_STREAM_SECONDS = float(os.environ.get('CHECKIN_FEED_STREAM_SECONDS', 25))
+CHECKIN_FEED_RETRY_MS = int(os.environ.get('CHECKIN_FEED_RETRY_MS', 3000))
+# Feed channels live in the cache; an open stream checks it this often for
+# check-ins accepted by another server process
+CHECKIN_FEED_POLL_SECONDS = float(os.environ.get('CHECKIN_FEED_POLL_SECONDS', 1.0))
+
+# Rotating QR codes are re-signed every QR_ROTATION_SECONDS; a scanned token
+# stays valid for this many earlier windows to allow for scanning delays.
+QR_ROTATION_SECONDS = int(os.environ.get('QR_ROTATION_SECONDS', 15))
+QR_ROTATION_GRACE_WINDOWS = int(os.environ.get('QR_ROTATION_GRACE_WINDOWS', 1))
+
 # Production static files settings
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
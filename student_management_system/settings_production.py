@@ -1,5 +1,6 @@
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from .settings import *
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -10,7 +11,7 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 
 if DATABASE_URL and 'postgres' in DATABASE_URL:
     DATABASES = {
-        'default': dj_database_url.config(default=DATABASE_URL, conn_max_age=600)
+        'default': dj_database_url.config(default=DATABASE_URL, conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', 600)))
     }
     print("Using PostgreSQL database for production")
 else:
@@ -34,6 +35,20 @@ ALLOWED_HOSTS = [
     'student-attendance-system.onrender.com',
     'my-pr-project-ztyg.onrender.com'
 ]
+if RENDER_EXTERNAL_HOSTNAME:
+    ALLOWED_HOSTS.append(RENDER_EXTERNAL_HOSTNAME)
+
+# QR deactivation, idempotency replays, dashboard versions, the check-in feed's
+# channels (event history and ids) and journalled check-in dedup all go
+# through the cache. Where more than one
+# server process handles requests (e.g. the WSGI and ASGI services on Render)
+# it must be shared, or each process acts on its own stale copy.
+REQUIRE_SHARED_CACHE = os.environ.get('REQUIRE_SHARED_CACHE', 'False').lower() == 'true'
+if REQUIRE_SHARED_CACHE and CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    raise ImproperlyConfigured(
+        "REQUIRE_SHARED_CACHE is set but CACHE_BACKEND is per process; "
+        "point CACHE_BACKEND/CACHE_LOCATION at a shared cache such as Redis"
+    )
 
 # Enable WhiteNoise for static files
 MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')